@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+from typing import Dict, Any, Optional, Tuple
+
+from starlette.formparsers import MultiPartParser
+
+# Request bodies of the import endpoints above this size are refused with 413
+MAX_UPLOAD_BYTES = int(os.environ.get("TAMS_MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+# Uploaded files above this size are spooled to a temporary file (in TMPDIR) instead of RAM
+UPLOAD_SPOOL_BYTES = int(os.environ.get("TAMS_UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+# Imports running at once, how many more may wait for a slot, and for how long
+MAX_CONCURRENT_IMPORTS = int(os.environ.get("TAMS_MAX_CONCURRENT_IMPORTS", "4"))
+IMPORT_QUEUE_SIZE = int(os.environ.get("TAMS_IMPORT_QUEUE_SIZE", "8"))
+IMPORT_QUEUE_TIMEOUT = float(os.environ.get("TAMS_IMPORT_QUEUE_TIMEOUT", "10"))
+IMPORT_RETRY_AFTER = int(os.environ.get("TAMS_IMPORT_RETRY_AFTER", "5"))
+
+# Endpoints that take whole batches (or resume an import), and the subset whose body size
+# is capped (/store/stream is read incrementally, so its size is not limited)
+IMPORT_PATHS = ("/store/batch", "/store/stream", "/store/file/", "/predict/batch", "/predict/file", "/imports/")
+SIZE_LIMITED_PATHS = ("/store/batch", "/store/file/", "/predict/batch", "/predict/file")
+
+MultiPartParser.max_file_size = UPLOAD_SPOOL_BYTES
+
+class _BodyTooLarge(Exception):
+    pass
+
+class ImportGate:
+    """Bounded concurrency for imports, with a short queue in front of it"""
+
+    def __init__(self):
+        self._slots = None
+        self._active = 0
+        self._waiting = 0
+
+        # Admission statistics
+        self._admitted = 0
+        self._queued = 0
+        self._rejected_busy = 0
+        self._rejected_timeout = 0
+        self._rejected_too_large = 0
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(MAX_CONCURRENT_IMPORTS)
+        return self._slots
+
+    async def acquire(self) -> Optional[Tuple[int, str]]:
+        """Take an import slot, or return the status code and reason for refusing"""
+        if self.slots.locked():
+            if self._waiting >= IMPORT_QUEUE_SIZE:
+                self._rejected_busy += 1
+                return 429, "Too many imports in progress"
+            self._queued += 1
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), timeout=IMPORT_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._rejected_timeout += 1
+                return 503, "Timed out waiting for an import slot"
+            finally:
+                self._waiting -= 1
+        else:
+            await self.slots.acquire()
+        self._admitted += 1
+        self._active += 1
+        return None
+
+    def release(self) -> None:
+        self._active -= 1
+        self.slots.release()
+
+    def record_too_large(self) -> None:
+        self._rejected_too_large += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Gate configuration, current load and refusals"""
+        return {
+            "max_concurrent_imports": MAX_CONCURRENT_IMPORTS,
+            "queue_size": IMPORT_QUEUE_SIZE,
+            "queue_timeout_seconds": IMPORT_QUEUE_TIMEOUT,
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "upload_spool_bytes": UPLOAD_SPOOL_BYTES,
+            "active": self._active,
+            "waiting": self._waiting,
+            "admitted": self._admitted,
+            "queued": self._queued,
+            "rejected_busy": self._rejected_busy,
+            "rejected_timeout": self._rejected_timeout,
+            "rejected_too_large": self._rejected_too_large,
+        }
+
+class AdmissionMiddleware:
+    """Admission control in front of the import endpoints
+
+    Imports hold whole files and batches in memory while they are scored, so only
+    MAX_CONCURRENT_IMPORTS run at once. Up to IMPORT_QUEUE_SIZE more wait for a slot;
+    beyond that a request is refused with 429 straight away, and one that waited more
+    than IMPORT_QUEUE_TIMEOUT gets 503. Both carry Retry-After. Bodies larger than
+    MAX_UPLOAD_BYTES are refused with 413, from Content-Length when it is sent and
+    otherwise as soon as that many bytes have been received.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(IMPORT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        size_limited = scope["path"].startswith(SIZE_LIMITED_PATHS)
+        if size_limited:
+            content_length = dict(scope.get("headers", [])).get(b"content-length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+                import_gate.record_too_large()
+                await self._refuse(send, 413, f"Request body exceeds {MAX_UPLOAD_BYTES} bytes")
+                return
+
+        refusal = await import_gate.acquire()
+        if refusal is not None:
+            await self._refuse(send, *refusal, retry_after=IMPORT_RETRY_AFTER)
+            return
+        try:
+            if size_limited:
+                await self._call_with_size_limit(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            import_gate.release()
+
+    async def _call_with_size_limit(self, scope, receive, send):
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def counting_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Once the limit is hit, whatever the app answers is replaced by our 413
+            if too_large:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if too_large and not response_started:
+            import_gate.record_too_large()
+            await self._refuse(send, 413, f"Request body exceeds {MAX_UPLOAD_BYTES} bytes")
+
+    async def _refuse(self, send, status_code: int, detail: str, retry_after: int = None):
+        body = json.dumps({"detail": detail}).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode()))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+# Global instance
+import_gate = ImportGate()
@@ -0,0 +1,345 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+AGGREGATES_DB_PATH = os.environ.get(
+    "TAMS_AGGREGATES_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "aggregates.sqlite3")
+)
+AGGREGATES_PERSIST_INTERVAL = float(os.environ.get("TAMS_AGGREGATES_PERSIST_INTERVAL", "30"))
+# Rebuild from the anomalies table on startup: "auto" when nothing was persisted yet, or always/never
+AGGREGATES_REBUILD_ON_STARTUP = os.environ.get("TAMS_AGGREGATES_REBUILD_ON_STARTUP", "auto").lower()
+AGGREGATES_REBUILD_PAGE_SIZE = int(os.environ.get("TAMS_AGGREGATES_REBUILD_PAGE_SIZE", "5000"))
+# Criticality from which an anomaly counts as high; the dashboard shows above 9 as critical
+HIGH_CRITICALITY_LEVEL = int(os.environ.get("TAMS_HIGH_CRITICALITY_LEVEL", "10"))
+
+DIMENSIONS = ("system_id", "equipement_id", "service")
+SCORE_FIELDS = (
+    "ai_fiabilite_integrite_score", "ai_disponibilite_score", "ai_process_safety_score", "ai_criticality_level"
+)
+# Histogram bins are indexed by score value; bin 0 holds missing or out-of-range scores
+_BINS = 16
+_CRITICALITY = SCORE_FIELDS.index("ai_criticality_level")
+# A rebuild that has not finished after this long is considered abandoned
+_REBUILD_LEASE_SECONDS = 3600
+
+def _histograms(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Score histograms of stored anomaly rows, per dimension and key
+
+    Each histogram is a (len(SCORE_FIELDS), _BINS) count array.
+    """
+    if not rows:
+        return {dimension: {} for dimension in DIMENSIONS}
+    frame = pd.DataFrame(rows, columns=list(DIMENSIONS + SCORE_FIELDS))
+    scores = frame[list(SCORE_FIELDS)].apply(pd.to_numeric, errors='coerce').to_numpy()
+    scores = np.where((scores >= 1) & (scores < _BINS), scores, 0).astype(np.int64)
+    fields = np.arange(len(SCORE_FIELDS))[None, :]
+
+    result = {}
+    for dimension in DIMENSIONS:
+        keys = frame[dimension].fillna('').astype(str).str.strip()
+        codes, uniques = pd.factorize(keys)
+        counts = np.zeros((len(uniques), len(SCORE_FIELDS), _BINS), dtype=np.int64)
+        np.add.at(counts, (codes[:, None], fields, scores), 1)
+        result[dimension] = dict(zip(uniques, counts))
+    return result
+
+def _merge(into: Dict[str, Dict[str, np.ndarray]], histograms: Dict[str, Dict[str, np.ndarray]]) -> None:
+    for dimension, groups in histograms.items():
+        target = into.setdefault(dimension, {})
+        for key, counts in groups.items():
+            if key in target:
+                target[key] = target[key] + counts
+            else:
+                target[key] = counts.copy()
+
+class CriticalityAggregates:
+    """Running criticality counts per system, equipment and service
+
+    Stored anomalies are added as they go through the API, so the dashboard statistics are
+    served from memory instead of scanning the anomalies table. Each process keeps the totals
+    last read from a shared SQLite store plus what it recorded since. Every
+    AGGREGATES_PERSIST_INTERVAL the pending counts are added to the store and the totals
+    re-read, so several workers converge on the same figures within that interval.
+
+    The store can be rebuilt from the anomalies table. Anomalies pending in this process
+    are excluded from the scan and stay pending, so they count once; those stored by other
+    workers while the rebuild runs may be counted twice.
+    """
+
+    def __init__(self, db_path: str = AGGREGATES_DB_PATH):
+        self.db_path = db_path
+        self._connection = None
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, np.ndarray]] = {dimension: {} for dimension in DIMENSIONS}
+        self._pending: Dict[str, Dict[str, np.ndarray]] = {dimension: {} for dimension in DIMENSIONS}
+        # IDs of the pending anomalies, so a rebuild does not count them twice
+        self._pending_ids: set = set()
+        self._pending_rows = 0
+        self._loaded = False
+        self._rebuilding = False
+        self._task: Optional[asyncio.Task] = None
+
+        self._persisted_at: Optional[float] = None
+        self._rebuilt_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+    def _open(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS criticality_counts (
+                    dimension TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (dimension, key, field, value)
+                )"""
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL)")
+            self._connection = connection
+        return self._connection
+
+    def _meta(self, name: str) -> Optional[float]:
+        row = self._open().execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _read_totals(self) -> Dict[str, Dict[str, np.ndarray]]:
+        totals = {dimension: {} for dimension in DIMENSIONS}
+        rows = self._open().execute("SELECT dimension, key, field, value, count FROM criticality_counts").fetchall()
+        field_index = {field: index for index, field in enumerate(SCORE_FIELDS)}
+        for dimension, key, field, value, count in rows:
+            if dimension not in totals or field not in field_index or not 0 <= value < _BINS:
+                continue
+            counts = totals[dimension].get(key)
+            if counts is None:
+                counts = totals[dimension][key] = np.zeros((len(SCORE_FIELDS), _BINS), dtype=np.int64)
+            counts[field_index[field], value] = count
+        return totals
+
+    @staticmethod
+    def _count_rows(histograms: Dict[str, Dict[str, np.ndarray]]) -> List[tuple]:
+        return [
+            (dimension, key, field, int(value), int(counts[index, value]))
+            for dimension, groups in histograms.items()
+            for key, counts in groups.items()
+            for index, field in enumerate(SCORE_FIELDS)
+            for value in np.flatnonzero(counts[index])
+        ]
+
+    def load(self) -> None:
+        """Read the persisted totals; recording works before this, stats are empty until then"""
+        with self._lock:
+            totals = self._read_totals()
+            self._persisted_at = self._meta("persisted_at")
+            self._rebuilt_at = self._meta("rebuilt_at")
+            self._totals = totals
+            self._loaded = True
+        print(f"Criticality aggregates loaded {sum(len(groups) for groups in totals.values())} groups from {self.db_path}")
+
+    def record(self, stored_anomalies: List[Dict[str, Any]]) -> None:
+        """Add stored anomaly rows (with their scores and, ideally, their IDs)"""
+        if not stored_anomalies:
+            return
+        histograms = _histograms(stored_anomalies)
+        with self._lock:
+            _merge(self._pending, histograms)
+            self._pending_rows += len(stored_anomalies)
+            self._pending_ids.update(row['id'] for row in stored_anomalies if row.get('id'))
+
+    def persist(self) -> int:
+        """Add the pending counts to the shared store and re-read the totals
+
+        Returns the number of anomalies persisted. Skipped while a rebuild runs, since the
+        rebuild replaces the store and keeps these counts pending.
+        """
+        with self._lock:
+            if self._rebuilding:
+                return 0
+            pending, pending_rows, pending_ids = self._pending, self._pending_rows, self._pending_ids
+            self._pending = {dimension: {} for dimension in DIMENSIONS}
+            self._pending_rows = 0
+            self._pending_ids = set()
+        try:
+            connection = self._open()
+            with connection:
+                connection.executemany(
+                    """INSERT INTO criticality_counts (dimension, key, field, value, count) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (dimension, key, field, value) DO UPDATE SET count = count + excluded.count""",
+                    self._count_rows(pending)
+                )
+                if pending_rows:
+                    connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('persisted_at', ?)", (time.time(),))
+            totals = self._read_totals()
+        except Exception:
+            # Keep the counts for the next attempt
+            with self._lock:
+                _merge(self._pending, pending)
+                self._pending_rows += pending_rows
+                self._pending_ids |= pending_ids
+            raise
+        with self._lock:
+            self._totals = totals
+            self._loaded = True
+            self._persisted_at = self._meta("persisted_at")
+            self._rebuilt_at = self._meta("rebuilt_at")
+        return pending_rows
+
+    def _claim_rebuild(self, force: bool) -> bool:
+        """Elect one process to rebuild: the first to claim an expired or absent lease"""
+        connection = self._open()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            started = self._meta("rebuild_started_at")
+            if started is not None and time.time() - started < _REBUILD_LEASE_SECONDS:
+                return False
+            if not force and (self._meta("rebuilt_at") is not None or self._meta("persisted_at") is not None):
+                return False
+            connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rebuild_started_at', ?)", (time.time(),))
+        return True
+
+    async def rebuild(self, force: bool = True) -> Optional[int]:
+        """Recount the anomalies table into the store; returns the rows scanned, or None if skipped"""
+        from database import supabase_client
+
+        if not await asyncio.to_thread(self._claim_rebuild, force):
+            return None
+        with self._lock:
+            self._rebuilding = True
+        started = time.perf_counter()
+        scanned = 0
+        fresh = {dimension: {} for dimension in DIMENSIONS}
+        try:
+            after_id = None
+            while True:
+                page = await supabase_client.select_page(
+                    'anomalies', ['id', *DIMENSIONS, *SCORE_FIELDS], after_id, AGGREGATES_REBUILD_PAGE_SIZE
+                )
+                if not page:
+                    break
+                after_id = page[-1]['id']
+                scanned += len(page)
+                with self._lock:
+                    counted = [row for row in page if row['id'] not in self._pending_ids]
+                _merge(fresh, _histograms(counted))
+                if len(page) < AGGREGATES_REBUILD_PAGE_SIZE:
+                    break
+            await asyncio.to_thread(self._replace, fresh)
+            print(f"Criticality aggregates rebuilt from {scanned} anomalies in {time.perf_counter() - started:.1f}s")
+            return scanned
+        except Exception as e:
+            self._last_error = f"rebuild: {str(e)}"
+            print(f"Warning: criticality aggregates rebuild failed: {str(e)}")
+            await asyncio.to_thread(self._release_rebuild)
+            raise
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _replace(self, histograms: Dict[str, Dict[str, np.ndarray]]) -> None:
+        connection = self._open()
+        with connection:
+            connection.execute("DELETE FROM criticality_counts")
+            connection.executemany(
+                "INSERT INTO criticality_counts (dimension, key, field, value, count) VALUES (?, ?, ?, ?, ?)",
+                self._count_rows(histograms)
+            )
+            connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rebuilt_at', ?)", (time.time(),))
+            connection.execute("DELETE FROM meta WHERE name = 'rebuild_started_at'")
+        totals = self._read_totals()
+        with self._lock:
+            self._totals = totals
+            self._loaded = True
+            self._rebuilt_at = self._meta("rebuilt_at")
+
+    def _release_rebuild(self) -> None:
+        with self._open() as connection:
+            connection.execute("DELETE FROM meta WHERE name = 'rebuild_started_at'")
+
+    async def _persist_loop(self) -> None:
+        while True:
+            await asyncio.sleep(AGGREGATES_PERSIST_INTERVAL)
+            try:
+                await asyncio.to_thread(self.persist)
+            except Exception as e:
+                self._last_error = f"persist: {str(e)}"
+                print(f"Warning: persisting criticality aggregates failed: {str(e)}")
+
+    async def _start_up(self) -> None:
+        await asyncio.to_thread(self.load)
+        if AGGREGATES_REBUILD_ON_STARTUP in ("auto", "always"):
+            try:
+                await self.rebuild(force=AGGREGATES_REBUILD_ON_STARTUP == "always")
+            except Exception:
+                pass
+        await self._persist_loop()
+
+    def start(self) -> None:
+        """Load the persisted totals, rebuild if configured and persist periodically in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._start_up())
+
+    async def stop(self) -> None:
+        """Stop the background task and persist what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.to_thread(self.persist)
+        except Exception as e:
+            print(f"Warning: final persist of criticality aggregates failed: {str(e)}")
+
+    @staticmethod
+    def _summary(counts: np.ndarray) -> Dict[str, Any]:
+        criticality = counts[_CRITICALITY]
+        return {
+            "count": int(criticality.sum()),
+            "high_criticality": int(criticality[HIGH_CRITICALITY_LEVEL:].sum()),
+            **{
+                field: {str(value): int(counts[index, value]) for value in np.flatnonzero(counts[index]) if value}
+                for index, field in enumerate(SCORE_FIELDS)
+            },
+        }
+
+    def stats(self, dimension: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Counts, score histograms and high-criticality counts per system, equipment and service
+
+        Groups are sorted by count, and cut to the first ``limit`` when given.
+        """
+        with self._lock:
+            merged = {name: dict(groups) for name, groups in self._totals.items()}
+            _merge(merged, self._pending)
+            pending_rows = self._pending_rows
+            rebuilding = self._rebuilding
+
+        overall = sum(merged[DIMENSIONS[0]].values(), np.zeros((len(SCORE_FIELDS), _BINS), dtype=np.int64))
+        result = {
+            "loaded": self._loaded,
+            "rebuilding": rebuilding,
+            "high_criticality_level": HIGH_CRITICALITY_LEVEL,
+            "pending": pending_rows,
+            "persisted_at": self._persisted_at,
+            "rebuilt_at": self._rebuilt_at,
+            "last_error": self._last_error,
+            "overall": self._summary(overall),
+        }
+        for name in ([dimension] if dimension else DIMENSIONS):
+            groups = sorted(merged[name].items(), key=lambda item: int(item[1][_CRITICALITY].sum()), reverse=True)
+            result[name] = {key: self._summary(counts) for key, counts in groups[:limit]}
+        return result
+
+# Global instance
+criticality_aggregates = CriticalityAggregates()
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from scheduler import SCHED_BULK_SLICE_ROWS
+
+AUTOTUNE_ENABLED = os.environ.get("TAMS_AUTOTUNE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Bounds of the bulk prediction slices. A single request may wait behind one slice, so the
+# latency bound is also the longest that wait should get.
+AUTOTUNE_PREDICT_MIN_ROWS = int(os.environ.get("TAMS_AUTOTUNE_PREDICT_MIN_ROWS", "200"))
+AUTOTUNE_PREDICT_MAX_ROWS = int(os.environ.get("TAMS_AUTOTUNE_PREDICT_MAX_ROWS", "20000"))
+AUTOTUNE_PREDICT_MAX_LATENCY_MS = float(os.environ.get("TAMS_AUTOTUNE_PREDICT_MAX_LATENCY_MS", "250"))
+AUTOTUNE_PREDICT_MAX_MB = float(os.environ.get("TAMS_AUTOTUNE_PREDICT_MAX_MB", "64"))
+# Bounds of the chunked database inserts (memory is the request body)
+AUTOTUNE_INSERT_MIN_ROWS = int(os.environ.get("TAMS_AUTOTUNE_INSERT_MIN_ROWS", "100"))
+AUTOTUNE_INSERT_MAX_ROWS = int(os.environ.get("TAMS_AUTOTUNE_INSERT_MAX_ROWS", "10000"))
+AUTOTUNE_INSERT_MAX_LATENCY_MS = float(os.environ.get("TAMS_AUTOTUNE_INSERT_MAX_LATENCY_MS", "5000"))
+AUTOTUNE_INSERT_MAX_MB = float(os.environ.get("TAMS_AUTOTUNE_INSERT_MAX_MB", "16"))
+# Full-size units measured at one size before moving, and the factor between sizes
+AUTOTUNE_WINDOW = int(os.environ.get("TAMS_AUTOTUNE_WINDOW", "3"))
+AUTOTUNE_STEP = float(os.environ.get("TAMS_AUTOTUNE_STEP", "1.5"))
+
+# Throughput gains within this fraction are noise, not a reason to keep moving
+_TOLERANCE = 0.05
+# Weight of the latest unit in the recent throughput and latency
+_EWMA = 0.2
+
+class BatchSizeTuner:
+    """Rows per unit of a pipeline stage, adjusted from the throughput it observes
+
+    Hill climbing: once AUTOTUNE_WINDOW full-size units have run at a size, the size
+    moves one AUTOTUNE_STEP further in the same direction if throughput (rows/s) clearly
+    improved on the previous size, and turns back if it did not, so it settles around the
+    best size and keeps probing next to it as conditions change. It does not grow past
+    what the latency bound allows at the latency observed, and a unit slower than the
+    bound shrinks the size straight away, in proportion. The memory bound caps the size
+    for the row width at hand. With autotuning off, the initial size is used as it is.
+    """
+
+    def __init__(self, name: str, initial: int, min_rows: int, max_rows: int,
+                 max_latency_ms: float, max_mb: float, enabled: bool = AUTOTUNE_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.min_rows = max(1, min_rows)
+        self.max_rows = max(self.min_rows, max_rows)
+        self.max_latency = max_latency_ms / 1000
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._size = self._clamp(initial) if enabled else max(1, initial)
+        self._direction = 1
+        self._previous_throughput: Optional[float] = None
+        self._window_rows = 0
+        self._window_seconds = 0.0
+        self._window_units = 0
+        self._row_bytes: Optional[float] = None
+
+        # Statistics
+        self._units = 0
+        self._rows = 0
+        self._seconds = 0.0
+        self._recent_throughput = 0.0
+        self._recent_latency = 0.0
+        self._max_latency_seen = 0.0
+        self._adjustments = {"grow": 0, "shrink": 0, "latency": 0, "memory": 0}
+        self._last_change: Optional[Dict[str, Any]] = None
+
+    def _clamp(self, size: float) -> int:
+        return max(self.min_rows, min(self.max_rows, int(size)))
+
+    def _resize(self, size: int, reason: str) -> None:
+        self._adjustments[reason] += 1
+        self._last_change = {"from": self._size, "to": size, "reason": reason, "at": time.time()}
+        self._size = size
+        self._window_rows = 0
+        self._window_seconds = 0.0
+        self._window_units = 0
+
+    def size(self, row_bytes: Optional[float] = None) -> int:
+        """Rows for the next unit, whose rows take about ``row_bytes`` each"""
+        with self._lock:
+            if not self.enabled:
+                return self._size
+            if row_bytes:
+                self._row_bytes = row_bytes
+                fits = self._clamp(self.max_bytes // row_bytes)
+                if fits < self._size:
+                    self._resize(fits, "memory")
+                    self._direction = -1
+            return self._size
+
+    def record(self, rows: int, seconds: float, requested: int) -> None:
+        """Account for a unit of ``rows`` done in ``seconds``, out of ``requested`` rows asked for"""
+        if rows <= 0:
+            return
+        with self._lock:
+            self._units += 1
+            self._rows += rows
+            self._seconds += seconds
+            throughput = rows / seconds if seconds > 0 else 0.0
+            self._recent_throughput += _EWMA * (throughput - self._recent_throughput) if self._units > 1 else throughput
+            self._recent_latency += _EWMA * (seconds - self._recent_latency) if self._units > 1 else seconds
+            self._max_latency_seen = max(self._max_latency_seen, seconds)
+            if not self.enabled:
+                return
+
+            if seconds > self.max_latency and self._size > self.min_rows:
+                # Shrink to what would have fitted in the bound, with some margin
+                self._resize(self._clamp(min(self._size, rows) * self.max_latency / seconds * 0.8), "latency")
+                self._direction = -1
+                self._previous_throughput = None
+                return
+            # The last unit of a batch is short, and units sized before a change say nothing about this size
+            if rows < requested or requested != self._size:
+                return
+
+            self._window_rows += rows
+            self._window_seconds += seconds
+            self._window_units += 1
+            if self._window_units < AUTOTUNE_WINDOW or self._window_seconds <= 0:
+                return
+            throughput = self._window_rows / self._window_seconds
+            latency = self._window_seconds / self._window_units
+            if self._previous_throughput is not None and throughput <= self._previous_throughput * (1 + _TOLERANCE):
+                self._direction = -self._direction
+            self._previous_throughput = throughput
+            if self._direction > 0 and latency * AUTOTUNE_STEP > self.max_latency:
+                # Growing would break the latency bound
+                self._direction = -1
+                self._window_rows, self._window_seconds, self._window_units = 0, 0.0, 0
+                return
+            target = self._clamp(self._size * AUTOTUNE_STEP if self._direction > 0 else self._size / AUTOTUNE_STEP)
+            if target == self._size:
+                # At a bound: try the other way next time
+                self._direction = -self._direction
+                self._window_rows, self._window_seconds, self._window_units = 0, 0.0, 0
+                return
+            self._resize(target, "grow" if target > self._size else "shrink")
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size and bounds, observed throughput and latency, and the adjustments made"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": self._size,
+                "min_rows": self.min_rows,
+                "max_rows": self.max_rows,
+                "max_latency_ms": self.max_latency * 1000,
+                "max_mb": self.max_bytes / 1024 / 1024,
+                "row_bytes": round(self._row_bytes, 1) if self._row_bytes else None,
+                "units": self._units,
+                "rows": self._rows,
+                "avg_rows_per_second": round(self._rows / self._seconds, 1) if self._seconds else 0.0,
+                "recent_rows_per_second": round(self._recent_throughput, 1),
+                "recent_latency_ms": round(self._recent_latency * 1000, 2),
+                "max_latency_ms_seen": round(self._max_latency_seen * 1000, 2),
+                "adjustments": dict(self._adjustments),
+                "last_change": dict(self._last_change) if self._last_change else None,
+            }
+
+# Global instance
+predict_tuner = BatchSizeTuner(
+    "predict", SCHED_BULK_SLICE_ROWS, AUTOTUNE_PREDICT_MIN_ROWS, AUTOTUNE_PREDICT_MAX_ROWS,
+    AUTOTUNE_PREDICT_MAX_LATENCY_MS, AUTOTUNE_PREDICT_MAX_MB
+)
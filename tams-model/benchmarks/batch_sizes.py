@@ -0,0 +1,132 @@
+"""Import throughput with fixed batch sizes against autotuned ones
+
+Scores and stores a series of batches the way the file endpoints do (score_frame, then a
+checkpointed import) with fixed prediction slice and insert chunk sizes, and with
+autotuning starting from the defaults. Supabase is replaced by the PostgREST stub in
+this directory, in-process, with a per-request and a per-row latency. Every
+configuration runs in a fresh process from empty local stores, with duplicate skipping
+off so every batch is stored.
+
+    python benchmarks/batch_sizes.py --batches 12 --batch-rows 20000
+    python benchmarks/batch_sizes.py --stub-latency-ms 50 --stub-row-latency-ms 0.05
+
+Reports rows per second over all batches and over the second half (once the tuner has
+settled), the second half's split between scoring and storing, the longest prediction
+slice (how long a single request may wait behind bulk work) and the sizes in use at the end.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+# name -> (autotune, prediction slice rows, insert chunk rows); the autotuned run starts from the defaults
+CONFIGS = {
+    "fixed-250": (False, 250, 250),
+    "fixed-1000": (False, 1000, 1000),
+    "fixed-5000": (False, 5000, 5000),
+    "autotuned": (True, 1000, 1000),
+}
+
+async def run_batches(batches, supabase_client) -> list:
+    from ingestion import score_frame
+    from import_checkpoints import import_checkpoints
+    seconds = []
+    for index, df in enumerate(batches):
+        started = time.perf_counter()
+        scored = await asyncio.to_thread(score_frame, df)
+        scored_at = time.perf_counter()
+        progress = await import_checkpoints.start(scored, f"batch-{index}.csv", len(df))
+        if progress['status'] != 'completed':
+            raise RuntimeError(f"Import of batch {index} failed: {progress['last_error']}")
+        seconds.append((scored_at - started, time.perf_counter() - scored_at))
+    await supabase_client.close()
+    return seconds
+
+def run_one(batches: int, batch_rows: int) -> None:
+    """Child process: time the batches and print the results as JSON"""
+    import httpx
+    import pandas as pd
+    import postgrest_stub
+    from loadtest import make_rows
+
+    rng = random.Random(1337)
+    frames = [pd.DataFrame(make_rows(batch_rows, rng)) for _ in range(batches)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from database import supabase_client
+        from autotune import predict_tuner
+        from near_duplicates import near_duplicate_index
+        near_duplicate_index.load()
+        supabase_client._client = httpx.AsyncClient(
+            base_url=supabase_client.rest_url, transport=httpx.ASGITransport(app=postgrest_stub.app)
+        )
+        seconds = asyncio.run(run_batches(frames, supabase_client))
+    print(json.dumps({
+        "seconds": seconds,
+        "predict": predict_tuner.stats(),
+        "insert": supabase_client.insert_tuner.stats(),
+    }))
+
+def rate(rows: int, seconds: float) -> float:
+    return rows / seconds if seconds > 0 else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=12, help="Batches stored per configuration")
+    parser.add_argument("--batch-rows", type=int, default=20000, help="Rows per batch")
+    parser.add_argument("--stub-latency-ms", type=float, default=20, help="Stub latency per request")
+    parser.add_argument("--stub-row-latency-ms", type=float, default=0.02, help="Stub latency per row inserted")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="Configurations to run")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.batches, args.batch_rows)
+        return
+
+    half = args.batches // 2
+    print(f"{'config':>11}  {'rows/s':>8}  {'2nd half':>8}  {'scoring':>8}  {'storing':>8}  "
+          f"{'max slice ms':>12}  {'slice rows':>10}  {'insert rows':>11}")
+    for name in args.configs.split(","):
+        autotune, slice_rows, chunk_rows = CONFIGS[name]
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = dict(os.environ)
+            env.update({
+                "SUPABASE_URL": "http://supabase.invalid",
+                "SUPABASE_ROLE_KEY": "benchmark",
+                "STUB_LATENCY_MS": str(args.stub_latency_ms),
+                "STUB_ROW_LATENCY_MS": str(args.stub_row_latency_ms),
+                "TAMS_AUTOTUNE_ENABLED": str(autotune).lower(),
+                "TAMS_SCHED_BULK_SLICE_ROWS": str(slice_rows),
+                "TAMS_DB_INSERT_CHUNK_SIZE": str(chunk_rows),
+                "TAMS_DEDUP_ENABLED": "false",
+                "TAMS_OUTBOX_ENABLED": "false",
+                "TAMS_NEARDUP_DB_PATH": os.path.join(data_dir, "near_duplicates.sqlite3"),
+                "TAMS_AGGREGATES_DB_PATH": os.path.join(data_dir, "aggregates.sqlite3"),
+                "TAMS_OUTBOX_DB_PATH": os.path.join(data_dir, "outbox.sqlite3"),
+                "TAMS_IMPORT_CHECKPOINT_DB_PATH": os.path.join(data_dir, "import_checkpoints.sqlite3"),
+            })
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", "--batches", str(args.batches), "--batch-rows", str(args.batch_rows)],
+                capture_output=True, text=True, check=True, env=env, cwd=BENCHMARK_DIR
+            ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        seconds = [score + store for score, store in result["seconds"]]
+        overall = rate(args.batch_rows * len(seconds), sum(seconds))
+        settled = rate(args.batch_rows * (len(seconds) - half), sum(seconds[half:]))
+        scoring = rate(args.batch_rows * (len(seconds) - half), sum(score for score, _ in result["seconds"][half:]))
+        storing = rate(args.batch_rows * (len(seconds) - half), sum(store for _, store in result["seconds"][half:]))
+        print(f"{name:>11}  {overall:8,.0f}  {settled:8,.0f}  {scoring:8,.0f}  {storing:8,.0f}  "
+              f"{result['predict']['max_latency_ms_seen']:12.1f}  {result['predict']['size']:>10}  "
+              f"{result['insert']['size']:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""CSV reader throughput: the previous reader against FileProcessor.read_csv_stream
+
+Generates a CSV export of the requested size in two flavours, UTF-8 with commas and
+Latin-1 with semicolons like our Oracle exports, and parses each with both readers. Every
+run happens in a fresh process, so peak RSS is reported per reader.
+
+    python benchmarks/csv_reader.py --size-mb 500
+"""
+import argparse
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+HEADER = ["Num_equipement", "Systeme", "Description", "Date de détéction de l'anomalie",
+          "Description de l'équipement", "Section propriétaire", "Statut", "Commentaire"]
+SYSTEMS = ["Hydraulique", "Électrique", "Pneumatique", "Mécanique", "Instrumentation"]
+WORDS = ["pression", "fuite", "vanne", "pompe", "moteur", "vibration", "bruit", "échauffement",
+         "usure", "dérive", "étalonnage", "contrôle", "chute", "défaillance", "joint"]
+FLAVOURS = {"utf8-comma": ("utf-8", ","), "latin1-semicolon": ("latin-1", ";")}
+
+def generate(path: str, size_mb: int, encoding: str, delimiter: str, seed: int = 1337) -> None:
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    block = []
+    for i in range(5000):
+        description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+        block.append(delimiter.join([
+            f"{rng.randrange(100000):06d}", rng.choice(SYSTEMS), f'"{description}"',
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024", f'"Équipement {i}"',
+            f"S{rng.randrange(40)}", "nouvelle", f'"{description[:40]}"'
+        ]))
+    block = ("\n".join(block) + "\n").encode(encoding)
+    with open(path, "wb") as handle:
+        handle.write((delimiter.join(HEADER) + "\n").encode(encoding))
+        written = 0
+        while written < target:
+            handle.write(block)
+            written += len(block)
+
+def previous_reader(path: str):
+    """The reader before encoding and delimiter detection: whole file decoded as UTF-8"""
+    import pandas as pd
+    from file_processor import FileProcessor
+    with open(path, "rb") as handle:
+        content = handle.read()
+    return FileProcessor._process_dataframe(pd.read_csv(io.StringIO(content.decode('utf-8'))))
+
+def sniffing_reader(path: str):
+    from file_processor import FileProcessor
+    with open(path, "rb") as handle:
+        df, _, _ = FileProcessor.read_csv_stream(handle)
+    return FileProcessor._process_dataframe(df)
+
+READERS = {"previous": previous_reader, "sniffing": sniffing_reader}
+
+def run_one(reader: str, path: str) -> None:
+    """Child process: parse once and print seconds, rows and peak RSS"""
+    started = time.perf_counter()
+    try:
+        rows = len(READERS[reader](path))
+        error = "-"
+    except Exception as e:
+        rows, error = 0, type(e).__name__
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed}\t{rows}\t{peak_mb}\t{error}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=500, help="Size of each generated CSV file")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Where to write the generated files")
+    parser.add_argument("--run", nargs=2, metavar=("READER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(*args.run)
+        return
+
+    print(f"{'file':>18}  {'reader':>9}  {'seconds':>8}  {'MB/s':>7}  {'rows':>9}  {'peak RSS MB':>11}  error")
+    for flavour, (encoding, delimiter) in FLAVOURS.items():
+        path = os.path.join(args.dir, f"tams_bench_{flavour}_{args.size_mb}mb.csv")
+        if not os.path.exists(path):
+            generate(path, args.size_mb, encoding, delimiter)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        for reader in READERS:
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", reader, path],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            elapsed, rows, peak_mb, error = output.split("\t")
+            elapsed = float(elapsed)
+            print(f"{flavour:>18}  {reader:>9}  {elapsed:8.2f}  {size_mb / elapsed:7.1f}  {rows:>9}  {float(peak_mb):11.0f}  {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Concurrent load test for the storage endpoints
+
+Drives a weighted mix of /store/single, /store/batch and the file endpoints with a
+closed loop of concurrent clients, and reports throughput and p50/p95/p99 latency per
+endpoint. Supabase is replaced by the PostgREST stub in this directory, and duplicate
+skipping is turned off so repeated payloads are stored every time.
+
+In-process (one event loop, no HTTP server):
+
+    python benchmarks/loadtest.py --concurrency 1,8,32 --duration 20
+
+Saturation curves across worker counts: the stub and one server per worker count are
+started on localhost, and every concurrency level is run against each. ``--server``
+picks plain uvicorn as the previous image ran it (asyncio loop, h11 parser), the
+production gunicorn setup (gunicorn.conf.py) or both:
+
+    python benchmarks/loadtest.py --workers 1,2,4 --concurrency 1,8,32,128 --csv curves.csv
+    python benchmarks/loadtest.py --workers 2 --server uvicorn,gunicorn
+
+Or against a server you started yourself (pointing SUPABASE_URL at a stub):
+
+    python benchmarks/loadtest.py --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, APP_DIR)
+
+import httpx
+
+SYSTEMS = ["Hydraulic", "Electrical", "Pneumatic", "Mechanical", "Instrumentation"]
+WORDS = ["pressure", "leak", "fuite", "vanne", "pompe", "moteur", "vibration", "bruit",
+         "overheat", "wear", "drift", "calibration", "check", "drop", "failure", "joint"]
+ENDPOINTS = ["single", "batch", "csv", "excel", "parquet"]
+
+def make_rows(count: int, rng: random.Random):
+    return [
+        {
+            "num_equipement": f"EQ{rng.randrange(5000):04d}",
+            "systeme": rng.choice(SYSTEMS),
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))),
+            "date_detection": "2025-01-15",
+            "section_proprietaire": f"S{rng.randrange(20)}"
+        }
+        for _ in range(count)
+    ]
+
+def make_file(rows, file_type: str) -> bytes:
+    """Encode rows with the source column names, as an upload would carry them"""
+    import pandas as pd
+    from file_processor import FileProcessor
+
+    source_names = {canonical: source for source, canonical in FileProcessor.COLUMN_MAPPING.items()}
+    df = pd.DataFrame(rows).rename(columns=source_names)
+    buffer = io.BytesIO()
+    if file_type == "csv":
+        df.to_csv(buffer, index=False)
+    elif file_type == "excel":
+        df.to_excel(buffer, index=False)
+    else:
+        df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+class Workload:
+    """Pre-generated payloads and the weighted endpoint mix"""
+
+    def __init__(self, mix, batch_size: int, file_rows: int, seed: int):
+        rng = random.Random(seed)
+        self.endpoints = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.endpoints]
+        self.rng = rng
+        self.singles = make_rows(200, rng)
+        self.batch = make_rows(batch_size, rng)
+        file_data = make_rows(file_rows, rng)
+        self.files = {
+            "csv": ("load.csv", make_file(file_data, "csv")),
+            "excel": ("load.xlsx", make_file(file_data, "excel") if "excel" in self.endpoints else b""),
+            "parquet": ("load.parquet", make_file(file_data, "parquet") if "parquet" in self.endpoints else b""),
+        }
+
+    def pick(self) -> str:
+        return self.rng.choices(self.endpoints, self.weights)[0]
+
+    async def send(self, client: httpx.AsyncClient, endpoint: str) -> httpx.Response:
+        if endpoint == "single":
+            return await client.post("/store/single", json=self.rng.choice(self.singles))
+        if endpoint == "batch":
+            return await client.post("/store/batch", json=self.batch)
+        filename, content = self.files[endpoint]
+        return await client.post(f"/store/file/{endpoint}", files={"file": (filename, content)})
+
+async def run_level(client: httpx.AsyncClient, workload: Workload, concurrency: int, duration: float):
+    """Closed loop: each client sends its next request as soon as the previous one returns"""
+    samples = {name: [] for name in workload.endpoints}
+    errors = {name: 0 for name in workload.endpoints}
+    deadline = time.perf_counter() + duration
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            endpoint = workload.pick()
+            started = time.perf_counter()
+            try:
+                response = await workload.send(client, endpoint)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                samples[endpoint].append(time.perf_counter() - started)
+            else:
+                errors[endpoint] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else float("nan")
+
+def summarize(samples, errors, elapsed, workers, concurrency):
+    rows = []
+    for endpoint in samples:
+        done = samples[endpoint]
+        rows.append({
+            "workers": workers, "concurrency": concurrency, "endpoint": endpoint,
+            "requests": len(done), "errors": errors[endpoint],
+            "throughput_rps": round(len(done) / elapsed, 2),
+            "p50_ms": round(percentile(done, 0.50), 2),
+            "p95_ms": round(percentile(done, 0.95), 2),
+            "p99_ms": round(percentile(done, 0.99), 2),
+        })
+    everything = [s for done in samples.values() for s in done]
+    rows.append({
+        "workers": workers, "concurrency": concurrency, "endpoint": "all",
+        "requests": len(everything), "errors": sum(errors.values()),
+        "throughput_rps": round(len(everything) / elapsed, 2),
+        "p50_ms": round(percentile(everything, 0.50), 2),
+        "p95_ms": round(percentile(everything, 0.95), 2),
+        "p99_ms": round(percentile(everything, 0.99), 2),
+    })
+    return rows
+
+def print_rows(rows):
+    columns = ["workers", "concurrency", "endpoint", "requests", "errors",
+               "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{str(row[c]):>14}" for c in columns))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+@contextlib.contextmanager
+def serve(module, args, cwd, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", module, *args, "--log-level", "warning"],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def server_env(stub_url: str, data_dir: str):
+    """Each server starts from empty local stores, so runs do not inherit each other's state"""
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_ROLE_KEY": env.get("SUPABASE_ROLE_KEY", "loadtest"),
+        "TAMS_DEDUP_ENABLED": "false",
+        "TAMS_NEARDUP_DB_PATH": os.path.join(data_dir, "near_duplicates.sqlite3"),
+        "TAMS_AGGREGATES_DB_PATH": os.path.join(data_dir, "aggregates.sqlite3"),
+        "TAMS_OUTBOX_DB_PATH": os.path.join(data_dir, "outbox.sqlite3"),
+        "TAMS_IMPORT_CHECKPOINT_DB_PATH": os.path.join(data_dir, "import_checkpoints.sqlite3"),
+    })
+    return env
+
+async def sweep(base_url, workload, levels, duration, workers, transport=None):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=300) as client:
+        for concurrency in levels:
+            samples, errors, elapsed = await run_level(client, workload, concurrency, duration)
+            rows = summarize(samples, errors, elapsed, workers, concurrency)
+            print_rows(rows)
+            results.extend(rows)
+    return results
+
+def run_in_process(workload, levels, duration):
+    os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+    os.environ.setdefault("SUPABASE_ROLE_KEY", "loadtest")
+    os.environ["TAMS_DEDUP_ENABLED"] = "false"
+    import postgrest_stub
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import main
+        from database import supabase_client
+        # Startup events do not run in-process; load the index outside the measured runs
+        main.near_duplicate_index.load()
+    supabase_client._client = httpx.AsyncClient(
+        base_url=supabase_client.rest_url, transport=httpx.ASGITransport(app=postgrest_stub.app)
+    )
+    return asyncio.run(sweep(
+        "http://loadtest", workload, levels, duration, "in-process",
+        transport=httpx.ASGITransport(app=main.app)
+    ))
+
+def app_server(server: str, port: int, workers: int):
+    if server == "gunicorn":
+        return "gunicorn", ["main:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    # The previous image: plain uvicorn without uvloop and httptools installed
+    return "uvicorn", ["main:app", "--port", str(port), "--workers", str(workers), "--loop", "asyncio", "--http", "h11"]
+
+def run_worker_sweep(workload, levels, duration, worker_counts, stub_latency_ms, servers=("uvicorn",)):
+    stub_port, results = free_port(), []
+    stub_env = dict(os.environ, STUB_LATENCY_MS=str(stub_latency_ms))
+    with serve("uvicorn", ["postgrest_stub:app", "--port", str(stub_port)], BENCHMARK_DIR, stub_env):
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        wait_until_up(stub_url)
+        for server in servers:
+            for workers in worker_counts:
+                port = free_port()
+                with tempfile.TemporaryDirectory() as data_dir, \
+                        serve(*app_server(server, port, workers), APP_DIR, server_env(stub_url, data_dir)):
+                    base_url = f"http://127.0.0.1:{port}"
+                    wait_until_up(base_url + "/")
+                    label = f"{server}:{workers}" if len(servers) > 1 else workers
+                    print(f"--- {server}, {workers} worker(s) ---")
+                    results.extend(asyncio.run(sweep(base_url, workload, levels, duration, label)))
+    return results
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint '{name}', expected one of {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Load an already running server instead of starting one")
+    parser.add_argument("--workers", help="Comma-separated worker counts to sweep, e.g. 1,2,4")
+    parser.add_argument("--server", default="uvicorn",
+                        help="Comma-separated servers for --workers: uvicorn, gunicorn (gunicorn.conf.py)")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent client counts")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per concurrency level")
+    parser.add_argument("--mix", default="single=70,batch=20,csv=10",
+                        help=f"Weighted endpoint mix, endpoints: {','.join(ENDPOINTS)}")
+    parser.add_argument("--batch-size", type=int, default=100, help="Anomalies per /store/batch request")
+    parser.add_argument("--file-rows", type=int, default=1000, help="Rows per uploaded file")
+    parser.add_argument("--stub-latency-ms", type=float, default=10, help="Simulated database latency")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--csv", help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        workload = Workload(parse_mix(args.mix), args.batch_size, args.file_rows, args.seed)
+
+    if args.url:
+        results = asyncio.run(sweep(args.url, workload, levels, args.duration, "external"))
+    elif args.workers:
+        worker_counts = [int(count) for count in args.workers.split(",")]
+        servers = [server.strip() for server in args.server.split(",")]
+        unknown = set(servers) - {"uvicorn", "gunicorn"}
+        if unknown:
+            raise SystemExit(f"Unknown server(s) {sorted(unknown)}, expected uvicorn or gunicorn")
+        results = run_worker_sweep(workload, levels, args.duration, worker_counts, args.stub_latency_ms, servers)
+    else:
+        os.environ["STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+        results = run_in_process(workload, levels, args.duration)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Results written to {args.csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Minimal stand-in for Supabase's PostgREST API, for benchmarks and load tests
+
+Answers inserts (``POST /rest/v1/<table>``) like PostgREST does, assigning IDs to rows
+that have none (or, for upserts ignoring duplicates, leaving out the IDs it already
+keeps), after an optional artificial latency: STUB_LATENCY_MS per request plus
+STUB_ROW_LATENCY_MS per row inserted. Nothing is kept in memory unless STUB_KEEP_ROWS
+is set; then stored rows can be read back with keyset pagination
+(``GET /rest/v1/<table>?select=a,b&order=id.asc&id=gt.<id>&limit=<n>``) and updated by ID
+(``PATCH /rest/v1/<table>?id=in.(<id>,<id>)``).
+
+    STUB_LATENCY_MS=20 uvicorn postgrest_stub:app --app-dir benchmarks --port 54321
+"""
+import asyncio
+import json
+import os
+import uuid
+from urllib.parse import parse_qs
+
+LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS", "0"))
+ROW_LATENCY_MS = float(os.environ.get("STUB_ROW_LATENCY_MS", "0"))
+KEEP_ROWS = os.environ.get("STUB_KEEP_ROWS", "").lower() in ("1", "true", "yes")
+
+# table -> {id -> row}, only filled with STUB_KEEP_ROWS
+tables = {}
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+async def _respond(send, status: int, payload: bytes = b"") -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    body = await _read_body(receive)
+    rows = json.loads(body or b"[]") if scope["method"] == "POST" else None
+    rows = rows if isinstance(rows, list) or rows is None else [rows]
+    latency_ms = LATENCY_MS + ROW_LATENCY_MS * len(rows or ())
+    if latency_ms:
+        await asyncio.sleep(latency_ms / 1000)
+
+    table = tables.setdefault(scope["path"].rstrip("/").rsplit("/", 1)[-1], {})
+    if scope["method"] == "GET" and KEEP_ROWS:
+        await _respond(send, 200, json.dumps(_select(table, scope)).encode())
+        return
+    if scope["method"] == "PATCH" and KEEP_ROWS:
+        _update(table, scope, json.loads(body or b"{}"))
+        await _respond(send, 204)
+        return
+    if scope["method"] != "POST":
+        await _respond(send, 405, b'{"message": "only inserts are supported"}')
+        return
+
+    stored = [dict(row, id=row.get("id") or str(uuid.uuid4())) for row in rows]
+    prefer = dict(scope["headers"]).get(b"prefer", b"").decode()
+    if KEEP_ROWS:
+        if "resolution=ignore-duplicates" in prefer:
+            # Like ON CONFLICT DO NOTHING ... RETURNING: rows already stored are left out
+            stored = [row for row in stored if row["id"] not in table]
+        for row in stored:
+            table.setdefault(row["id"], row)
+    if "return=minimal" in prefer:
+        await _respond(send, 201)
+        return
+    query = {name: values[0] for name, values in parse_qs(scope["query_string"].decode()).items()}
+    if "select" in query:
+        columns = query["select"].split(",")
+        stored = [{column: row.get(column) for column in columns} for row in stored]
+    await _respond(send, 201, json.dumps(stored).encode())
+
+def _update(table, scope, changes):
+    """Apply ``changes`` to the rows matching the ``id=in.(...)`` filter"""
+    query = {name: values[0] for name, values in parse_qs(scope["query_string"].decode()).items()}
+    for row_id in query.get("id", "in.()")[4:-1].split(","):
+        if row_id in table:
+            table[row_id].update(changes)
+
+def _select(table, scope):
+    """Rows ordered by ID, after the ``id=gt.`` cursor if any, with the selected columns"""
+    query = {name: values[0] for name, values in parse_qs(scope["query_string"].decode()).items()}
+    after = query.get("id", "gt.")[3:]
+    limit = int(query.get("limit", len(table) or 1))
+    columns = query["select"].split(",") if "select" in query else None
+    page = sorted(row_id for row_id in table if row_id > after)[:limit]
+    return [
+        {column: table[row_id].get(column) for column in columns} if columns else table[row_id]
+        for row_id in page
+    ]
@@ -0,0 +1,94 @@
+"""Measure /store/single latency with the single-row fast path and the DataFrame path
+
+The app runs in-process against a PostgREST stand-in that answers immediately, so
+the numbers cover validation, feature preparation, inference and serialization but
+not the network round-trip to Supabase.
+
+    python benchmarks/store_single_latency.py --model ml_models/multi_output_model.pkl
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+os.environ["TAMS_OUTBOX_ENABLED"] = "false"
+
+import httpx
+import pandas as pd
+
+import postgrest_stub
+
+PAYLOAD = {
+    "num_equipement": "EQ001",
+    "systeme": "Hydraulic",
+    "description": "Pressure drop detected in main valve",
+    "date_detection": "2025-01-15",
+    "description_equipement": "Main hydraulic valve",
+    "section_proprietaire": "Maintenance"
+}
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def measure(app, requests: int, warmup: int):
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for i in range(warmup + requests):
+            started = time.perf_counter()
+            response = await client.post("/store/single", json=PAYLOAD)
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            if i >= warmup:
+                samples.append(elapsed * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Model file to load instead of ml_models/multi_output_model.pkl")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    args = parser.parse_args()
+
+    # Model loading prints a lot, send it where a production log would go
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import main as app_module
+        from predictor import TAMSPredictor
+        from database import supabase_client
+
+        if args.model:
+            app_module.predictor = TAMSPredictor(args.model)
+        model = app_module.predictor
+        supabase_client._client = httpx.AsyncClient(
+            base_url=supabase_client.rest_url, transport=httpx.ASGITransport(app=postgrest_stub.app)
+        )
+
+        def dataframe_path(data):
+            scores = model.predict_frame(pd.DataFrame([data]))
+            return {name: values[0].item() if hasattr(values[0], "item") else values[0]
+                    for name, values in scores.items()}
+
+        fast_path = model.predict_single
+        results = {}
+        for name, predict in [
+            ("dataframe", dataframe_path),
+            ("fast path", fast_path),
+        ]:
+            model.predict_single = predict
+            results[name] = asyncio.run(measure(app_module.app, args.requests, args.warmup))
+        model.predict_single = fast_path
+
+    print(f"model loaded: {model.model_loaded}, {args.requests} requests per path")
+    for name, samples in results.items():
+        print(f"{name:>10}: p50 {percentile(samples, 0.50):7.3f} ms  "
+              f"p95 {percentile(samples, 0.95):7.3f} ms  "
+              f"mean {statistics.mean(samples):7.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Offline bulk scoring for backfills
+
+Reads CSV, Excel (every sheet), Parquet or Arrow files with the same readers as the upload
+endpoints and scores them in worker processes, one per core by default, without the
+scoring deadline. The results are written to a file (CSV or Parquet, from the extension)
+and/or stored as checkpointed imports, one per file or sheet, exactly like an upload
+through /store/file/... (same validation, duplicate skipping and resume).
+
+    python bulk_score.py exports/*.csv --output scored.parquet
+    python bulk_score.py history.xlsx --store --workers 8
+    python bulk_score.py --resume <import_batch_id>
+
+Prints rows per second for reading, scoring and writing each input, and overall.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import UploadFile
+
+from file_processor import FileProcessor, shutdown_sheet_pool
+
+# Rows sent to a worker process at once
+BULK_CHUNK_ROWS = int(os.environ.get("TAMS_BULK_CHUNK_ROWS", "20000"))
+
+def _init_worker() -> None:
+    # The predictor logs every call; keep the workers quiet and load the model up front
+    sys.stdout = open(os.devnull, "w")
+    importlib.import_module("ingestion")
+
+def _ready(_) -> int:
+    return os.getpid()
+
+def _score_chunk(df: pd.DataFrame, store: bool):
+    """Worker process: score one chunk of an input
+
+    For storing, this is the upload path (duplicate skipping and near-duplicate lookup
+    included); for a file, only validation and prediction.
+    """
+    from ingestion import ScoredBatch, score_frame
+    from predictor import predictor
+    if store:
+        return score_frame(df)
+    valid_df, rejected_rows = FileProcessor.validate_frame(df)
+    scores = predictor.predict_frame(valid_df)
+    return ScoredBatch(FileProcessor.prepare_frame_for_database(valid_df, scores), rejected_rows)
+
+def _merge(batches, starts: List[int]):
+    """One batch from scored chunks, with row positions counted from the start of the input"""
+    from ingestion import ScoredBatch
+    merged = ScoredBatch([], [])
+    signatures = []
+    for batch, start in zip(batches, starts):
+        merged.rows.extend(batch.rows)
+        merged.skipped += batch.skipped
+        merged.fingerprints.extend(batch.fingerprints)
+        for entry in batch.rejected_rows + batch.near_duplicates:
+            entry['row'] += start
+        merged.rejected_rows.extend(batch.rejected_rows)
+        merged.near_duplicates.extend(batch.near_duplicates)
+        if batch.signatures is not None:
+            signatures.append(batch.signatures)
+    merged.signatures = np.concatenate(signatures) if signatures else None
+
+    # Repeats across chunks, which the workers could not see
+    if merged.fingerprints:
+        repeated = pd.Series(merged.fingerprints).duplicated().to_numpy()
+        if repeated.any():
+            keep = ~repeated
+            merged.skipped += int(repeated.sum())
+            merged.rows = [row for row, kept in zip(merged.rows, keep) if kept]
+            merged.fingerprints = [fp for fp, kept in zip(merged.fingerprints, keep) if kept]
+            if merged.signatures is not None:
+                merged.signatures = merged.signatures[keep]
+    return merged
+
+async def _read(path: str) -> List[Tuple[str, pd.DataFrame]]:
+    """The frames of an input file, one per sheet for workbooks, named after the file"""
+    name = os.path.basename(path)
+    if name.lower().endswith(('.xlsx', '.xls')):
+        return [
+            (f"{name}:{sheet}", await FileProcessor.process_excel_sheet(path, sheet))
+            for sheet in FileProcessor.excel_sheet_names(path)
+        ]
+    with open(path, "rb") as handle:
+        upload = UploadFile(file=handle, filename=name, size=os.path.getsize(path))
+        return [(name, await FileProcessor.process_upload(upload))]
+
+def _write(path: str, frames: List[pd.DataFrame]) -> None:
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if path.lower().endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+async def _store(scored, name: str, total_rows: int) -> Dict[str, Any]:
+    from import_checkpoints import import_checkpoints
+    from database import supabase_client
+    try:
+        return await import_checkpoints.start(scored, name, total_rows)
+    finally:
+        await supabase_client.close()
+
+async def _resume(import_batch_id: str) -> Dict[str, Any]:
+    from import_checkpoints import import_checkpoints
+    from database import supabase_client
+    refusal = import_checkpoints.claim(import_batch_id)
+    if refusal is not None:
+        raise SystemExit(f"Cannot resume {import_batch_id}: {refusal[1]}")
+    try:
+        return await import_checkpoints.run(import_batch_id)
+    finally:
+        await supabase_client.close()
+
+def _rate(rows: int, seconds: float) -> str:
+    return f"{rows / seconds:,.0f}" if seconds > 0 else "-"
+
+def _report_import(progress: Dict[str, Any]) -> None:
+    if progress['status'] == 'failed':
+        print(f"  import {progress['import_batch_id']} failed after {progress['committed_chunks']} of "
+              f"{progress['total_chunks']} chunks: {progress['last_error']}")
+        print(f"  resume it with: python bulk_score.py --resume {progress['import_batch_id']}")
+    else:
+        print(f"  import {progress['import_batch_id']}: {progress['stored_rows']} stored")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", help="CSV, Excel, Parquet or Arrow files")
+    parser.add_argument("--output", help="Write the scored rows of all inputs to this .csv or .parquet file")
+    parser.add_argument("--store", action="store_true", help="Store each input as a checkpointed import")
+    parser.add_argument("--rejected", help="Write the rows that failed validation to this JSON lines file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--chunk-rows", type=int, default=BULK_CHUNK_ROWS, help="Rows per worker task")
+    parser.add_argument("--resume", metavar="IMPORT_BATCH_ID", help="Resume a failed import instead")
+    args = parser.parse_args()
+
+    if args.resume:
+        with contextlib.redirect_stdout(sys.stderr):
+            progress = asyncio.run(_resume(args.resume))
+        _report_import(progress)
+        return
+    if not args.inputs or not (args.output or args.store):
+        parser.error("give input files and --output and/or --store")
+
+    frames = []
+    rejected = []
+    totals = {"rows": 0, "scored": 0}
+    started = time.perf_counter()
+    # Spawned rather than forked, like the sheet pool: reading runs Arrow and Excel threads
+    pool = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+    try:
+        # Start the workers (and load the model in each) before timing anything
+        list(pool.map(_ready, range(args.workers)))
+        print(f"started {args.workers} scoring processes in {time.perf_counter() - started:.2f} s")
+        for path in args.inputs:
+            read_started = time.perf_counter()
+            inputs = asyncio.run(_read(path))
+            read_seconds = time.perf_counter() - read_started
+            for name, df in inputs:
+                score_started = time.perf_counter()
+                starts = list(range(0, len(df), args.chunk_rows))
+                batches = pool.map(_score_chunk, [df.iloc[start:start + args.chunk_rows] for start in starts],
+                                   [args.store] * len(starts))
+                scored = _merge(batches, starts)
+                score_seconds = time.perf_counter() - score_started
+
+                print(f"{name}: {len(df)} rows, {len(scored.rows)} scored, {len(scored.rejected_rows)} rejected, "
+                      f"{scored.skipped} already stored")
+                print(f"  read {read_seconds:.2f} s ({_rate(len(df), read_seconds)} rows/s), "
+                      f"scored {score_seconds:.2f} s ({_rate(len(df), score_seconds)} rows/s)")
+                totals["rows"] += len(df)
+                totals["scored"] += len(scored.rows)
+                rejected.extend(dict(entry, source=name) for entry in scored.rejected_rows)
+                if args.output:
+                    frames.append(pd.DataFrame(scored.rows).assign(source=name))
+                if args.store and scored.rows:
+                    store_started = time.perf_counter()
+                    with contextlib.redirect_stdout(sys.stderr):
+                        progress = asyncio.run(_store(scored, name, len(df)))
+                    store_seconds = time.perf_counter() - store_started
+                    print(f"  stored {store_seconds:.2f} s ({_rate(progress['stored_rows'], store_seconds)} rows/s)")
+                    _report_import(progress)
+                read_seconds = 0.0
+    finally:
+        pool.shutdown()
+        shutdown_sheet_pool()
+
+    if args.output:
+        write_started = time.perf_counter()
+        _write(args.output, frames)
+        print(f"wrote {totals['scored']} rows to {args.output} in {time.perf_counter() - write_started:.2f} s")
+    if args.rejected:
+        with open(args.rejected, "w") as handle:
+            for entry in rejected:
+                handle.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    elapsed = time.perf_counter() - started
+    print(f"total: {totals['rows']} rows, {totals['scored']} scored in {elapsed:.2f} s "
+          f"({_rate(totals['rows'], elapsed)} rows/s) with {args.workers} workers")
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,345 @@
 import os
-from supabase import create_client, Client
+import asyncio
+import functools
+import json
+import time
+import httpx
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 import uuid
 from datetime import datetime
 
+from scheduler import LANE_INTERACTIVE, LANE_BULK, PriorityScheduler
+from autotune import (
+    BatchSizeTuner, AUTOTUNE_INSERT_MIN_ROWS, AUTOTUNE_INSERT_MAX_ROWS,
+    AUTOTUNE_INSERT_MAX_LATENCY_MS, AUTOTUNE_INSERT_MAX_MB
+)
+from tracing import span
+
 load_dotenv()
 
+# Connection pool and timeouts for the PostgREST API
+DB_POOL_SIZE = int(os.environ.get("TAMS_DB_POOL_SIZE", "20"))
+DB_KEEPALIVE_CONNECTIONS = int(os.environ.get("TAMS_DB_KEEPALIVE_CONNECTIONS", str(DB_POOL_SIZE)))
+DB_KEEPALIVE_EXPIRY = float(os.environ.get("TAMS_DB_KEEPALIVE_EXPIRY", "60"))
+DB_CONNECT_TIMEOUT = float(os.environ.get("TAMS_DB_CONNECT_TIMEOUT", "5"))
+DB_REQUEST_TIMEOUT = float(os.environ.get("TAMS_DB_REQUEST_TIMEOUT", "30"))
+DB_POOL_TIMEOUT = float(os.environ.get("TAMS_DB_POOL_TIMEOUT", "10"))
+# Imports are upserted in chunks sent concurrently over the pool; with autotuning on, the
+# chunk size starts here and follows the observed insert throughput
+DB_INSERT_CHUNK_SIZE = int(os.environ.get("TAMS_DB_INSERT_CHUNK_SIZE", "1000"))
+DB_MAX_CONCURRENT_INSERTS = int(os.environ.get("TAMS_DB_MAX_CONCURRENT_INSERTS", "4"))
+
+def _payload_row_bytes(rows: List[Dict[str, Any]], sample: int = 20) -> float:
+    """Request body bytes per row, measured on the first rows"""
+    head = rows[:sample]
+    return len(json.dumps(head, default=str)) / len(head) if head else 0.0
+
+class PostgRESTError(Exception):
+    """Error response from the PostgREST API"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"HTTP {status_code}: {body}")
+        self.status_code = status_code
+
+class PartialInsertError(Exception):
+    """A chunked insert that failed part way, with the rows its completed requests returned"""
+
+    def __init__(self, error: Exception, inserted: List[Dict[str, Any]]):
+        super().__init__(str(error))
+        self.inserted = inserted
+
 class SupabaseClient:
     def __init__(self):
         url: str = os.environ.get("SUPABASE_URL")
         # Use service role key to bypass RLS authentication rules
         service_role_key: str = os.environ.get("SUPABASE_ROLE_KEY")
-        
+
         if not url or not service_role_key:
             raise ValueError("SUPABASE_URL and SUPABASE_ROLE_KEY must be set in environment variables")
-        
-        # Create client with service role key for server-side operations
-        self.supabase: Client = create_client(url, service_role_key)
-        print("Connected to Supabase with service role key (bypassing RLS)")
-    
+
+        # Talk to the PostgREST API directly with the service role key for server-side operations
+        self.rest_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json",
+        }
+
+        # The HTTP client is created on first use, inside the process and event loop that uses it
+        self._client: Optional[httpx.AsyncClient] = None
+        # Pooled connections shared by interactive writes and bulk work, with interactive
+        # writes served first and bulk work held to DB_MAX_CONCURRENT_INSERTS at once
+        self.scheduler = PriorityScheduler("storage", DB_POOL_SIZE, {LANE_BULK: DB_MAX_CONCURRENT_INSERTS})
+        # Rows per insert request, sized from the insert latency and throughput observed
+        self.insert_tuner = BatchSizeTuner(
+            "insert", DB_INSERT_CHUNK_SIZE, AUTOTUNE_INSERT_MIN_ROWS, AUTOTUNE_INSERT_MAX_ROWS,
+            AUTOTUNE_INSERT_MAX_LATENCY_MS, AUTOTUNE_INSERT_MAX_MB
+        )
+
+        # Pool usage statistics
+        self._requests = 0
+        self._failed_requests = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._saturated_requests = 0
+        self._connections_opened = 0
+        self._pool_wait_seconds = 0.0
+        self._request_seconds = 0.0
+        print("Configured Supabase REST client with service role key (bypassing RLS)")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive HTTP client for all database calls"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.rest_url,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=DB_POOL_SIZE,
+                    max_keepalive_connections=DB_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=DB_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    DB_REQUEST_TIMEOUT, connect=DB_CONNECT_TIMEOUT, pool=DB_POOL_TIMEOUT
+                ),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, table: str, json: Any = None,
+                       params: Optional[Dict[str, str]] = None, prefer: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Send one PostgREST request over the pool and return the decoded rows"""
+        headers = {"Prefer": prefer} if prefer else None
+        started = time.perf_counter()
+        connect_seconds = [0.0]
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            # A TCP connect means the pool had no idle connection to reuse. The time until the
+            # request headers go out, minus any connect time, was spent waiting for the pool.
+            if event == "connection.connect_tcp.started":
+                connect_seconds[0] = time.perf_counter()
+            elif event == "connection.connect_tcp.complete":
+                self._connections_opened += 1
+                connect_seconds[0] = time.perf_counter() - connect_seconds[0]
+            elif event == "http11.send_request_headers.started":
+                self._pool_wait_seconds += max(0.0, time.perf_counter() - started - connect_seconds[0])
+
+        self._requests += 1
+        if self._in_flight >= DB_POOL_SIZE:
+            self._saturated_requests += 1
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        rows = len(json) if isinstance(json, list) else int(json is not None)
+        with span("db.request", method=method, table=table, rows=rows) as request_span:
+            try:
+                response = await self.client.request(
+                    method, f"/{table}", json=json, params=params, headers=headers,
+                    extensions={"trace": trace}
+                )
+                request_span.set(status_code=response.status_code)
+                if response.status_code >= 400:
+                    raise PostgRESTError(response.status_code, response.text)
+                return response.json() if response.content else []
+            except Exception:
+                self._failed_requests += 1
+                raise
+            finally:
+                self._in_flight -= 1
+                self._request_seconds += time.perf_counter() - started
+
+    async def _insert(self, table: str, rows: Any) -> List[Dict[str, Any]]:
+        return await self._request("POST", table, json=rows, prefer="return=representation")
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool configuration, saturation and connection reuse statistics"""
+        reused = max(0, self._requests - self._connections_opened)
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_keepalive_connections": DB_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry_seconds": DB_KEEPALIVE_EXPIRY,
+            "insert_chunk_size": self.insert_tuner.stats()["size"],
+            "max_concurrent_inserts": DB_MAX_CONCURRENT_INSERTS,
+            "requests": self._requests,
+            "failed_requests": self._failed_requests,
+            "in_flight": self._in_flight,
+            "max_in_flight": self._max_in_flight,
+            "pool_utilization": self._in_flight / DB_POOL_SIZE,
+            "saturated_requests": self._saturated_requests,
+            "connections_opened": self._connections_opened,
+            "reused_connection_requests": reused,
+            "connection_reuse_ratio": reused / self._requests if self._requests else 0.0,
+            "avg_pool_wait_ms": 1000 * self._pool_wait_seconds / self._requests if self._requests else 0.0,
+            "avg_request_ms": 1000 * self._request_seconds / self._requests if self._requests else 0.0,
+        }
+
     async def create_anomaly(self, anomaly_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a single anomaly record in the database"""
         try:
-            result = self.supabase.table('anomalies').insert(anomaly_data).execute()
-            return result.data[0] if result.data else None
+            async with self.scheduler.aslot(LANE_INTERACTIVE):
+                result = await self._insert('anomalies', anomaly_data)
+            return result[0] if result else None
         except Exception as e:
             raise Exception(f"Error creating anomaly: {str(e)}")
-    
-    async def create_anomalies_batch(self, anomalies_data: List[Dict[str, Any]], batch_id: str) -> List[Dict[str, Any]]:
-        """Create multiple anomaly records in a batch"""
-        try:
-            # Add batch_id to each anomaly
-            for anomaly in anomalies_data:
-                anomaly['import_batch_id'] = batch_id
-            
-            result = self.supabase.table('anomalies').insert(anomalies_data).execute()
-            return result.data if result.data else []
-        except Exception as e:
-            # If foreign key constraint fails, try without import_batch_id
-            if "foreign key constraint" in str(e) and "import_batch_id" in str(e):
-                print(f"Warning: import_batch_id foreign key constraint failed, retrying without batch_id")
+
+    async def _upsert(self, table: str, rows: Any, returning: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Insert rows that carry their own IDs, ignoring IDs that are already stored
+
+        Returns the rows sent, or with ``returning`` (the columns to select) only the rows
+        that were actually inserted.
+        """
+        if returning is None:
+            await self._request(
+                "POST", table, json=rows, params={"on_conflict": "id"},
+                prefer="resolution=ignore-duplicates,return=minimal"
+            )
+            return rows
+        return await self._request(
+            "POST", table, json=rows, params={"on_conflict": "id", "select": returning},
+            prefer="resolution=ignore-duplicates,return=representation"
+        )
+
+    async def _insert_anomalies_chunk(self, anomalies_data: List[Dict[str, Any]], index: int = 0,
+                                      upsert: bool = False, requested: Optional[int] = None,
+                                      part: int = 0) -> List[Dict[str, Any]]:
+        """Insert one chunk of a batch in the bulk lane, limited to DB_MAX_CONCURRENT_INSERTS in flight
+
+        With ``requested``, the rows the chunk was sized for, its timing goes to the insert tuner.
+        An upsert returns only the IDs of the rows it inserted.
+        """
+        write = functools.partial(self._upsert, returning='id') if upsert else self._insert
+        with span("db.insert_chunk", chunk=index, part=part, rows=len(anomalies_data)):
+            async with self.scheduler.aslot(LANE_BULK):
+                started = time.perf_counter()
                 try:
-                    # Remove import_batch_id from anomalies and retry
-                    anomalies_without_batch = []
-                    for anomaly in anomalies_data:
-                        anomaly_copy = anomaly.copy()
-                        anomaly_copy.pop('import_batch_id', None)
-                        anomalies_without_batch.append(anomaly_copy)
-                    
-                    result = self.supabase.table('anomalies').insert(anomalies_without_batch).execute()
-                    return result.data if result.data else []
-                except Exception as retry_error:
-                    raise Exception(f"Error creating anomalies batch (retry failed): {str(retry_error)}")
-            else:
-                raise Exception(f"Error creating anomalies batch: {str(e)}")
-    
+                    result = await write('anomalies', anomalies_data)
+                except Exception as e:
+                    # If foreign key constraint fails, try without import_batch_id
+                    if "foreign key constraint" in str(e) and "import_batch_id" in str(e):
+                        print(f"Warning: import_batch_id foreign key constraint failed, retrying without batch_id")
+                        try:
+                            # Remove import_batch_id from anomalies and retry
+                            anomalies_without_batch = []
+                            for anomaly in anomalies_data:
+                                anomaly_copy = anomaly.copy()
+                                anomaly_copy.pop('import_batch_id', None)
+                                anomalies_without_batch.append(anomaly_copy)
+
+                            return await write('anomalies', anomalies_without_batch)
+                        except Exception as retry_error:
+                            raise Exception(f"Error creating anomalies batch (retry failed): {str(retry_error)}")
+                    raise Exception(f"Error creating anomalies batch: {str(e)}")
+                if requested is not None:
+                    self.insert_tuner.record(len(anomalies_data), time.perf_counter() - started, requested)
+                return result
+
+    async def _insert_in_chunks(self, anomalies_data: List[Dict[str, Any]], index: int = 0, upsert: bool = False,
+                                on_inserted: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+                                ) -> List[Dict[str, Any]]:
+        """Insert rows in chunks sized by the insert tuner, DB_MAX_CONCURRENT_INSERTS at a time
+
+        Each chunk is sized as it is sent, so a large batch already uses what the tuner
+        learned from its first chunks. ``on_inserted`` gets each chunk's result as soon as
+        the chunk is stored. The first chunk to fail cancels the chunks still waiting or in
+        flight, and PartialInsertError reports the rows of the chunks that were stored.
+        """
+        row_bytes = _payload_row_bytes(anomalies_data)
+        parts = []
+        sent = 0
+
+        async def sender() -> None:
+            nonlocal sent
+            while sent < len(anomalies_data):
+                size = self.insert_tuner.size(row_bytes)
+                start, sent = sent, sent + size
+                part = len(parts)
+                parts.append(None)
+                try:
+                    parts[part] = await self._insert_anomalies_chunk(
+                        anomalies_data[start:start + size], index, upsert, size, part
+                    )
+                    if on_inserted is not None:
+                        await on_inserted(parts[part])
+                except Exception:
+                    # Send nothing more of a batch that failed
+                    sent = len(anomalies_data)
+                    raise
+
+        senders = min(DB_MAX_CONCURRENT_INSERTS, max(1, len(anomalies_data) // self.insert_tuner.min_rows))
+        tasks = [asyncio.ensure_future(sender()) for _ in range(senders)]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # Nothing more is sent or reported once a chunk failed (or the caller went away)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        inserted = [anomaly for result in parts if result is not None for anomaly in result]
+        errors = [task.exception() for task in tasks if not task.cancelled() and task.exception() is not None]
+        if errors:
+            raise PartialInsertError(errors[0], inserted) from errors[0]
+        return inserted
+
+    async def create_anomalies_batch(self, anomalies_data: List[Dict[str, Any]], batch_id: str) -> List[Dict[str, Any]]:
+        """Create multiple anomaly records in a batch
+
+        Sent as one insert, so the batch is stored whole or not at all and a client can
+        send a failed batch again without duplicates. Large imports go through
+        ``upsert_anomalies_chunk``, whose chunks can be re-sent safely.
+        """
+        # Add batch_id to each anomaly
+        for anomaly in anomalies_data:
+            anomaly['import_batch_id'] = batch_id
+
+        return await self._insert_anomalies_chunk(anomalies_data)
+
+    async def upsert_anomalies(self, anomalies_data: List[Dict[str, Any]]) -> None:
+        """Insert anomalies that carry their own IDs, ignoring IDs that are already stored
+
+        Safe to retry after a timeout where the first attempt may have been committed.
+        """
+        async with self.scheduler.aslot(LANE_BULK):
+            await self._upsert('anomalies', anomalies_data)
+
+    async def upsert_anomalies_chunk(self, anomalies_data: List[Dict[str, Any]], index: int = 0,
+                                     on_inserted: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+                                     ) -> List[Dict[str, Any]]:
+        """Upsert one numbered chunk of an import and return the IDs of the rows it inserted
+
+        The rows carry their own IDs, so re-sending a chunk that was committed stores nothing
+        new, nor does re-sending it after only some of its insert requests went through.
+        ``on_inserted`` gets the IDs each insert request actually inserted, as it completes.
+        """
+        return await self._insert_in_chunks(anomalies_data, index, upsert=True, on_inserted=on_inserted)
+
+    async def update_anomalies(self, ids: List[str], values: Dict[str, Any]) -> None:
+        """Set the same column values on the anomalies with these IDs, in one request
+
+        The IDs go in the query string, so keep each call to a few hundred of them.
+        """
+        async with self.scheduler.aslot(LANE_BULK):
+            await self._request(
+                "PATCH", 'anomalies', json=values, params={"id": f"in.({','.join(ids)})"}, prefer="return=minimal"
+            )
+
+    async def select_page(self, table: str, columns: List[str], after_id: Optional[str] = None,
+                          limit: int = 1000, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Read one page of rows ordered by ID, starting after ``after_id``
+
+        Keyset pagination: each page is an index range scan, however deep into the table it is.
+        ``filters`` are PostgREST column filters, e.g. ``{"ai_scorer": "eq.rules"}``.
+        """
+        params = {"select": ",".join(columns), "order": "id.asc", "limit": str(limit), **(filters or {})}
+        if after_id is not None:
+            params["id"] = f"gt.{after_id}"
+        async with self.scheduler.aslot(LANE_BULK):
+            return await self._request("GET", table, params=params)
+
     async def create_import_batch(self, filename: str, total_records: int) -> str:
         """Create an import batch record and return its ID"""
         try:
@@ -66,17 +350,17 @@ class SupabaseClient:
                 'status': 'completed',
                 'created_at': datetime.utcnow().isoformat()
             }
-            
+
             # Create the import batch record in the database
-            result = self.supabase.table('import_batches').insert(batch_data).execute()
-            
-            if result.data and len(result.data) > 0:
-                return result.data[0]['id']
+            result = await self._insert('import_batches', batch_data)
+
+            if result and len(result) > 0:
+                return result[0]['id']
             else:
                 # If import_batches table doesn't exist or insert failed, return UUID anyway
                 # The anomalies table might not have the foreign key constraint
                 return batch_data['id']
-                
+
         except Exception as e:
             # If import_batches table doesn't exist, just return a UUID
             # This allows the system to work even without the import_batches table
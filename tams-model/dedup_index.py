@@ -0,0 +1,188 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Iterable
+
+import numpy as np
+import pandas as pd
+
+DEDUP_ENABLED = os.environ.get("TAMS_DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_DB_PATH = os.environ.get(
+    "TAMS_DEDUP_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "fingerprints.sqlite3")
+)
+DEDUP_EXPECTED_ITEMS = int(os.environ.get("TAMS_DEDUP_EXPECTED_ITEMS", "1000000"))
+DEDUP_FALSE_POSITIVE_RATE = float(os.environ.get("TAMS_DEDUP_FALSE_POSITIVE_RATE", "0.001"))
+# How often the filter picks up fingerprints stored by other worker processes
+DEDUP_SYNC_INTERVAL = float(os.environ.get("TAMS_DEDUP_SYNC_INTERVAL", "1"))
+# Another worker may commit a fingerprint stamped slightly before the newest one seen here
+_SYNC_MARGIN = timedelta(seconds=5)
+
+# Fields that identify an anomaly, in the order they are hashed
+FINGERPRINT_FIELDS = [
+    'num_equipement', 'systeme', 'description',
+    'date_detection', 'description_equipement', 'section_proprietaire'
+]
+
+def fingerprint_frame(df: pd.DataFrame) -> List[str]:
+    """Fingerprint each row of a validated batch from its normalized fields"""
+    normalized = []
+    for field in FINGERPRINT_FIELDS:
+        if field in df.columns:
+            # Case and runs of whitespace do not make an anomaly different
+            values = df[field].astype(str).str.lower().str.split().str.join(' ')
+        else:
+            values = pd.Series('', index=df.index)
+        normalized.append(values.tolist())
+    return [
+        hashlib.blake2b('\x1f'.join(fields).encode('utf-8'), digest_size=16).hexdigest()
+        for fields in zip(*normalized)
+    ]
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex fingerprints"""
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = max(1, capacity)
+        self.num_bits = max(8, int(-self.capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, fingerprints: List[str]) -> np.ndarray:
+        # Double hashing: the two halves of the digest generate all k bit positions
+        digests = np.array([bytes.fromhex(fp) for fp in fingerprints], dtype='S16')
+        halves = np.frombuffer(digests.tobytes(), dtype='<u8').reshape(-1, 2)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (halves[:, :1] + steps * halves[:, 1:]) % np.uint64(self.num_bits)
+
+    def add(self, fingerprints: List[str]) -> None:
+        if not fingerprints:
+            return
+        positions = self._positions(fingerprints).ravel()
+        np.bitwise_or.at(self.bits, positions // 8, (1 << (positions % 8)).astype(np.uint8))
+        self.count += len(fingerprints)
+
+    def might_contain(self, fingerprints: List[str]) -> np.ndarray:
+        if not fingerprints:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(fingerprints)
+        hits = (self.bits[positions // 8] >> (positions % 8).astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+class AnomalyDedupIndex:
+    """Screens out anomalies that were already stored by this service
+
+    A Bloom filter answers most lookups in memory. Only its hits are confirmed
+    against the persisted fingerprint set, an SQLite table that is also used to
+    rebuild the filter on startup. With several workers sharing the table, each
+    adds the fingerprints stored by the others to its filter every DEDUP_SYNC_INTERVAL.
+    """
+
+    def __init__(self, db_path: str = DEDUP_DB_PATH, expected_items: int = DEDUP_EXPECTED_ITEMS,
+                 false_positive_rate: float = DEDUP_FALSE_POSITIVE_RATE):
+        self.db_path = db_path
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self._connection = None
+        self._bloom = None
+        self._lock = threading.Lock()
+        self._watermark = ''
+        self._synced_at = 0.0
+
+    def _open(self) -> None:
+        """Open the store and load the filter on first use"""
+        if self._connection is not None:
+            return
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (hash TEXT PRIMARY KEY, created_at TEXT NOT NULL) WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_created_at ON fingerprints (created_at)")
+        self._connection = connection
+        self._rebuild_bloom()
+
+    def load(self) -> None:
+        """Build the filter now rather than on the first lookup"""
+        with self._lock:
+            self._open()
+
+    def _rebuild_bloom(self) -> None:
+        stored, newest = self._connection.execute("SELECT COUNT(*), MAX(created_at) FROM fingerprints").fetchone()
+        self._watermark = newest or ''
+        self._synced_at = time.monotonic()
+        # Leave room to grow before the false positive rate degrades
+        self._bloom = BloomFilter(max(self.expected_items, stored * 2), self.false_positive_rate)
+        cursor = self._connection.execute("SELECT hash FROM fingerprints")
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            self._bloom.add([row[0] for row in rows])
+        print(f"Dedup index loaded {stored} fingerprints from {self.db_path}")
+
+    def _catch_up(self) -> None:
+        """Add the fingerprints other workers stored since the last sync to the filter"""
+        if time.monotonic() - self._synced_at < DEDUP_SYNC_INTERVAL:
+            return
+        self._synced_at = time.monotonic()
+        since = (datetime.fromisoformat(self._watermark) - _SYNC_MARGIN).isoformat() if self._watermark else ''
+        rows = self._connection.execute(
+            "SELECT hash, created_at FROM fingerprints WHERE created_at > ?", (since,)
+        ).fetchall()
+        if not rows:
+            return
+        self._watermark = max(self._watermark, max(created_at for _, created_at in rows))
+        # Rows inside the margin were seen before; only count the new ones
+        fingerprints = [fingerprint for fingerprint, _ in rows]
+        self._bloom.add([fp for fp, hit in zip(fingerprints, self._bloom.might_contain(fingerprints)) if not hit])
+
+    def _confirm(self, fingerprints: List[str]) -> set:
+        """Return the fingerprints that really are in the persisted set"""
+        found = set()
+        for start in range(0, len(fingerprints), 500):
+            batch = fingerprints[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute(
+                f"SELECT hash FROM fingerprints WHERE hash IN ({placeholders})", batch
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def find_stored(self, fingerprints: List[str]) -> np.ndarray:
+        """Flag the fingerprints of anomalies that were already stored"""
+        with self._lock:
+            self._open()
+            self._catch_up()
+            maybe = self._bloom.might_contain(fingerprints)
+            if not maybe.any():
+                return maybe
+            candidates = [fp for fp, hit in zip(fingerprints, maybe) if hit]
+            confirmed = self._confirm(candidates)
+            return np.array([hit and fp in confirmed for fp, hit in zip(fingerprints, maybe)], dtype=bool)
+
+    def add(self, fingerprints: Iterable[str]) -> None:
+        """Record the fingerprints of newly stored anomalies"""
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return
+        with self._lock:
+            self._open()
+            created_at = datetime.utcnow().isoformat()
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO fingerprints (hash, created_at) VALUES (?, ?)",
+                    [(fp, created_at) for fp in fingerprints]
+                )
+            self._bloom.add(fingerprints)
+            if self._bloom.count > self._bloom.capacity:
+                self._rebuild_bloom()
+
+# Global instance
+dedup_index = AnomalyDedupIndex()
@@ -1,83 +1,390 @@
-import pandas as pd
+import asyncio
+import codecs
+import csv
 import io
-from typing import List, Dict, Any, Union
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
+
+import pandas as pd
+import numpy as np
 from fastapi import UploadFile
 
+from profiling import profiled
+from tracing import span
+
+# Arrow is only needed for the columnar (Parquet / Arrow IPC) upload paths
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as pa_ipc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Encoding detection for CSV files that are not UTF-8
+try:
+    from charset_normalizer import from_bytes as detect_charset
+    CHARSET_NORMALIZER_AVAILABLE = True
+except ImportError:
+    CHARSET_NORMALIZER_AVAILABLE = False
+
+# How much of a CSV file is sampled to detect its encoding and delimiter
+CSV_SNIFF_BYTES = int(os.environ.get("TAMS_CSV_SNIFF_BYTES", str(64 * 1024)))
+CSV_DELIMITERS = ",;\t|"
+# Encodings considered for files that are not UTF-8. Unrestricted detection tends to pick
+# Central European or Mac code pages for short French samples.
+CSV_ENCODINGS = [
+    name.strip() for name in os.environ.get("TAMS_CSV_ENCODINGS", "cp1252,iso8859_15,latin_1,utf_16").split(",")
+    if name.strip()
+]
+# Without charset detection, non UTF-8 files are read as Windows-1252 (Latin-1 plus € etc.)
+CSV_FALLBACK_ENCODING = "cp1252"
+
+# Worker processes parsing the sheets of a multi-sheet workbook (1 or less parses in a thread)
+EXCEL_SHEET_WORKERS = int(os.environ.get("TAMS_EXCEL_SHEET_WORKERS", str(min(4, os.cpu_count() or 1))))
+_sheet_pool: Optional[ProcessPoolExecutor] = None
+
+def _read_excel_sheet(path: str, sheet_name: str) -> pd.DataFrame:
+    """Parse one worksheet, in a worker process when the sheet pool is enabled"""
+    return FileProcessor._process_dataframe(pd.read_excel(path, sheet_name=sheet_name))
+
+def _get_sheet_pool() -> Optional[ProcessPoolExecutor]:
+    """Create the sheet parsing pool on first use, in the process that uses it"""
+    global _sheet_pool
+    if _sheet_pool is None and EXCEL_SHEET_WORKERS > 1:
+        # openpyxl is pure Python, so sheets only parse in parallel in separate processes.
+        # Spawned rather than forked, as the server process runs threads.
+        _sheet_pool = ProcessPoolExecutor(EXCEL_SHEET_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _sheet_pool
+
+def shutdown_sheet_pool() -> None:
+    global _sheet_pool
+    if _sheet_pool is not None:
+        _sheet_pool.shutdown(cancel_futures=True)
+        _sheet_pool = None
+
 class FileProcessor:
+    # Map source column names to our expected format
+    COLUMN_MAPPING = {
+        'Num_equipement': 'num_equipement',
+        'Systeme': 'systeme',
+        'Description': 'description',
+        'Date de détéction de l\'anomalie': 'date_detection',
+        'Description de l\'équipement': 'description_equipement',
+        'Section propriétaire': 'section_proprietaire'
+    }
+    REQUIRED_COLUMNS = ['num_equipement', 'systeme', 'description']
+    OPTIONAL_COLUMNS = ['date_detection', 'description_equipement', 'section_proprietaire']
+
     @staticmethod
-    async def process_csv_file(file: UploadFile) -> List[Dict[str, Any]]:
-        """Process uploaded CSV file and return list of anomaly data"""
+    async def process_csv_file(file: UploadFile) -> pd.DataFrame:
+        """Process uploaded CSV file and return a columnar frame of anomaly data
+        
+        Parsed in a worker thread, so a large upload does not hold up the event loop.
+        """
         try:
-            content = await file.read()
-            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-            return FileProcessor._process_dataframe(df)
+            with span("parse", format="csv") as parse_span:
+                df, encoding, delimiter = await asyncio.to_thread(profiled(FileProcessor._read_csv_upload), file)
+                parse_span.set(bytes=file.size, rows=len(df), encoding=encoding, delimiter=delimiter)
+                return df
         except Exception as e:
             raise Exception(f"Error processing CSV file: {str(e)}")
     
     @staticmethod
-    async def process_excel_file(file: UploadFile) -> List[Dict[str, Any]]:
-        """Process uploaded Excel file and return list of anomaly data"""
+    def _read_csv_upload(file: UploadFile) -> Tuple[pd.DataFrame, str, str]:
+        df, encoding, delimiter = FileProcessor.read_csv_stream(FileProcessor._upload_stream(file))
+        return FileProcessor._process_dataframe(df), encoding, delimiter
+    
+    @staticmethod
+    async def process_excel_file(file: UploadFile) -> pd.DataFrame:
+        """Process uploaded Excel file and return a columnar frame of anomaly data
+        
+        Parsed in a worker thread, like CSV uploads.
+        """
         try:
-            content = await file.read()
-            df = pd.read_excel(io.BytesIO(content))
-            return FileProcessor._process_dataframe(df)
+            with span("parse", format="excel") as parse_span:
+                df = await asyncio.to_thread(profiled(FileProcessor._read_excel_upload), file)
+                parse_span.set(bytes=file.size, rows=len(df))
+                return df
         except Exception as e:
             raise Exception(f"Error processing Excel file: {str(e)}")
     
     @staticmethod
-    def _process_dataframe(df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Process pandas DataFrame and extract relevant columns"""
-        # Map column names to our expected format
-        column_mapping = {
-            'Num_equipement': 'num_equipement',
-            'Systeme': 'systeme',
-            'Description': 'description',
-            'Date de détéction de l\'anomalie': 'date_detection',
-            'Description de l\'équipement': 'description_equipement',
-            'Section propriétaire': 'section_proprietaire'
-        }
+    def _read_excel_upload(file: UploadFile) -> pd.DataFrame:
+        return FileProcessor._process_dataframe(pd.read_excel(FileProcessor._upload_stream(file)))
+
+    @staticmethod
+    def read_csv_stream(stream) -> Tuple[pd.DataFrame, str, str]:
+        """Read a binary CSV stream of any common encoding and delimiter
+
+        The encoding and delimiter are sniffed from the first CSV_SNIFF_BYTES. Only the
+        mapped columns are read, as strings, with pyarrow's multi-threaded reader when
+        available. Returns the frame, the encoding and the delimiter.
+        """
+        sample = stream.read(CSV_SNIFF_BYTES)
+        stream.seek(0)
+        encoding, delimiter = FileProcessor._sniff_csv(sample)
+        header = next(csv.reader(io.StringIO(FileProcessor._decode_sample(sample, encoding)), delimiter=delimiter), [])
+        columns = FileProcessor._wanted_columns([name.lstrip('\ufeff') for name in header])
         
-        # Rename columns
-        df_renamed = df.rename(columns=column_mapping)
+        if PYARROW_AVAILABLE:
+            table = pa_csv.read_csv(
+                stream,
+                # Arrow decodes UTF-8 natively (and skips a BOM) only when it is named 'utf8',
+                # other encodings are transcoded through Python codecs
+                read_options=pa_csv.ReadOptions(
+                    encoding='utf8' if encoding in ('utf-8', 'utf-8-sig') else encoding, use_threads=True
+                ),
+                # Quoted descriptions may span several lines
+                parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=columns, column_types={name: pa.string() for name in columns}
+                )
+            )
+            return table.to_pandas(), encoding, delimiter
+        
+        df = pd.read_csv(stream, encoding=encoding, sep=delimiter, usecols=columns, dtype=str)
+        return df, encoding, delimiter
+
+    @staticmethod
+    def _sniff_csv(sample: bytes) -> Tuple[str, str]:
+        """Detect the encoding and delimiter of a CSV file from a sample of its start"""
+        if sample.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        else:
+            try:
+                # The sample may end in the middle of a multi-byte character
+                codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+                encoding = 'utf-8'
+            except UnicodeDecodeError:
+                best = detect_charset(sample, cp_isolation=CSV_ENCODINGS).best() if CHARSET_NORMALIZER_AVAILABLE else None
+                encoding = best.encoding if best is not None else CSV_FALLBACK_ENCODING
+        
+        text = FileProcessor._decode_sample(sample, encoding)
+        # Sniff on whole lines only
+        lines = text.splitlines()[:-1] or text.splitlines()
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(lines), delimiters=CSV_DELIMITERS).delimiter
+        except csv.Error:
+            # Fall back to the most frequent candidate in the header line
+            header = lines[0] if lines else ''
+            delimiter = max(CSV_DELIMITERS, key=header.count) if header else ','
+            delimiter = delimiter if header.count(delimiter) else ','
+        return encoding, delimiter
+
+    @staticmethod
+    def _decode_sample(sample: bytes, encoding: str) -> str:
+        return codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+
+    @staticmethod
+    def spool_upload_to_path(file: UploadFile) -> str:
+        """Copy an upload to a named temporary file that worker processes can open
+
+        The caller deletes the file when done.
+        """
+        suffix = os.path.splitext(file.filename or '')[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as handle:
+            shutil.copyfileobj(FileProcessor._upload_stream(file), handle)
+            return handle.name
+
+    @staticmethod
+    def excel_sheet_names(path: str) -> List[str]:
+        with pd.ExcelFile(path) as workbook:
+            return [str(name) for name in workbook.sheet_names]
+
+    @staticmethod
+    async def process_excel_sheet(path: str, sheet_name: str) -> pd.DataFrame:
+        """Parse one sheet of a workbook without blocking the event loop"""
+        with span("parse", format="excel", sheet=sheet_name) as parse_span:
+            loop = asyncio.get_running_loop()
+            df = await loop.run_in_executor(_get_sheet_pool(), _read_excel_sheet, path, sheet_name)
+            parse_span.set(rows=len(df))
+            return df
+
+    @staticmethod
+    async def process_parquet_file(file: UploadFile) -> pd.DataFrame:
+        """Process uploaded Parquet file and return a columnar frame of anomaly data
+        
+        Read and converted in a worker thread, so a large upload does not hold up the event loop.
+        """
+        if not PYARROW_AVAILABLE:
+            raise Exception("Parquet support requires pyarrow. Install with: pip install pyarrow")
+        try:
+            with span("parse", format="parquet") as parse_span:
+                df = await asyncio.to_thread(profiled(FileProcessor._read_parquet_upload), file)
+                parse_span.set(bytes=file.size, rows=len(df))
+                return df
+        except Exception as e:
+            raise Exception(f"Error processing Parquet file: {str(e)}")
+
+    @staticmethod
+    def _read_parquet_upload(file: UploadFile) -> pd.DataFrame:
+        parquet_file = pq.ParquetFile(FileProcessor._upload_stream(file))
+        columns = FileProcessor._wanted_columns(parquet_file.schema_arrow.names)
+        return FileProcessor._process_table(parquet_file.read(columns=columns))
+
+    @staticmethod
+    async def process_arrow_file(file: UploadFile) -> pd.DataFrame:
+        """Process uploaded Arrow IPC (file or stream format) and return a columnar frame of anomaly data
         
-        # Select only the columns we need for prediction
-        required_columns = ['num_equipement', 'systeme', 'description']
-        optional_columns = ['date_detection', 'description_equipement', 'section_proprietaire']
+        Read and converted in a worker thread, like Parquet uploads.
+        """
+        if not PYARROW_AVAILABLE:
+            raise Exception("Arrow support requires pyarrow. Install with: pip install pyarrow")
+        try:
+            with span("parse", format="arrow") as parse_span:
+                df = await asyncio.to_thread(profiled(FileProcessor._read_arrow_upload), file)
+                parse_span.set(bytes=file.size, rows=len(df))
+                return df
+        except Exception as e:
+            raise Exception(f"Error processing Arrow file: {str(e)}")
+
+    @staticmethod
+    def _read_arrow_upload(file: UploadFile) -> pd.DataFrame:
+        try:
+            table = pa_ipc.open_file(FileProcessor._upload_stream(file)).read_all()
+        except pa.ArrowInvalid:
+            # Not the random-access file format, try the streaming format
+            table = pa_ipc.open_stream(FileProcessor._upload_stream(file)).read_all()
+        # Selecting columns on the table is zero-copy
+        return FileProcessor._process_table(table.select(FileProcessor._wanted_columns(table.schema.names)))
+
+    @staticmethod
+    async def process_upload(file: UploadFile) -> pd.DataFrame:
+        """Read an uploaded file with the reader matching its extension"""
+        filename = (file.filename or '').lower()
+        if filename.endswith('.csv'):
+            return await FileProcessor.process_csv_file(file)
+        if filename.endswith(('.xlsx', '.xls')):
+            return await FileProcessor.process_excel_file(file)
+        if filename.endswith('.parquet'):
+            return await FileProcessor.process_parquet_file(file)
+        if filename.endswith(('.arrow', '.feather', '.ipc')):
+            return await FileProcessor.process_arrow_file(file)
+        raise ValueError("File must be a CSV, Excel, Parquet or Arrow IPC file")
+
+    @staticmethod
+    def _upload_stream(file: UploadFile):
+        """The upload's spooled file, rewound, so readers can stream it instead of copying it into memory"""
+        file.file.seek(0)
+        return file.file
+
+    @staticmethod
+    def _wanted_columns(available: List[str]) -> List[str]:
+        """Return the source columns worth reading, in either source or canonical naming"""
+        wanted = set(FileProcessor.COLUMN_MAPPING) | set(FileProcessor.COLUMN_MAPPING.values())
+        return [name for name in available if name in wanted]
+
+    @staticmethod
+    def _process_table(table: "pa.Table") -> pd.DataFrame:
+        """Convert an Arrow table to a frame with our canonical columns"""
+        return FileProcessor._process_dataframe(table.to_pandas())
+    
+    @staticmethod
+    def _process_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+        """Process pandas DataFrame and extract relevant columns"""
+        # Rename columns
+        df_renamed = df.rename(columns=FileProcessor.COLUMN_MAPPING)
         
         # Check if required columns exist
-        missing_columns = [col for col in required_columns if col not in df_renamed.columns]
+        missing_columns = [col for col in FileProcessor.REQUIRED_COLUMNS if col not in df_renamed.columns]
         if missing_columns:
             raise ValueError(f"Missing required columns: {missing_columns}")
         
-        # Select available columns
-        available_columns = required_columns + [col for col in optional_columns if col in df_renamed.columns]
-        df_selected = df_renamed[available_columns]
+        # Select available columns, cleaning is left to validate_frame
+        available_columns = FileProcessor.REQUIRED_COLUMNS + [
+            col for col in FileProcessor.OPTIONAL_COLUMNS if col in df_renamed.columns
+        ]
+        return df_renamed[available_columns]
+
+    @staticmethod
+    def validate_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """Validate and clean a whole batch column by column
+
+        Returns the valid rows, renumbered from 0, and a report of the rejected rows
+        with their position in the input batch and the reasons they were rejected.
+        """
+        checks = []
+        cleaned = {}
+        
+        # Required fields must be present and non-blank once trimmed
+        for col in FileProcessor.REQUIRED_COLUMNS:
+            cleaned[col] = FileProcessor._clean_text_column(df, col)
+            checks.append((cleaned[col] == '', f"Missing required field: {col}"))
         
-        # Fill NaN values
-        df_selected = df_selected.fillna("")
+        # Dates are coerced to YYYY-MM-DD, anything unparseable is left blank like a missing date
+        cleaned['date_detection'] = FileProcessor._clean_date_column(df, 'date_detection')
         
-        # Convert to list of dictionaries
-        return df_selected.to_dict('records')
-    
+        for col in ('description_equipement', 'section_proprietaire'):
+            cleaned[col] = FileProcessor._clean_text_column(df, col)
+        
+        cleaned_df = pd.DataFrame(cleaned, index=df.index)
+        if not len(cleaned_df):
+            return cleaned_df.reset_index(drop=True), []
+        
+        rejected_mask = np.logical_or.reduce([mask.to_numpy() for mask, _ in checks])
+        rejected_rows = [
+            {
+                'row': int(position),
+                'reasons': [reason for mask, reason in checks if mask.iat[position]]
+            }
+            for position in np.flatnonzero(rejected_mask)
+        ]
+        return cleaned_df[~rejected_mask].reset_index(drop=True), rejected_rows
+
     @staticmethod
-    def validate_anomaly_data(data: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate and clean single anomaly data"""
-        required_fields = ['num_equipement', 'systeme', 'description']
+    def _clean_text_column(df: pd.DataFrame, col: str) -> pd.Series:
+        """Coerce a column to trimmed strings, with blanks for missing values"""
+        if col not in df.columns:
+            return pd.Series('', index=df.index, dtype=object)
         
-        # Check required fields
-        for field in required_fields:
-            if field not in data or not data[field]:
-                raise ValueError(f"Missing required field: {field}")
+        values = df[col]
+        if pd.api.types.is_float_dtype(values):
+            # Spreadsheet readers turn integer codes such as equipment numbers into floats
+            integral = values.notna() & (values % 1 == 0)
+            text = values.astype(object).where(~integral, values.where(integral, 0).astype('int64'))
+        else:
+            text = values
+        return text.where(text.notna(), '').astype(str).str.strip().astype(object)
+
+    @staticmethod
+    def _clean_date_column(df: pd.DataFrame, col: str) -> pd.Series:
+        """Coerce a column to YYYY-MM-DD strings, with blanks for values that are not dates"""
+        if col not in df.columns:
+            return pd.Series('', index=df.index, dtype=object)
         
-        # Clean and return validated data
-        return {
-            'num_equipement': str(data['num_equipement']).strip(),
-            'systeme': str(data['systeme']).strip(),
-            'description': str(data['description']).strip(),
-            'date_detection': data.get('date_detection', ''),
-            'description_equipement': data.get('description_equipement', ''),
-            'section_proprietaire': data.get('section_proprietaire', '')
-        }
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            parsed = values
+        else:
+            text = FileProcessor._clean_text_column(df, col)
+            blank = text == ''
+            # ISO dates first, so day-first parsing of French dates cannot swap their month and day
+            parsed = pd.to_datetime(text.where(~blank), errors='coerce', format='ISO8601')
+            day_first = pd.to_datetime(text.where(~blank & parsed.isna()), errors='coerce', dayfirst=True, format='mixed')
+            parsed = parsed.fillna(day_first)
+        return parsed.dt.strftime('%Y-%m-%d').fillna('').astype(object)
+    
+    @staticmethod
+    def validate_single(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Validate and clean one anomaly with the same rules as a batch
+
+        Runs ``validate_frame`` on a one-row frame, so single anomalies are trimmed and
+        their dates coerced exactly like batch rows. Returns the cleaned anomaly, or None
+        and the rejection report of row 0.
+        """
+        columns = FileProcessor.REQUIRED_COLUMNS + FileProcessor.OPTIONAL_COLUMNS
+        valid_df, rejected_rows = FileProcessor.validate_frame(
+            pd.DataFrame({col: [data.get(col)] for col in columns}, dtype=object)
+        )
+        if rejected_rows:
+            return None, rejected_rows
+        return valid_df.iloc[0].to_dict(), []
     
     @staticmethod
     def prepare_for_database(anomaly_data: Dict[str, Any], predictions: Dict[str, int]) -> Dict[str, Any]:
@@ -93,5 +400,40 @@ class FileProcessor:
             'ai_fiabilite_integrite_score': predictions['ai_fiabilite_integrite_score'],
             'ai_disponibilite_score': predictions['ai_disponibilite_score'],
             'ai_process_safety_score': predictions['ai_process_safety_score'],
-            'ai_criticality_level': predictions['ai_criticality_level']
+            'ai_criticality_level': predictions['ai_criticality_level'],
+            'ai_scorer': predictions.get('ai_scorer')
         }
+
+    @staticmethod
+    def prepare_frame_for_database(df: pd.DataFrame, scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Prepare a columnar batch and its score arrays for database insertion"""
+        def column(name: str) -> List[Any]:
+            return df[name].tolist() if name in df.columns else [''] * len(df)
+
+        rows = zip(
+            column('num_equipement'),
+            column('description'),
+            column('section_proprietaire'),
+            column('systeme'),
+            scores['ai_fiabilite_integrite_score'].tolist(),
+            scores['ai_disponibilite_score'].tolist(),
+            scores['ai_process_safety_score'].tolist(),
+            scores['ai_criticality_level'].tolist(),
+            scores['ai_scorer'].tolist() if 'ai_scorer' in scores else [None] * len(df),
+        )
+        return [
+            {
+                'equipement_id': equipement,
+                'description': description,
+                'service': service,
+                'system_id': system,
+                'status': 'nouvelle',
+                'source_origine': 'api',
+                'ai_fiabilite_integrite_score': fiabilite,
+                'ai_disponibilite_score': disponibilite,
+                'ai_process_safety_score': process_safety,
+                'ai_criticality_level': criticality,
+                'ai_scorer': scorer
+            }
+            for equipement, description, service, system, fiabilite, disponibilite, process_safety, criticality, scorer in rows
+        ]
@@ -0,0 +1,51 @@
+"""Production serving: gunicorn managing uvicorn workers
+
+    gunicorn main:app -c gunicorn.conf.py
+
+The app and the model are imported once in the master process (preload) and the workers
+are forked from it, so they share the model's memory copy-on-write. Everything that holds
+a connection, a thread or a process pool (the Supabase client, the SQLite stores, the
+scoring threads, the Excel sheet pool) is created lazily inside each worker.
+"""
+import gc
+import multiprocessing
+import os
+
+from uvicorn_worker import UvicornWorker
+
+class TamsUvicornWorker(UvicornWorker):
+    # uvloop and httptools explicitly: a missing one should fail the deploy, not fall back silently
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+bind = os.environ.get("TAMS_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+# Scoring is CPU-bound, so one worker per core unless set
+workers = int(os.environ.get("TAMS_WORKERS") or multiprocessing.cpu_count())
+# Read by the preloaded app, which shares the cores' scoring slots among the workers
+os.environ["TAMS_WORKERS"] = str(workers)
+worker_class = TamsUvicornWorker
+preload_app = True
+
+# Recycle workers after this many requests (plus jitter, so they do not all restart at
+# once) to bound slow memory growth from pandas and the parsers
+max_requests = int(os.environ.get("TAMS_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("TAMS_MAX_REQUESTS_JITTER", "1000"))
+
+# Generous, so a worker busy with a large import is not taken for a hung one
+timeout = int(os.environ.get("TAMS_WORKER_TIMEOUT", "300"))
+graceful_timeout = int(os.environ.get("TAMS_GRACEFUL_TIMEOUT", "60"))
+# Idle keep-alive longer than a load balancer's idle timeout (60 s on most), so the
+# balancer closes the connection first and never sends on one we just closed
+keepalive = int(os.environ.get("TAMS_KEEPALIVE", "75"))
+backlog = int(os.environ.get("TAMS_BACKLOG", "2048"))
+
+accesslog = os.environ.get("TAMS_ACCESS_LOG") or None
+errorlog = "-"
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+def when_ready(server):
+    # The app is loaded and no worker is forked yet: move everything allocated so far out
+    # of the collector's reach, so collections in the workers do not write to (and copy)
+    # the pages they share with the master
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Preloaded app, {gc.get_freeze_count()} objects frozen before forking {workers} workers")
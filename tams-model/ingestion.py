@@ -0,0 +1,200 @@
+import time
+from contextlib import closing
+from typing import List, Dict, Any
+
+import numpy as np
+import pandas as pd
+
+from predictor import predictor
+from file_processor import FileProcessor
+from dedup_index import DEDUP_ENABLED, dedup_index, fingerprint_frame
+from near_duplicates import NEARDUP_ENABLED, near_duplicate_index, minhash_signatures
+from aggregates import criticality_aggregates
+from scheduler import LANE_BULK, SCHED_BULK_SLICE_ROWS, scoring_scheduler
+from autotune import predict_tuner
+from tracing import span
+
+class ScoredBatch:
+    """Database rows for a validated and predicted batch, plus what was left out of it"""
+
+    def __init__(self, rows: List[Dict[str, Any]], rejected_rows: List[Dict[str, Any]],
+                 skipped: int = 0, fingerprints: List[str] = None,
+                 near_duplicates: List[Dict[str, Any]] = None, signatures=None):
+        self.rows = rows
+        self.rejected_rows = rejected_rows
+        self.skipped = skipped
+        self.fingerprints = fingerprints or []
+        # Likely duplicates of stored anomalies, by row position in the input batch
+        self.near_duplicates = near_duplicates or []
+        self.signatures = signatures
+
+def score_frame(df) -> ScoredBatch:
+    """Validate and predict a columnar batch
+
+    Returns the database rows for the valid anomalies, the validation report for the
+    rejected ones and how many were skipped as already stored. Shared by the batch,
+    file and stream endpoints and by offline jobs. Batches are bulk work, scored without
+    the interactive deadline. Predicting waits for bulk scoring slots, so call it from a
+    worker thread.
+    """
+    # Validate input data column by column
+    valid_df, rejected_rows = _validate(df)
+    if len(valid_df) == 0:
+        return ScoredBatch([], rejected_rows)
+    positions = _valid_positions(df, rejected_rows)
+    
+    # Skip anomalies we already stored, and repeats within the batch, before predicting
+    fingerprints = []
+    skipped = 0
+    if DEDUP_ENABLED:
+        with span("dedup", rows=len(valid_df)) as dedup_span:
+            fingerprints = fingerprint_frame(valid_df)
+            repeated = pd.Series(fingerprints).duplicated().to_numpy()
+            duplicate = dedup_index.find_stored(fingerprints) | repeated
+            if duplicate.any():
+                skipped = int(duplicate.sum())
+                valid_df = valid_df[~duplicate].reset_index(drop=True)
+                positions = positions[~duplicate]
+                fingerprints = [fp for fp, dup in zip(fingerprints, duplicate) if not dup]
+            dedup_span.set(skipped=skipped)
+        if len(valid_df) == 0:
+            return ScoredBatch([], rejected_rows, skipped)
+    
+    rows, near_duplicates, signatures = [], [], []
+    with closing(_bulk_slices(valid_df)) as slices:
+        for start, part in slices:
+            # Flag rows worded like an anomaly already stored on the same equipment
+            part_near_duplicates, part_signatures = _find_near_duplicates(part, positions[start:start + len(part)])
+            near_duplicates.extend(part_near_duplicates)
+            if part_signatures is not None:
+                signatures.append(part_signatures)
+            
+            # Make predictions straight from the columns
+            scores = predictor.predict_frame(part)
+            
+            # Prepare data for database
+            with span("prepare_rows", rows=len(part)):
+                rows.extend(FileProcessor.prepare_frame_for_database(part, scores))
+    signatures = np.concatenate(signatures) if signatures else None
+    return ScoredBatch(rows, rejected_rows, skipped, fingerprints, near_duplicates, signatures)
+
+def find_single_near_duplicates(anomaly_data: Dict[str, Any]):
+    """Near-duplicate candidates of one validated anomaly, and its signature to index once stored"""
+    if not NEARDUP_ENABLED:
+        return [], None
+    signatures = minhash_signatures([anomaly_data['description']])
+    return near_duplicate_index.find_candidates([anomaly_data['num_equipement']], signatures)[0], signatures
+
+def record_single_stored(anomaly_data: Dict[str, Any], signatures, anomaly_id: str) -> None:
+    """Index a stored single anomaly for near-duplicate detection"""
+    if NEARDUP_ENABLED and signatures is not None:
+        near_duplicate_index.add([anomaly_data['num_equipement']], signatures, [anomaly_id])
+
+def signatures_for_rows(rows: List[Dict[str, Any]]):
+    """Near-duplicate signatures of database rows, to index them once stored"""
+    if not NEARDUP_ENABLED or not rows:
+        return None
+    return minhash_signatures([row['description'] for row in rows])
+
+def _bulk_slices(valid_df):
+    """Split a batch into slices sized by ``predict_tuner``, yielding each slice and where it starts
+
+    Each slice is worked on in a bulk scoring slot, held until the next slice is requested,
+    so interactive requests get in between slices. Consume it under ``closing()``, so an
+    error in the loop body releases the slot straight away rather than when the generator
+    is collected. The time to the next request is what
+    the slice took, which the tuner sizes the following slices from.
+    """
+    row_bytes = _row_bytes(valid_df)
+    start = 0
+    while start < len(valid_df):
+        size = predict_tuner.size(row_bytes)
+        with scoring_scheduler.slot(LANE_BULK):
+            part = valid_df.iloc[start:start + size].reset_index(drop=True)
+            started = time.perf_counter()
+            yield start, part
+            predict_tuner.record(len(part), time.perf_counter() - started, size)
+        start += size
+
+def _row_bytes(valid_df, sample: int = 1000) -> float:
+    """Memory per row of a batch, measured on its first rows"""
+    head = valid_df.head(sample)
+    return float(head.memory_usage(deep=True, index=False).sum()) / len(head) if len(head) else 0.0
+
+def _valid_positions(df, rejected_rows: List[Dict[str, Any]]) -> np.ndarray:
+    """Positions in the input batch of the rows that passed validation"""
+    return np.setdiff1d(np.arange(len(df)), [rejected['row'] for rejected in rejected_rows])
+
+def _find_near_duplicates(valid_df, positions: np.ndarray):
+    if not NEARDUP_ENABLED or len(valid_df) == 0:
+        return [], None
+    with span("near_duplicates", rows=len(valid_df)) as near_span:
+        signatures = minhash_signatures(valid_df['description'].tolist())
+        candidates = near_duplicate_index.find_candidates(valid_df['num_equipement'].tolist(), signatures)
+        near_duplicates = [
+            {'row': int(position), 'candidates': row_candidates}
+            for position, row_candidates in zip(positions, candidates) if row_candidates
+        ]
+        near_span.set(flagged=len(near_duplicates))
+    return near_duplicates, signatures
+
+def _validate(df):
+    with span("validate", rows=len(df)) as validate_span:
+        valid_df, rejected_rows = FileProcessor.validate_frame(df)
+        validate_span.set(valid=len(valid_df), rejected=len(rejected_rows))
+    return valid_df, rejected_rows
+
+def record_stored(scored: ScoredBatch, stored_anomalies: List[Dict[str, Any]] = None) -> None:
+    """Remember a scored batch as stored so that re-imports skip it
+
+    With the stored anomalies (in the order of ``scored.rows``), they are also added to
+    the criticality aggregates and their descriptions indexed for near-duplicate detection.
+    This is bulk work done in bulk scoring slots, so call it from a worker thread.
+    """
+    with scoring_scheduler.slot(LANE_BULK):
+        if DEDUP_ENABLED:
+            dedup_index.add(scored.fingerprints)
+        criticality_aggregates.record(stored_anomalies)
+    if NEARDUP_ENABLED and scored.signatures is not None and stored_anomalies and len(stored_anomalies) == len(scored.rows):
+        for start in range(0, len(scored.rows), SCHED_BULK_SLICE_ROWS):
+            stop = start + SCHED_BULK_SLICE_ROWS
+            with scoring_scheduler.slot(LANE_BULK):
+                near_duplicate_index.add(
+                    [row['equipement_id'] for row in scored.rows[start:stop]], scored.signatures[start:stop],
+                    [anomaly['id'] for anomaly in stored_anomalies[start:stop]]
+                )
+
+def preview_frame(df) -> Dict[str, Any]:
+    """Validate and predict a columnar batch without storing it
+
+    Scores come back as parallel arrays, one entry per valid row, with ``rows`` giving
+    each entry's position in the input. Rows that would be skipped as already stored
+    are scored too and flagged in ``already_stored``. Like ``score_frame``, call it from
+    a worker thread.
+    """
+    valid_df, rejected_rows = _validate(df)
+    rows = _valid_positions(df, rejected_rows)
+    
+    slices, near_duplicates = [], []
+    with closing(_bulk_slices(valid_df)) as parts:
+        for start, part in parts:
+            slices.append(predictor.predict_frame(part))
+            near_duplicates.extend(_find_near_duplicates(part, rows[start:start + len(part)])[0])
+    if slices:
+        scores = {name: np.concatenate([part[name] for part in slices]) for name in slices[0]}
+    else:
+        scores = predictor.predict_frame(valid_df)
+    if DEDUP_ENABLED and len(valid_df):
+        already_stored = dedup_index.find_stored(fingerprint_frame(valid_df))
+    else:
+        already_stored = np.zeros(len(valid_df), dtype=bool)
+    
+    preview = {'total_processed': len(df), 'rows': rows.tolist()}
+    preview.update({name: values.tolist() for name, values in scores.items()})
+    preview.update({
+        'already_stored': already_stored.tolist(),
+        'near_duplicates': near_duplicates,
+        'total_rejected': len(rejected_rows),
+        'rejected_rows': rejected_rows
+    })
+    return preview
@@ -1,17 +1,38 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Body, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-from typing import List
+from typing import List, Dict, Any, Optional
+import pandas as pd
+import asyncio
+import time
 import uuid
 import os
 import warnings
 
 warnings.filterwarnings('ignore', category=UserWarning)
 
-from models import AnomalyInput, StorageResponse, BatchStorageResponse
+from models import (
+    AnomalyInput, StorageResponse, BatchStorageResponse, ColumnarPredictionResponse,
+    ExcelStorageResponse, SheetStorageResult, ImportStatusResponse
+)
 from predictor import predictor
 from database import supabase_client
-from file_processor import FileProcessor
+from file_processor import FileProcessor, shutdown_sheet_pool
+from ingestion import (
+    score_frame, record_stored, preview_frame, find_single_near_duplicates, record_single_stored
+)
+from streaming import NDJSONStreamingResponse, stream_ingest
+from outbox import OUTBOX_ENABLED, anomaly_outbox
+from profiling import ProfilingMiddleware, profile_requested, profile_path, profiled
+from tracing import TracingMiddleware
+from admission import AdmissionMiddleware, import_gate
+from dedup_index import DEDUP_ENABLED, dedup_index
+from near_duplicates import NEARDUP_ENABLED, near_duplicate_index
+from aggregates import DIMENSIONS, criticality_aggregates
+from import_checkpoints import import_checkpoints
+from scheduler import LANE_INTERACTIVE, scoring_scheduler
+from autotune import predict_tuner
 
 app = FastAPI(
     title="TAMS Anomaly Storage API",
@@ -23,7 +44,7 @@ app = FastAPI(
     ### Main Features:
     * **Single Anomaly Storage**: Store individual anomalies with AI predictions
     * **Batch Storage**: Process multiple anomalies at once
-    * **File Upload**: Support for CSV and Excel file processing
+    * **File Upload**: Support for CSV, Excel, Parquet and Arrow IPC file processing
     * **Database Integration**: Automatic storage in Supabase
     * **AI Scoring**: Predicts Fiabilité Intégrité, Disponibilité, and Process Safety scores
     
@@ -54,6 +75,9 @@ app = FastAPI(
     openapi_url="/openapi.json",  # OpenAPI schema
 )
 
+# Upload size limits and bounded import concurrency, inside CORS so refusals keep CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -63,11 +87,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling, enabled by setting TAMS_PROFILE_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
+# Root trace span per request, trace ID returned in X-Trace-Id
+app.add_middleware(TracingMiddleware)
+
 # Mount static files
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
+@app.on_event("startup")
+async def start_outbox_drainer():
+    if OUTBOX_ENABLED:
+        anomaly_outbox.start()
+    criticality_aggregates.start()
+    # Load the indexes before taking traffic, so the first imports of every worker
+    # do not wait for them
+    if DEDUP_ENABLED:
+        await asyncio.to_thread(dedup_index.load)
+    if NEARDUP_ENABLED:
+        await asyncio.to_thread(near_duplicate_index.load)
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    if OUTBOX_ENABLED:
+        await anomaly_outbox.stop()
+    await criticality_aggregates.stop()
+    await supabase_client.close()
+    shutdown_sheet_pool()
+    predictor.shutdown()
+    scoring_scheduler.shutdown()
+
 @app.get("/", tags=["Health"])
 async def root():
     """
@@ -77,38 +129,242 @@ async def root():
     """
     return {"message": "TAMS Anomaly Storage API is running", "version": "1.0.0"}
 
+@app.get("/stats/db", tags=["Monitoring"])
+async def database_stats():
+    """
+    Database connection pool statistics
+    
+    Pool configuration, in-flight and saturated requests, connection reuse and
+    average pool wait / request latency for the Supabase REST client.
+    """
+    return supabase_client.stats()
+
+@app.get("/stats/outbox", tags=["Monitoring"])
+async def outbox_stats():
+    """
+    Write-behind outbox statistics
+    
+    Number of anomalies waiting to be flushed to the database, age of the oldest one
+    (flush lag), dead letters and flush history. Only populated when `TAMS_OUTBOX_ENABLED` is set.
+    """
+    return await asyncio.to_thread(anomaly_outbox.stats)
+
+@app.get("/stats/admission", tags=["Monitoring"])
+async def admission_stats():
+    """
+    Import admission statistics
+    
+    Imports running and waiting for a slot, and how many were refused as too large (413),
+    because the queue was full (429) or after waiting too long for a slot (503).
+    """
+    return import_gate.stats()
+
+@app.get("/stats/predictor", tags=["Monitoring"])
+async def predictor_stats():
+    """
+    Scoring statistics
+    
+    Rows scored by the model and by the rule-based fallback, why the fallback was used
+    (no model, deadline missed, breaker open, model error), the latency budget and the
+    circuit breaker state.
+    """
+    return predictor.stats()
+
+@app.get("/stats/scheduler", tags=["Monitoring"])
+async def scheduler_stats():
+    """
+    Priority scheduling statistics
+    
+    Scoring and database slots, and per lane (interactive requests, bulk imports) the work
+    running and queued, the age of the oldest queued unit and the average and maximum wait.
+    """
+    return {"scoring": scoring_scheduler.stats(), "storage": supabase_client.scheduler.stats()}
+
+@app.get("/stats/batch-sizes", tags=["Monitoring"])
+async def batch_size_stats():
+    """
+    Batch size autotuning statistics
+    
+    The rows per bulk prediction slice and per database insert currently chosen, their
+    bounds, the throughput and latency observed and the adjustments made so far.
+    """
+    return {"predict": predict_tuner.stats(), "insert": supabase_client.insert_tuner.stats()}
+
+@app.get("/stats/near-duplicates", tags=["Monitoring"])
+async def near_duplicate_stats():
+    """
+    Near-duplicate index statistics
+    
+    Signatures held in memory, equipment partitions and LSH buckets, evictions past the
+    memory bounds, and the banding and similarity threshold in use.
+    """
+    return near_duplicate_index.stats()
+
+@app.get("/stats/criticality", tags=["Monitoring"])
+async def criticality_stats(
+    dimension: Optional[str] = Query(None, description=f"Only this grouping: one of {', '.join(DIMENSIONS)}"),
+    limit: Optional[int] = Query(None, ge=1, description="Only the largest groups of each dimension")
+):
+    """
+    Criticality distribution per system, equipment and service
+    
+    Anomaly counts, score histograms and high-criticality counts (`ai_criticality_level` at
+    or above `TAMS_HIGH_CRITICALITY_LEVEL`), maintained as anomalies are stored instead of
+    scanning the anomalies table. Groups are sorted by count.
+    """
+    if dimension is not None and dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension: {dimension}, expected one of {list(DIMENSIONS)}")
+    return criticality_aggregates.stats(dimension, limit)
+
+@app.get("/debug/profiles/{profile_id}", tags=["Monitoring"])
+async def download_profile(profile_id: str, request: Request):
+    """
+    Download a saved request profile
+    
+    Requires the same admin token as profiling itself (`X-TAMS-Profile` header or
+    `profile` query parameter). The ID is the one returned in the `X-Profile-Id` header.
+    """
+    if not profile_requested(request.scope):
+        raise HTTPException(status_code=403, detail="Profiling is disabled or the admin token is invalid")
+    path = profile_path(os.path.basename(profile_id))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=os.path.basename(path))
+
 @app.post("/store/single", response_model=StorageResponse, tags=["Data Storage"])
 async def store_single_anomaly(anomaly: AnomalyInput):
     try:
-        # Validate input data
-        anomaly_data = FileProcessor.validate_anomaly_data(anomaly.dict())
-        
-        # Make prediction
-        predictions = predictor.predict_single(anomaly_data)
+        # Validate input data, with the same rules as the batch paths
+        anomaly_data, rejected_rows = FileProcessor.validate_single(anomaly.dict())
+        if anomaly_data is None:
+            # Same string detail as before, with the rejection report next to it
+            return JSONResponse(
+                status_code=400,
+                content={"detail": "; ".join(rejected_rows[0]['reasons']), "rejected_rows": rejected_rows}
+            )
+        
+        # Make prediction, ahead of any bulk scoring waiting for a slot
+        predictions = await scoring_scheduler.run(LANE_INTERACTIVE, profiled(predictor.predict_single), anomaly_data)
+        # The near-duplicate index is SQLite, looked up outside the scoring slot
+        near_duplicates, signatures = await asyncio.to_thread(profiled(find_single_near_duplicates), anomaly_data)
         
         # Prepare data for database
         db_data = FileProcessor.prepare_for_database(anomaly_data, predictions)
         
+        if OUTBOX_ENABLED:
+            # Acknowledge once durably queued, the drainer writes it to the database
+            anomaly_id = await asyncio.to_thread(anomaly_outbox.enqueue, db_data)
+            await asyncio.to_thread(profiled(record_single_stored), anomaly_data, signatures, anomaly_id)
+            return StorageResponse(
+                success=True,
+                message="Anomaly accepted for storage",
+                anomaly_id=anomaly_id,
+                near_duplicates=near_duplicates
+            )
+        
         # Store in database
         stored_anomaly = await supabase_client.create_anomaly(db_data)
         
         if not stored_anomaly:
             raise HTTPException(status_code=500, detail="Failed to store anomaly in database")
+        await asyncio.to_thread(profiled(record_single_stored), anomaly_data, signatures, stored_anomaly['id'])
+        criticality_aggregates.record([stored_anomaly])
         
         # Return simple confirmation
         return StorageResponse(
             success=True,
             message="Anomaly successfully stored",
-            anomaly_id=stored_anomaly['id']
+            anomaly_id=stored_anomaly['id'],
+            near_duplicates=near_duplicates
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _import_failure(progress: Dict[str, Any]) -> str:
+    return (
+        f"Import failed after {progress['committed_chunks']} of {progress['total_chunks']} chunks: "
+        f"{progress['last_error']}. Resume it with POST /imports/{progress['import_batch_id']}/resume"
+    )
+
+def _import_response(progress: Dict[str, Any], source: str = "") -> BatchStorageResponse:
+    """Response for a checkpointed import, or a 500 saying how far it got and how to resume"""
+    if progress['status'] == 'failed':
+        raise HTTPException(status_code=500, detail={
+            "message": _import_failure(progress),
+            "import_batch_id": progress['import_batch_id'],
+            "committed_chunks": progress['committed_chunks'],
+            "total_chunks": progress['total_chunks'],
+            "stored_rows": progress['stored_rows']
+        })
+    return BatchStorageResponse(
+        success=True,
+        message=f"{progress['stored_rows']} anomalies successfully stored{source}",
+        total_stored=progress['stored_rows'],
+        import_batch_id=progress['import_batch_id'],
+        total_skipped=progress['total_skipped'],
+        total_rejected=progress['total_rejected'],
+        rejected_rows=progress['rejected_rows'],
+        near_duplicates=progress['near_duplicates']
+    )
+
+async def _store_frame(df, filename: Optional[str] = None, source: str = "") -> BatchStorageResponse:
+    """Validate, predict and store a columnar batch
+    
+    Shared by the batch and file endpoints. Rows failing validation are reported in the
+    response, rows that were already stored are skipped and the others are stored. File
+    uploads (with a filename) are checkpointed imports that can be resumed if they fail,
+    direct batches only get a batch ID on their anomalies.
+    """
+    scored = await asyncio.to_thread(profiled(score_frame), df)
+    
+    if not scored.rows:
+        if scored.skipped:
+            # Everything valid was already stored, which is not an error on re-import
+            return BatchStorageResponse(
+                success=True,
+                message=f"No new anomalies{source}, {scored.skipped} already stored",
+                total_stored=0,
+                total_skipped=scored.skipped,
+                total_rejected=len(scored.rejected_rows),
+                rejected_rows=scored.rejected_rows
+            )
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "No valid anomaly data found", "rejected_rows": scored.rejected_rows}
+        )
+    
+    if filename:
+        # Stored in checkpointed chunks under a new import batch
+        return _import_response(await import_checkpoints.start(scored, filename, len(df)), source)
+    
+    # Store in database
+    batch_id = str(uuid.uuid4())
+    stored_anomalies = await supabase_client.create_anomalies_batch(scored.rows, batch_id)
+    
+    if not stored_anomalies:
+        raise HTTPException(status_code=500, detail="Failed to store anomalies in database")
+    await asyncio.to_thread(profiled(record_stored), scored, stored_anomalies)
+    
+    # Return simple confirmation
+    return BatchStorageResponse(
+        success=True,
+        message=f"{len(stored_anomalies)} anomalies successfully stored{source}",
+        total_stored=len(stored_anomalies),
+        total_skipped=scored.skipped,
+        total_rejected=len(scored.rejected_rows),
+        rejected_rows=scored.rejected_rows,
+        near_duplicates=scored.near_duplicates
+    )
+
 @app.post("/store/batch", response_model=BatchStorageResponse, tags=["Data Storage"])
-async def store_batch_anomalies(anomalies: List[AnomalyInput]):
+async def store_batch_anomalies(
+    anomalies: List[Dict[str, Any]] = Body(..., examples=[[AnomalyInput.Config.json_schema_extra["example"]]])
+):
     """
     Store multiple anomalies with AI predictions in batch
     
@@ -121,6 +377,7 @@ async def store_batch_anomalies(anomalies: List[AnomalyInput]):
     
     ### Output:
     Simple confirmation with total count and batch information.
+    Rows that fail validation are listed in `rejected_rows` and the others are still stored.
     
     ### Use Cases:
     - Bulk processing of maintenance reports
@@ -132,41 +389,38 @@ async def store_batch_anomalies(anomalies: List[AnomalyInput]):
         if not anomalies:
             raise HTTPException(status_code=400, detail="No anomalies provided")
         
-        # Validate input data
-        validated_data = []
-        for anomaly in anomalies:
-            validated_data.append(FileProcessor.validate_anomaly_data(anomaly.dict()))
-        
-        # Make predictions
-        predictions_list = predictor.predict_batch(validated_data)
-        
-        # Prepare data for database
-        db_data_list = []
-        for anomaly_data, predictions in zip(validated_data, predictions_list):
-            db_data = FileProcessor.prepare_for_database(anomaly_data, predictions)
-            db_data_list.append(db_data)
-        
-        # Create batch ID
-        batch_id = str(uuid.uuid4())
-        
-        # Store in database
-        stored_anomalies = await supabase_client.create_anomalies_batch(db_data_list, batch_id)
-        
-        if not stored_anomalies:
-            raise HTTPException(status_code=500, detail="Failed to store anomalies in database")
-        
-        # Return simple confirmation
-        return BatchStorageResponse(
-            success=True,
-            message=f"{len(stored_anomalies)} anomalies successfully stored",
-            total_stored=len(stored_anomalies)
-        )
+        return await _store_frame(pd.DataFrame(anomalies))
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/store/stream", tags=["Data Storage"], response_class=NDJSONStreamingResponse)
+async def store_stream_anomalies(request: Request):
+    """
+    Store a continuous NDJSON feed of anomalies
+    
+    Send one anomaly object per line (`Content-Type: application/x-ndjson`, chunked
+    transfer encoding is fine). The body is read incrementally and scored and stored in
+    rolling micro-batches, so the feed never has to be held in memory as a whole.
+    
+    ### Output:
+    One NDJSON acknowledgement per micro-batch, streamed as soon as it is stored:
+    `{"chunk": 0, "received": 500, "stored_ids": [...], "rejected_rows": [...], "error": null}`
+    
+    followed by a final summary line with `"done": true` and the totals.
+    Rejected rows are numbered by their position in the stream. A micro-batch that fails to
+    store reports its `error` and the stream moves on to the next one.
+    
+    ### Backpressure:
+    Only a couple of parsed micro-batches are buffered ahead of scoring. Beyond that the
+    server stops reading the body, so a fast producer is slowed down by TCP flow control.
+    """
+    return NDJSONStreamingResponse(stream_ingest(request))
+
 @app.post("/store/file/csv", response_model=BatchStorageResponse, tags=["File Upload"])
 async def store_from_csv_file(file: UploadFile = File(...)):
     """
@@ -188,7 +442,7 @@ async def store_from_csv_file(file: UploadFile = File(...)):
     - Automatic data validation and cleaning
     - Batch processing for efficiency
     - Import tracking with unique batch ID
-    - Error handling for malformed data
+    - Error handling for malformed data, with a report of the rejected rows
     
     ### Response:
     Simple confirmation with total count and batch ID for tracking.
@@ -198,42 +452,86 @@ async def store_from_csv_file(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="File must be a CSV file")
         
         # Process file
-        anomalies_data = await FileProcessor.process_csv_file(file)
-        
-        if not anomalies_data:
-            raise HTTPException(status_code=400, detail="No valid anomaly data found in file")
-        
-        # Make predictions
-        predictions_list = predictor.predict_batch(anomalies_data)
-        
-        # Prepare data for database
-        db_data_list = []
-        for anomaly_data, predictions in zip(anomalies_data, predictions_list):
-            db_data = FileProcessor.prepare_for_database(anomaly_data, predictions)
-            db_data_list.append(db_data)
-        
-        # Create batch ID
-        batch_id = await supabase_client.create_import_batch(file.filename, len(anomalies_data))
-        
-        # Store in database
-        stored_anomalies = await supabase_client.create_anomalies_batch(db_data_list, batch_id)
-        
-        if not stored_anomalies:
-            raise HTTPException(status_code=500, detail="Failed to store anomalies in database")
-        
-        # Return simple confirmation
-        return BatchStorageResponse(
-            success=True,
-            message=f"{len(stored_anomalies)} anomalies successfully stored from CSV file",
-            total_stored=len(stored_anomalies),
-            import_batch_id=batch_id
-        )
+        df = await FileProcessor.process_csv_file(file)
+        return await _store_frame(df, file.filename, " from CSV file")
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing CSV file: {str(e)}")
 
-@app.post("/store/file/excel", response_model=BatchStorageResponse, tags=["File Upload"])
-async def store_from_excel_file(file: UploadFile = File(...)):
+async def _store_sheet(path: str, sheet: str, filename: str) -> SheetStorageResult:
+    """Parse, score and store one sheet of a workbook under its own import batch"""
+    result = SheetStorageResult(sheet=sheet)
+    started = time.perf_counter()
+    try:
+        df = await FileProcessor.process_excel_sheet(path, sheet)
+        result.total_rows = len(df)
+        parsed = time.perf_counter()
+        result.parse_ms = round((parsed - started) * 1000, 1)
+        
+        # Scoring is CPU-bound, so run it off the event loop to overlap with the other sheets
+        scored = await asyncio.to_thread(profiled(score_frame), df)
+        scored_at = time.perf_counter()
+        result.score_ms = round((scored_at - parsed) * 1000, 1)
+        result.total_skipped = scored.skipped
+        result.total_rejected = len(scored.rejected_rows)
+        result.rejected_rows = scored.rejected_rows
+        
+        if scored.rows:
+            progress = await import_checkpoints.start(scored, f"{filename} [{sheet}]", len(df))
+            result.near_duplicates = scored.near_duplicates
+            result.import_batch_id = progress['import_batch_id']
+            result.total_stored = progress['stored_rows']
+            result.store_ms = round((time.perf_counter() - scored_at) * 1000, 1)
+            if progress['status'] == 'failed':
+                result.error = _import_failure(progress)
+        elif not scored.skipped:
+            result.error = "No valid anomaly data found"
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+async def _store_excel_sheets(file: UploadFile, sheets: str) -> ExcelStorageResponse:
+    """Store several sheets of a workbook in parallel, one import batch per sheet"""
+    path = await asyncio.to_thread(FileProcessor.spool_upload_to_path, file)
+    try:
+        available = await asyncio.to_thread(FileProcessor.excel_sheet_names, path)
+        if sheets.strip().lower() in ('*', 'all'):
+            selected = available
+        else:
+            selected = list(dict.fromkeys(name.strip() for name in sheets.split(',') if name.strip()))
+            unknown = [name for name in selected if name not in available]
+            if unknown or not selected:
+                raise HTTPException(
+                    status_code=400,
+                    detail={"message": f"Unknown sheets: {unknown}", "available_sheets": available}
+                )
+        results = await asyncio.gather(*(_store_sheet(path, sheet, file.filename) for sheet in selected))
+    finally:
+        os.remove(path)
+    
+    failed = [result.sheet for result in results if result.error]
+    total_stored = sum(result.total_stored for result in results)
+    message = f"{total_stored} anomalies successfully stored from {len(results) - len(failed)} of {len(results)} sheets"
+    if failed:
+        message += f", failed sheets: {', '.join(failed)}"
+    return ExcelStorageResponse(
+        success=not failed,
+        message=message,
+        total_stored=total_stored,
+        total_skipped=sum(result.total_skipped for result in results),
+        total_rejected=sum(result.total_rejected for result in results),
+        sheets=results
+    )
+
+@app.post("/store/file/excel", response_model=ExcelStorageResponse, tags=["File Upload"])
+async def store_from_excel_file(
+    file: UploadFile = File(...),
+    sheets: Optional[str] = Query(
+        None, description="Sheets to import: comma-separated sheet names, or `all`. Defaults to the first sheet only."
+    )
+):
     """
     Process and store anomalies from Excel file
     
@@ -246,47 +544,157 @@ async def store_from_excel_file(file: UploadFile = File(...)):
     ### Features:
     - Supports multiple Excel formats
     - Automatic data type detection
-    - Sheet processing (uses first sheet)
+    - Sheet processing (first sheet, or the sheets selected with `sheets`)
     - Header row detection
+    
+    ### Multiple sheets:
+    With `sheets=all` or `sheets=Unit A,Unit B`, the selected sheets are parsed and scored in
+    parallel and each is recorded under its own import batch. The response carries the
+    combined totals and a `sheets` list with each sheet's batch ID, counts, rejected rows and
+    parse / score / store timings. A sheet that fails is reported with its `error` and does
+    not stop the others.
     """
     try:
         if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
             raise HTTPException(status_code=400, detail="File must be an Excel file (.xlsx or .xls)")
         
+        if sheets:
+            return await _store_excel_sheets(file, sheets)
+        
         # Process file
-        anomalies_data = await FileProcessor.process_excel_file(file)
+        df = await FileProcessor.process_excel_file(file)
+        return await _store_frame(df, file.filename, " from Excel file")
         
-        if not anomalies_data:
-            raise HTTPException(status_code=400, detail="No valid anomaly data found in file")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing Excel file: {str(e)}")
+
+@app.post("/store/file/parquet", response_model=BatchStorageResponse, tags=["File Upload"])
+async def store_from_parquet_file(file: UploadFile = File(...)):
+    """
+    Process and store anomalies from Parquet file
+    
+    Upload a Parquet file containing multiple anomaly records for processing and storage.
+    Returns only confirmation without prediction results.
+    
+    ### Parquet Format:
+    Same column names as CSV format (or the API field names such as `num_equipement`).
+    
+    ### Features:
+    - Reads only the columns needed for prediction
+    - Columns go straight into validation and feature preparation, without per-row conversion
+    - Import tracking with unique batch ID
+    """
+    try:
+        if not file.filename.endswith('.parquet'):
+            raise HTTPException(status_code=400, detail="File must be a Parquet file (.parquet)")
         
-        # Make predictions
-        predictions_list = predictor.predict_batch(anomalies_data)
+        df = await FileProcessor.process_parquet_file(file)
+        return await _store_frame(df, file.filename, " from Parquet file")
         
-        # Prepare data for database
-        db_data_list = []
-        for anomaly_data, predictions in zip(anomalies_data, predictions_list):
-            db_data = FileProcessor.prepare_for_database(anomaly_data, predictions)
-            db_data_list.append(db_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing Parquet file: {str(e)}")
+
+@app.post("/store/file/arrow", response_model=BatchStorageResponse, tags=["File Upload"])
+async def store_from_arrow_file(file: UploadFile = File(...)):
+    """
+    Process and store anomalies from Arrow IPC file
+    
+    Upload an Arrow IPC file (.arrow, .feather or .ipc, file or stream format) containing
+    multiple anomaly records for processing and storage.
+    Returns only confirmation without prediction results.
+    
+    ### Arrow Format:
+    Same column names as CSV format (or the API field names such as `num_equipement`).
+    """
+    try:
+        if not file.filename.endswith(('.arrow', '.feather', '.ipc')):
+            raise HTTPException(status_code=400, detail="File must be an Arrow IPC file (.arrow, .feather or .ipc)")
         
-        # Create batch ID
-        batch_id = await supabase_client.create_import_batch(file.filename, len(anomalies_data))
+        df = await FileProcessor.process_arrow_file(file)
+        return await _store_frame(df, file.filename, " from Arrow file")
         
-        # Store in database
-        stored_anomalies = await supabase_client.create_anomalies_batch(db_data_list, batch_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing Arrow file: {str(e)}")
+
+@app.get("/imports/{import_batch_id}", response_model=ImportStatusResponse, tags=["File Upload"])
+async def import_status(import_batch_id: str):
+    """
+    Progress of a file import
+    
+    File imports are stored in numbered chunks, each checkpointed once the database has
+    committed it. Shows how many chunks and rows are stored, the last error, and whether
+    the import can be resumed.
+    """
+    progress = await asyncio.to_thread(import_checkpoints.status, import_batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No checkpoint for this import")
+    return progress
+
+@app.post("/imports/{import_batch_id}/resume", response_model=BatchStorageResponse, tags=["File Upload"])
+async def resume_import(import_batch_id: str):
+    """
+    Resume a failed file import
+    
+    Sends only the chunks that were not committed, from the checkpointed rows: the file is
+    not needed again and nothing is predicted again. Rows keep the IDs they were given on
+    the first attempt, so a chunk committed just before the failure is not stored twice.
+    An import that is still running is refused with 409 unless it has made no progress for
+    `TAMS_IMPORT_LEASE_SECONDS` (its worker went away).
+    """
+    refusal = await asyncio.to_thread(import_checkpoints.claim, import_batch_id)
+    if refusal is not None:
+        raise HTTPException(status_code=refusal[0], detail=refusal[1])
+    return _import_response(await import_checkpoints.run(import_batch_id), " on resume")
+
+@app.post("/predict/batch", response_model=ColumnarPredictionResponse, tags=["Prediction"])
+async def predict_batch_anomalies(
+    anomalies: List[Dict[str, Any]] = Body(..., examples=[[AnomalyInput.Config.json_schema_extra["example"]]])
+):
+    """
+    Preview AI predictions for multiple anomalies without storing them
+    
+    Same input and validation as `/store/batch`, but nothing is written to the database.
+    Scores are returned as compact parallel arrays (one entry per valid row) so that large
+    previews stay small and fast to serialize.
+    """
+    try:
+        if not anomalies:
+            raise HTTPException(status_code=400, detail="No anomalies provided")
         
-        if not stored_anomalies:
-            raise HTTPException(status_code=500, detail="Failed to store anomalies in database")
+        # Plain JSON of the arrays, skipping per-item response model validation
+        return JSONResponse(content=await asyncio.to_thread(profiled(preview_frame), pd.DataFrame(anomalies)))
         
-        # Return simple confirmation
-        return BatchStorageResponse(
-            success=True,
-            message=f"{len(stored_anomalies)} anomalies successfully stored from Excel file",
-            total_stored=len(stored_anomalies),
-            import_batch_id=batch_id
-        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/predict/file", response_model=ColumnarPredictionResponse, tags=["Prediction"])
+async def predict_from_file(file: UploadFile = File(...)):
+    """
+    Preview AI predictions for a file without storing it
+    
+    Accepts any of the file formats supported by the storage endpoints (CSV, Excel,
+    Parquet, Arrow IPC), detected from the file extension. Intended for import wizards that
+    show scores for a whole file before committing it with the matching `/store/file/...`
+    endpoint.
+    """
+    try:
+        df = await FileProcessor.process_upload(file)
+        return JSONResponse(content=await asyncio.to_thread(profiled(preview_frame), df))
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing Excel file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 if __name__ == "__main__":
     try:
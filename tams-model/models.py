@@ -23,27 +23,48 @@ class AnomalyInput(BaseModel):
             }
         }
 
+class NearDuplicateCandidate(BaseModel):
+    """A stored anomaly that looks like a reworded duplicate"""
+    anomaly_id: str = Field(..., description="ID of the stored anomaly")
+    similarity: float = Field(..., description="Estimated Jaccard similarity of the descriptions (0-1)")
+
 class StorageResponse(BaseModel):
     """Simple response model for storage operations"""
     success: bool = Field(True, description="Indicates if the operation was successful")
     message: str = Field(..., description="Success or error message")
     anomaly_id: str = Field(..., description="ID of the stored anomaly")
+    near_duplicates: List[NearDuplicateCandidate] = Field(default_factory=list, description="Stored anomalies of the same equipment with a similar description")
     
     class Config:
         json_schema_extra = {
             "example": {
                 "success": True,
                 "message": "Anomaly successfully stored",
-                "anomaly_id": "123e4567-e89b-12d3-a456-426614174000"
+                "anomaly_id": "123e4567-e89b-12d3-a456-426614174000",
+                "near_duplicates": []
             }
         }
 
+class RejectedRow(BaseModel):
+    """A row that failed validation and was not stored"""
+    row: int = Field(..., description="Zero-based position of the row in the submitted batch or file")
+    reasons: List[str] = Field(..., description="Why the row was rejected")
+
+class NearDuplicateRow(BaseModel):
+    """A row with likely duplicates among the anomalies already stored for its equipment"""
+    row: int = Field(..., description="Zero-based position of the row in the submitted batch or file")
+    candidates: List[NearDuplicateCandidate] = Field(..., description="Most similar stored anomalies first")
+
 class BatchStorageResponse(BaseModel):
     """Simple response model for batch storage operations"""
     success: bool = Field(True, description="Indicates if the operation was successful")
     message: str = Field(..., description="Success or error message")
     total_stored: int = Field(..., description="Number of anomalies successfully stored")
     import_batch_id: Optional[str] = Field(None, description="Batch ID for file uploads")
+    total_skipped: int = Field(0, description="Number of anomalies skipped because they were already stored")
+    total_rejected: int = Field(0, description="Number of rows rejected by validation")
+    rejected_rows: List[RejectedRow] = Field(default_factory=list, description="Rejected rows with their reasons")
+    near_duplicates: List[NearDuplicateRow] = Field(default_factory=list, description="Rows resembling anomalies already stored for the same equipment")
     
     class Config:
         json_schema_extra = {
@@ -51,10 +72,63 @@ class BatchStorageResponse(BaseModel):
                 "success": True,
                 "message": "5 anomalies successfully stored",
                 "total_stored": 5,
-                "import_batch_id": "batch-123e4567-e89b-12d3-a456-426614174000"
+                "import_batch_id": "batch-123e4567-e89b-12d3-a456-426614174000",
+                "total_skipped": 0,
+                "total_rejected": 1,
+                "rejected_rows": [
+                    {"row": 3, "reasons": ["Missing required field: description"]}
+                ],
+                "near_duplicates": [
+                    {"row": 0, "candidates": [{"anomaly_id": "123e4567-e89b-12d3-a456-426614174000", "similarity": 0.81}]}
+                ]
             }
         }
 
+class ImportStatusResponse(BaseModel):
+    """Progress of a checkpointed file import"""
+    import_batch_id: str = Field(..., description="Import batch ID")
+    filename: str = Field(..., description="Uploaded file name (with the sheet for multi-sheet Excel imports)")
+    status: str = Field(..., description="running, failed or completed")
+    resumable: bool = Field(..., description="Whether POST /imports/{import_batch_id}/resume would continue it")
+    total_rows: int = Field(..., description="Number of rows read from the file")
+    total_chunks: int = Field(..., description="Number of chunks the scored rows were split into")
+    committed_chunks: int = Field(..., description="Number of chunks committed to the database")
+    stored_rows: int = Field(..., description="Number of anomalies stored so far")
+    total_skipped: int = Field(0, description="Number of anomalies skipped because they were already stored")
+    total_rejected: int = Field(0, description="Number of rows rejected by validation")
+    rejected_rows: List[RejectedRow] = Field(default_factory=list, description="Rejected rows with their reasons")
+    near_duplicates: List[NearDuplicateRow] = Field(default_factory=list, description="Rows resembling anomalies already stored for the same equipment")
+    last_error: Optional[str] = Field(None, description="Why the last attempt failed")
+    created_at: float = Field(..., description="When the import was checkpointed (Unix time)")
+    updated_at: float = Field(..., description="Last progress (Unix time)")
+
+class SheetStorageResult(BaseModel):
+    """Outcome of storing one sheet of a multi-sheet Excel import"""
+    sheet: str = Field(..., description="Worksheet name")
+    import_batch_id: Optional[str] = Field(None, description="Import batch ID of this sheet")
+    total_rows: int = Field(0, description="Number of rows read from the sheet")
+    total_stored: int = Field(0, description="Number of anomalies stored from this sheet")
+    total_skipped: int = Field(0, description="Number of anomalies skipped because they were already stored")
+    total_rejected: int = Field(0, description="Number of rows rejected by validation")
+    rejected_rows: List[RejectedRow] = Field(default_factory=list, description="Rejected rows of this sheet with their reasons")
+    near_duplicates: List[NearDuplicateRow] = Field(default_factory=list, description="Rows of this sheet resembling stored anomalies")
+    parse_ms: float = Field(0, description="Time spent reading the sheet")
+    score_ms: float = Field(0, description="Time spent validating and predicting")
+    store_ms: float = Field(0, description="Time spent writing to the database")
+    error: Optional[str] = Field(None, description="Why the sheet could not be stored, if it failed")
+
+    class Config:
+        # The result is filled in as the sheet progresses; validation turns the row dicts into models
+        validate_assignment = True
+
+class ExcelStorageResponse(BatchStorageResponse):
+    """Batch storage response, with a breakdown per sheet for multi-sheet imports
+
+    For multi-sheet imports the totals cover all sheets, `import_batch_id` is not set
+    and rejected rows are reported per sheet.
+    """
+    sheets: List[SheetStorageResult] = Field(default_factory=list, description="Per-sheet results when several sheets were imported")
+
 class AnomalyPrediction(BaseModel):
     num_equipement: str
     systeme: str
@@ -120,3 +194,39 @@ class BatchPredictionResponse(BaseModel):
                 "import_batch_id": "batch-123e4567-e89b-12d3-a456-426614174000"
             }
         }
+
+class ColumnarPredictionResponse(BaseModel):
+    """Compact response model for predict-only (dry-run) operations
+
+    Scores are parallel arrays with one entry per valid row, instead of one object per row.
+    """
+    total_processed: int = Field(..., description="Number of rows received")
+    rows: List[int] = Field(..., description="Zero-based position in the input of each scored row")
+    ai_fiabilite_integrite_score: List[int] = Field(..., description="AI-predicted Reliability/Integrity scores (1-5)")
+    ai_disponibilite_score: List[int] = Field(..., description="AI-predicted Availability scores (1-5)")
+    ai_process_safety_score: List[int] = Field(..., description="AI-predicted Process Safety scores (1-5)")
+    ai_criticality_level: List[int] = Field(..., description="AI-predicted Criticality levels (sum of above scores)")
+    ai_scorer: List[str] = Field(default_factory=list, description="Scorer of each row: model, or rules when the model was unavailable or too slow")
+    already_stored: List[bool] = Field(..., description="Whether each scored row would be skipped as already stored")
+    near_duplicates: List[NearDuplicateRow] = Field(default_factory=list, description="Rows resembling anomalies already stored for the same equipment")
+    total_rejected: int = Field(0, description="Number of rows rejected by validation")
+    rejected_rows: List[RejectedRow] = Field(default_factory=list, description="Rejected rows with their reasons")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "total_processed": 3,
+                "rows": [0, 2],
+                "ai_fiabilite_integrite_score": [4, 2],
+                "ai_disponibilite_score": [3, 2],
+                "ai_process_safety_score": [5, 3],
+                "ai_criticality_level": [12, 7],
+                "ai_scorer": ["model", "model"],
+                "already_stored": [False, True],
+                "near_duplicates": [],
+                "total_rejected": 1,
+                "rejected_rows": [
+                    {"row": 1, "reasons": ["Missing required field: systeme"]}
+                ]
+            }
+        }
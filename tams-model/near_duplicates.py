@@ -0,0 +1,267 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import List, Dict, Any
+
+import numpy as np
+
+NEARDUP_ENABLED = os.environ.get("TAMS_NEARDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+NEARDUP_DB_PATH = os.environ.get(
+    "TAMS_NEARDUP_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "near_duplicates.sqlite3")
+)
+# LSH banding: signatures have BANDS * ROWS_PER_BAND MinHash values. Two descriptions with
+# Jaccard similarity s share at least one band with probability 1 - (1 - s^ROWS_PER_BAND)^BANDS.
+NEARDUP_BANDS = int(os.environ.get("TAMS_NEARDUP_BANDS", "8"))
+NEARDUP_ROWS_PER_BAND = int(os.environ.get("TAMS_NEARDUP_ROWS_PER_BAND", "4"))
+NEARDUP_THRESHOLD = float(os.environ.get("TAMS_NEARDUP_THRESHOLD", "0.6"))
+NEARDUP_MAX_CANDIDATES = int(os.environ.get("TAMS_NEARDUP_MAX_CANDIDATES", "3"))
+# Memory bounds: the oldest anomalies are evicted past these sizes
+NEARDUP_MAX_ITEMS = int(os.environ.get("TAMS_NEARDUP_MAX_ITEMS", "200000"))
+NEARDUP_MAX_PER_EQUIPMENT = int(os.environ.get("TAMS_NEARDUP_MAX_PER_EQUIPMENT", "500"))
+# How often the index picks up signatures stored by other worker processes
+NEARDUP_SYNC_INTERVAL = float(os.environ.get("TAMS_NEARDUP_SYNC_INTERVAL", "1"))
+
+NUM_PERM = NEARDUP_BANDS * NEARDUP_ROWS_PER_BAND
+_EMPTY = np.uint32(0xFFFFFFFF)
+_TOKEN = re.compile(r"\w\w+")
+# Descriptions hashed per step, which bounds the (tokens x NUM_PERM) working matrix
+_SIGNATURE_CHUNK_ROWS = 2048
+
+# Fixed random hash family, so signatures persisted by one process match in the next
+_rng = np.random.default_rng(20250115)
+_HASH_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+def shingles(text: str) -> List[str]:
+    """Words and word pairs of a description, ignoring case and accents"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    words = _TOKEN.findall(''.join(char for char in text if not unicodedata.combining(char)))
+    return list(dict.fromkeys(words + [f"{a} {b}" for a, b in zip(words, words[1:])]))
+
+def minhash_signatures(descriptions: List[str]) -> np.ndarray:
+    """MinHash signatures of a batch of descriptions, one row of NUM_PERM uint32 each
+
+    Descriptions without any word get an all-empty signature that matches nothing.
+    """
+    signatures = np.full((len(descriptions), NUM_PERM), _EMPTY, dtype=np.uint32)
+    for start in range(0, len(descriptions), _SIGNATURE_CHUNK_ROWS):
+        tokens = [shingles(description) for description in descriptions[start:start + _SIGNATURE_CHUNK_ROWS]]
+        lengths = np.array([len(row) for row in tokens], dtype=np.int64)
+        if not lengths.sum():
+            continue
+        # crc32 is stable across processes, unlike hash(), so persisted signatures stay valid
+        hashes = np.fromiter(
+            (zlib.crc32(token.encode('utf-8')) for row in tokens for token in row),
+            dtype=np.uint64, count=int(lengths.sum())
+        )
+        # Multiply-shift hashing of every token under every permutation (wrapping uint64 arithmetic)
+        permuted = ((hashes[:, None] * _HASH_A + _HASH_B) >> np.uint64(32)).astype(np.uint32)
+        non_empty = lengths > 0
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+        chunk = signatures[start:start + len(tokens)]
+        chunk[non_empty] = np.minimum.reduceat(permuted, starts, axis=0)
+    return signatures
+
+class NearDuplicateIndex:
+    """Finds stored anomalies on the same equipment with a similar description
+
+    MinHash/LSH: each anomaly's signature is split into bands, and anomalies sharing a
+    band in the same equipment's partition are candidates. Only those are compared, so
+    lookups do not depend on the size of the history. The index keeps the most recent
+    NEARDUP_MAX_ITEMS anomalies (NEARDUP_MAX_PER_EQUIPMENT per equipment) in memory and
+    persists their signatures to SQLite to reload on startup, and to share with the other
+    workers, which read the new ones every NEARDUP_SYNC_INTERVAL.
+    """
+
+    def __init__(self, db_path: str = NEARDUP_DB_PATH):
+        self.db_path = db_path
+        self._connection = None
+        self._lock = threading.Lock()
+        # anomaly_id -> (equipment, signature), oldest first
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        # equipment -> {band key -> anomaly IDs}
+        self._partitions: Dict[str, Dict[bytes, set]] = {}
+        # equipment -> its anomaly IDs, oldest first
+        self._per_equipment: Dict[str, "OrderedDict[str, None]"] = {}
+        self._evicted = 0
+        self._last_seq = 0
+        self._synced_at = 0.0
+
+    def _open(self) -> None:
+        """Open the store and load the most recent signatures on first use"""
+        if self._connection is not None:
+            return
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS signatures (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                anomaly_id TEXT NOT NULL UNIQUE,
+                equipement TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )"""
+        )
+        self._connection = connection
+        with connection:
+            self._prune()
+        self._load_since(0)
+        print(f"Near-duplicate index loaded {len(self._items)} signatures from {self.db_path}")
+
+    def load(self) -> None:
+        """Load the persisted signatures now rather than on the first lookup"""
+        with self._lock:
+            self._open()
+
+    def _load_since(self, seq: int) -> None:
+        rows = self._connection.execute(
+            "SELECT seq, anomaly_id, equipement, signature FROM signatures WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        for _, anomaly_id, equipement, signature in rows:
+            self._insert(anomaly_id, equipement, np.frombuffer(signature, dtype=np.uint32))
+        if rows:
+            self._last_seq = rows[-1][0]
+        self._synced_at = time.monotonic()
+
+    def _catch_up(self) -> None:
+        """Index the signatures other workers stored since the last sync"""
+        if time.monotonic() - self._synced_at >= NEARDUP_SYNC_INTERVAL:
+            self._load_since(self._last_seq)
+
+    def _prune(self) -> None:
+        """Drop persisted signatures that no longer fit in memory"""
+        self._connection.execute(
+            "DELETE FROM signatures WHERE seq <= (SELECT MAX(seq) FROM signatures) - ?", (NEARDUP_MAX_ITEMS,)
+        )
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> List[bytes]:
+        return [
+            band.to_bytes(1, 'little') + signature[band * NEARDUP_ROWS_PER_BAND:(band + 1) * NEARDUP_ROWS_PER_BAND].tobytes()
+            for band in range(NEARDUP_BANDS)
+        ]
+
+    @staticmethod
+    def _partition_key(equipement: Any) -> str:
+        return str(equipement).strip().lower()
+
+    def _insert(self, anomaly_id: str, equipement: str, signature: np.ndarray) -> None:
+        if anomaly_id in self._items or (signature == _EMPTY).all():
+            return
+        partition = self._partitions.setdefault(equipement, {})
+        for key in self._band_keys(signature):
+            partition.setdefault(key, set()).add(anomaly_id)
+        self._items[anomaly_id] = (equipement, signature)
+        members = self._per_equipment.setdefault(equipement, OrderedDict())
+        members[anomaly_id] = None
+
+        if len(members) > NEARDUP_MAX_PER_EQUIPMENT:
+            self._evict(next(iter(members)))
+        while len(self._items) > NEARDUP_MAX_ITEMS:
+            self._evict(next(iter(self._items)))
+
+    def _evict(self, anomaly_id: str) -> None:
+        equipement, signature = self._items.pop(anomaly_id)
+        partition = self._partitions[equipement]
+        for key in self._band_keys(signature):
+            bucket = partition.get(key)
+            if bucket is not None:
+                bucket.discard(anomaly_id)
+                if not bucket:
+                    del partition[key]
+        members = self._per_equipment[equipement]
+        members.pop(anomaly_id, None)
+        if not members:
+            del self._per_equipment[equipement]
+            del self._partitions[equipement]
+        self._evicted += 1
+
+    def find_candidates(self, equipements: List[Any], signatures: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """Return, for each row, the most similar stored anomalies above NEARDUP_THRESHOLD"""
+        results = []
+        # Imports repeat the same description on the same equipment, so identical rows share one lookup
+        seen: Dict[tuple, List[Dict[str, Any]]] = {}
+        with self._lock:
+            self._open()
+            self._catch_up()
+            for equipement, signature in zip(equipements, signatures):
+                partition_key = self._partition_key(equipement)
+                partition = self._partitions.get(partition_key)
+                if partition is None or (signature == _EMPTY).all():
+                    results.append([])
+                    continue
+                lookup = (partition_key, signature.tobytes())
+                if lookup in seen:
+                    results.append([dict(candidate) for candidate in seen[lookup]])
+                    continue
+                candidate_ids = set()
+                for key in self._band_keys(signature):
+                    candidate_ids.update(partition.get(key, ()))
+                if not candidate_ids:
+                    seen[lookup] = []
+                    results.append([])
+                    continue
+                candidate_ids = list(candidate_ids)
+                # The share of equal MinHash values estimates the Jaccard similarity; all
+                # candidates are compared at once, since a busy equipment has hundreds
+                matrix = np.stack([self._items[anomaly_id][1] for anomaly_id in candidate_ids])
+                similarities = (matrix == signature).mean(axis=1)
+                above = np.flatnonzero(similarities >= NEARDUP_THRESHOLD)
+                best = above[np.argsort(-similarities[above], kind='stable')[:NEARDUP_MAX_CANDIDATES]]
+                seen[lookup] = [
+                    {'anomaly_id': candidate_ids[position], 'similarity': round(float(similarities[position]), 3)}
+                    for position in best
+                ]
+                results.append([dict(candidate) for candidate in seen[lookup]])
+        return results
+
+    def add(self, equipements: List[Any], signatures: np.ndarray, anomaly_ids: List[str]) -> None:
+        """Index newly stored anomalies"""
+        if not anomaly_ids:
+            return
+        rows = [
+            (str(anomaly_id), self._partition_key(equipement), signature)
+            for equipement, signature, anomaly_id in zip(equipements, signatures, anomaly_ids)
+            if not (signature == _EMPTY).all()
+        ]
+        with self._lock:
+            self._open()
+            with self._connection:
+                # Holding the write lock, index what other workers stored before our rows,
+                # then skip the watermark past ours: reloading our own rows would bring
+                # back the ones the per-equipment cap has already evicted
+                self._connection.execute("BEGIN IMMEDIATE")
+                self._load_since(self._last_seq)
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO signatures (anomaly_id, equipement, signature) VALUES (?, ?, ?)",
+                    [(anomaly_id, equipement, signature.tobytes()) for anomaly_id, equipement, signature in rows]
+                )
+                self._last_seq = self._connection.execute("SELECT COALESCE(MAX(seq), 0) FROM signatures").fetchone()[0]
+                self._prune()
+            for anomaly_id, equipement, signature in rows:
+                self._insert(anomaly_id, equipement, signature)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": NEARDUP_ENABLED,
+                "loaded": self._connection is not None,
+                "items": len(self._items),
+                "equipments": len(self._partitions),
+                "buckets": sum(len(partition) for partition in self._partitions.values()),
+                "evicted": self._evicted,
+                "max_items": NEARDUP_MAX_ITEMS,
+                "max_per_equipment": NEARDUP_MAX_PER_EQUIPMENT,
+                "bands": NEARDUP_BANDS,
+                "rows_per_band": NEARDUP_ROWS_PER_BAND,
+                "threshold": NEARDUP_THRESHOLD,
+            }
+
+# Global instance
+near_duplicate_index = NearDuplicateIndex()
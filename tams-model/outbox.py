@@ -0,0 +1,279 @@
+import asyncio
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional
+
+from database import supabase_client, PostgRESTError
+from aggregates import criticality_aggregates
+from tracing import span
+
+OUTBOX_ENABLED = os.environ.get("TAMS_OUTBOX_ENABLED", "false").lower() in ("1", "true", "yes")
+OUTBOX_DB_PATH = os.environ.get(
+    "TAMS_OUTBOX_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "outbox.sqlite3")
+)
+OUTBOX_FLUSH_BATCH_SIZE = int(os.environ.get("TAMS_OUTBOX_FLUSH_BATCH_SIZE", "1000"))
+OUTBOX_FLUSH_INTERVAL = float(os.environ.get("TAMS_OUTBOX_FLUSH_INTERVAL", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("TAMS_OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_MAX_BACKOFF = float(os.environ.get("TAMS_OUTBOX_MAX_BACKOFF", "60"))
+
+class AnomalyOutbox:
+    """Durable write-behind queue between prediction and the database
+
+    Scored anomalies are committed to a local SQLite database in WAL mode and
+    acknowledged with a pre-assigned ID. A background drainer flushes them to the
+    store in large batches, retrying with exponential backoff. Rows the store keeps
+    rejecting are parked as dead letters after OUTBOX_MAX_ATTEMPTS.
+
+    With several worker processes every one of them enqueues, but only the one holding
+    the drainer lock file flushes; the others take over if it exits.
+    """
+
+    def __init__(self, db_path: str = OUTBOX_DB_PATH):
+        self.db_path = db_path
+        self._connection = None
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drainer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._leader_lock = None
+
+        # Flush statistics
+        self._flushed = 0
+        self._failed_flushes = 0
+        self._last_flush_at: Optional[float] = None
+        self._last_flush_rows = 0
+        self._last_error: Optional[str] = None
+
+    def _open(self) -> sqlite3.Connection:
+        """Open the outbox on first use, in the process that uses it"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Every acknowledged anomaly must survive a crash
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS outbox (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    dead INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (dead, next_attempt_at, seq)")
+            self._connection = connection
+        return self._connection
+
+    def enqueue(self, anomaly_data: Dict[str, Any]) -> str:
+        """Durably queue one anomaly for storage and return its pre-assigned ID
+
+        Blocks until the row is synced to disk, so call it from a worker thread. Wakes the
+        drainer once a full flush batch is pending, counted in the table since every worker
+        process enqueues into it.
+        """
+        anomaly_id = anomaly_data.get('id') or str(uuid.uuid4())
+        payload = json.dumps(dict(anomaly_data, id=anomaly_id))
+        with self._lock:
+            connection = self._open()
+            with connection:
+                connection.execute(
+                    "INSERT INTO outbox (id, payload, enqueued_at) VALUES (?, ?, ?)",
+                    (anomaly_id, payload, time.time())
+                )
+            # Counting stops at a full batch, however deep the backlog
+            pending = connection.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM outbox WHERE dead = 0 LIMIT ?)", (OUTBOX_FLUSH_BATCH_SIZE,)
+            ).fetchone()[0]
+        full = pending >= OUTBOX_FLUSH_BATCH_SIZE
+        if full and self._wakeup is not None:
+            # Event.set is not thread-safe, so hand it to the drainer's loop
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return anomaly_id
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._open().execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    def _next_batch(self) -> List[tuple]:
+        with self._lock:
+            return self._open().execute(
+                "SELECT seq, payload, attempts FROM outbox WHERE dead = 0 AND next_attempt_at <= ? ORDER BY seq LIMIT ?",
+                (time.time(), OUTBOX_FLUSH_BATCH_SIZE)
+            ).fetchall()
+
+    def _mark_flushed(self, seqs: List[int]) -> None:
+        with self._lock:
+            connection = self._open()
+            with connection:
+                connection.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def _mark_failed(self, rows: List[tuple], error: str) -> None:
+        """Schedule a retry with exponential backoff, or park rows that ran out of attempts"""
+        now = time.time()
+        updates = []
+        for seq, _, attempts in rows:
+            attempts += 1
+            backoff = min(OUTBOX_MAX_BACKOFF, OUTBOX_FLUSH_INTERVAL * (2 ** attempts))
+            updates.append((attempts, now + backoff, error, int(attempts >= OUTBOX_MAX_ATTEMPTS), seq))
+        with self._lock:
+            connection = self._open()
+            with connection:
+                connection.executemany(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ?, dead = ? WHERE seq = ?",
+                    updates
+                )
+
+    async def flush(self) -> int:
+        """Send one batch of pending anomalies to the store, returning how many were stored
+
+        The outbox is read and updated in worker threads: its commits are synced to disk
+        and wait for the lock held by enqueues doing the same.
+        """
+        rows = await asyncio.to_thread(self._next_batch)
+        if not rows:
+            return 0
+        with span("outbox.flush", rows=len(rows)) as flush_span:
+            stored = await self._flush_rows(rows)
+            flush_span.set(stored=stored)
+        return stored
+
+    async def _flush_rows(self, rows: List[tuple]) -> int:
+        try:
+            await supabase_client.upsert_anomalies([json.loads(payload) for _, payload, _ in rows])
+            stored = rows
+        except PostgRESTError as e:
+            if e.status_code >= 500 or len(rows) == 1:
+                await self._record_failure(rows, str(e))
+                return 0
+            # The store rejected the batch itself, so isolate the offending rows
+            stored = await self._flush_individually(rows)
+        except Exception as e:
+            # Network errors and timeouts: back off the whole batch
+            await self._record_failure(rows, str(e))
+            return 0
+
+        await asyncio.to_thread(self._mark_flushed, [seq for seq, _, _ in stored])
+        criticality_aggregates.record([json.loads(payload) for _, payload, _ in stored])
+        self._flushed += len(stored)
+        self._last_flush_at = time.time()
+        self._last_flush_rows = len(stored)
+        return len(stored)
+
+    async def _flush_individually(self, rows: List[tuple]) -> List[tuple]:
+        async def flush_one(row):
+            try:
+                await supabase_client.upsert_anomalies([json.loads(row[1])])
+                return row, None
+            except Exception as e:
+                return row, str(e)
+
+        results = await asyncio.gather(*(flush_one(row) for row in rows))
+        for row, error in results:
+            if error is not None:
+                await self._record_failure([row], error)
+        return [row for row, error in results if error is None]
+
+    async def _record_failure(self, rows: List[tuple], error: str) -> None:
+        print(f"Warning: outbox flush of {len(rows)} anomalies failed: {error}")
+        self._failed_flushes += 1
+        self._last_error = error
+        await asyncio.to_thread(self._mark_failed, rows, error)
+
+    def _try_lead(self) -> bool:
+        """Take the drainer lock if no other process holds it"""
+        if self._leader_lock is None:
+            handle = open(self.db_path + ".drainer.lock", "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                return False
+            self._leader_lock = handle
+            print(f"Outbox drainer leading in process {os.getpid()}")
+        return True
+
+    def _release_lead(self) -> None:
+        if self._leader_lock is not None:
+            self._leader_lock.close()
+            self._leader_lock = None
+
+    async def _drain(self) -> None:
+        """Background loop: flush full batches back to back, otherwise every OUTBOX_FLUSH_INTERVAL"""
+        while True:
+            if not self._try_lead():
+                await asyncio.sleep(OUTBOX_FLUSH_INTERVAL)
+                continue
+            try:
+                flushed = await self.flush()
+            except Exception as e:
+                print(f"Warning: outbox drainer error: {str(e)}")
+                flushed = 0
+            if flushed >= OUTBOX_FLUSH_BATCH_SIZE:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Start the background drainer in the running event loop"""
+        if self._drainer is None:
+            self._open()
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._drainer = asyncio.create_task(self._drain())
+            print(f"Outbox drainer started ({self.depth()} anomalies pending in {self.db_path})")
+
+    async def stop(self) -> None:
+        """Stop the drainer after a last best-effort flush; anything left is kept for the next start"""
+        if self._drainer is not None:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+            self._drainer = None
+            if self._leader_lock is None:
+                return
+            try:
+                while await self.flush():
+                    pass
+            except Exception as e:
+                print(f"Warning: final outbox flush failed: {str(e)}")
+            finally:
+                self._release_lead()
+
+    def stats(self) -> Dict[str, Any]:
+        """Outbox depth, flush lag and flush history"""
+        with self._lock:
+            connection = self._open()
+            depth, oldest = connection.execute(
+                "SELECT COUNT(*), MIN(enqueued_at) FROM outbox WHERE dead = 0"
+            ).fetchone()
+            dead = connection.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+        now = time.time()
+        return {
+            "enabled": OUTBOX_ENABLED,
+            "draining": self._leader_lock is not None,
+            "depth": depth,
+            "dead_letters": dead,
+            "flush_lag_seconds": now - oldest if oldest is not None else 0.0,
+            "flushed": self._flushed,
+            "failed_flushes": self._failed_flushes,
+            "last_flush_rows": self._last_flush_rows,
+            "seconds_since_last_flush": now - self._last_flush_at if self._last_flush_at else None,
+            "last_error": self._last_error,
+        }
+
+# Global instance
+anomaly_outbox = AnomalyOutbox()
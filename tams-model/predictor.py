@@ -1,6 +1,32 @@
+import logging
 import warnings
 import os
-from typing import List, Dict, Any, Union
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Union, Optional, Callable, Tuple
+
+from profiling import profiled
+from scheduler import SCHED_SCORING_SLOTS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Latency budget of model scoring: a base per call plus an allowance per row, 0 disables it.
+# Past the deadline the rows are scored by the rule-based fallback instead.
+PREDICT_DEADLINE_MS = float(os.environ.get("TAMS_PREDICT_DEADLINE_MS", "1000"))
+PREDICT_DEADLINE_PER_ROW_MS = float(os.environ.get("TAMS_PREDICT_DEADLINE_PER_ROW_MS", "0.5"))
+# Threads running deadline-bound scoring calls: one per scoring slot, plus as many again
+# for calls that missed their deadline and are still finishing
+PREDICT_WORKERS = int(os.environ.get("TAMS_PREDICT_WORKERS") or 2 * SCHED_SCORING_SLOTS)
+# Consecutive misses or errors that open the breaker, and how long it stays open
+PREDICT_BREAKER_FAILURES = int(os.environ.get("TAMS_PREDICT_BREAKER_FAILURES", "3"))
+PREDICT_BREAKER_COOLDOWN = float(os.environ.get("TAMS_PREDICT_BREAKER_COOLDOWN", "30"))
+
+# Which scorer produced a row's scores, stored in anomalies.ai_scorer
+SCORER_MODEL = "model"
+SCORER_RULES = "rules"
 
 # Suppress scikit-learn version warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
@@ -30,14 +56,89 @@ except ImportError as e:
         def array(data):
             return data
 
+class CircuitBreaker:
+    """Stops calling the model after repeated deadline misses or errors
+
+    Opens after PREDICT_BREAKER_FAILURES consecutive failures. While open every call goes
+    to the rule-based scorer; after PREDICT_BREAKER_COOLDOWN one trial call is let through
+    (half-open), and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failures: int = PREDICT_BREAKER_FAILURES, cooldown: float = PREDICT_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            trial, self._trial_in_flight = self._trial_in_flight, False
+            if trial or (self._opened_at is None and self._consecutive_failures >= self.failures):
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self._times_opened,
+                "failure_threshold": self.failures,
+                "cooldown_seconds": self.cooldown,
+            }
+
 class TAMSPredictor:
+    # Map column names (handle different naming conventions)
+    COMPONENT_COLUMN_MAPPING = {
+        'num_equipement': 'Num_equipement',
+        'systeme': 'Systeme',
+        'description': "Description de l'équipement",
+        'section_proprietaire': 'Section propriétaire'
+    }
+    
     def __init__(self, model_path: str = None):
         if model_path is None:
             model_path = os.path.join(os.path.dirname(__file__), "ml_models", "multi_output_model.pkl")
         
+        self.model_path = model_path
         self.model = None
         self.model_loaded = False
         
+        # Deadline enforcement
+        self.breaker = CircuitBreaker()
+        self._stats_lock = threading.Lock()
+        self._late_calls = 0
+        self._rows_by_scorer = {SCORER_MODEL: 0, SCORER_RULES: 0}
+        self._fallback_reasons: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        
         # Additional model components (if available)
         self.label_encoders = {}
         self.vectorizer = None
@@ -67,6 +168,8 @@ class TAMSPredictor:
                         self.target_columns = loaded_object.get('target_columns', [])
                         self.categorical_columns = loaded_object.get('categorical_columns', [])
                         print(f"Additional components loaded: encoders={len(self.label_encoders)}, vectorizer={self.vectorizer is not None}")
+                    
+                    self._build_single_row_lookups()
                 else:
                     print(f"Warning: Could not extract valid model from loaded object")
                     print(f"Object type: {type(loaded_object)}")
@@ -86,33 +189,33 @@ class TAMSPredictor:
         try:
             # Check if it's a dictionary (common error case)
             if isinstance(model, dict):
-                print("DEBUG: Loaded object is a dictionary, not a model")
+                logger.debug("Loaded object is a dictionary, not a model")
                 return False
             
             # Check if it has a predict method
             if not hasattr(model, 'predict'):
-                print("DEBUG: Loaded object does not have a predict method")
+                logger.debug("Loaded object does not have a predict method")
                 return False
             
             # Check if predict is callable
             if not callable(getattr(model, 'predict')):
-                print("DEBUG: predict attribute is not callable")
+                logger.debug("predict attribute is not callable")
                 return False
             
             # Try to inspect the model further
             if hasattr(model, '__class__'):
                 class_name = model.__class__.__name__
-                print(f"DEBUG: Model class: {class_name}")
+                logger.debug("Model class: %s", class_name)
                 
                 # Check if it looks like a scikit-learn model
                 valid_sklearn_bases = ['BaseEstimator', 'ClassifierMixin', 'RegressorMixin']
                 if hasattr(model, '__class__') and hasattr(model.__class__, '__mro__'):
                     base_classes = [cls.__name__ for cls in model.__class__.__mro__]
-                    print(f"DEBUG: Model inheritance chain: {base_classes}")
+                    logger.debug("Model inheritance chain: %s", base_classes)
                     
                     # If it has sklearn-like inheritance, it's probably valid
                     if any(base in base_classes for base in valid_sklearn_bases):
-                        print("DEBUG: Model appears to be a valid scikit-learn estimator")
+                        logger.debug("Model appears to be a valid scikit-learn estimator")
                         return True
                 
                 # Check for common sklearn model classes
@@ -126,18 +229,18 @@ class TAMSPredictor:
                 ]
                 
                 if class_name in sklearn_models:
-                    print(f"DEBUG: Recognized sklearn model: {class_name}")
+                    logger.debug("Recognized sklearn model: %s", class_name)
                     return True
                 
                 # If it has predict method and is not a dict, give it a chance
-                print(f"DEBUG: Unknown model type {class_name}, but has predict method - allowing")
+                logger.debug("Unknown model type %s, but has predict method - allowing", class_name)
                 return True
             
-            print("DEBUG: Could not determine model type, but has predict method - allowing")
+            logger.debug("Could not determine model type, but has predict method - allowing")
             return True
             
         except Exception as e:
-            print(f"DEBUG: Error validating model: {e}")
+            logger.debug("Error validating model: %s", e)
             return False
     
     def _prepare_features(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Any:
@@ -149,41 +252,34 @@ class TAMSPredictor:
         if isinstance(data, dict):
             data = [data]
         
-        print(f"DEBUG: Preparing features for {len(data)} samples")
+        logger.debug("Preparing features for %s samples", len(data))
         
         try:
             df = pd.DataFrame(data)
-            print(f"DEBUG: DataFrame columns: {df.columns.tolist()}")
-            print(f"DEBUG: DataFrame shape: {df.shape}")
+            logger.debug("DataFrame columns: %s", df.columns.tolist())
+            logger.debug("DataFrame shape: %s", df.shape)
             
             # Fill missing values
             df = df.fillna("unknown")
             
             # If we have the original encoders and vectorizer, use them
             if hasattr(self, 'label_encoders') and hasattr(self, 'vectorizer') and self.label_encoders and self.vectorizer:
-                print("DEBUG: Using saved encoders and vectorizer")
+                logger.debug("Using saved encoders and vectorizer")
                 return self._prepare_features_with_saved_components(df)
             else:
-                print("DEBUG: Using fallback feature preparation")
+                logger.debug("Using fallback feature preparation")
                 return self._prepare_features_fallback(df)
                 
         except Exception as e:
             print(f"Feature preparation error: {e}")
-            print(f"DEBUG: Returning basic features due to error")
+            logger.debug("Returning basic features due to error")
             return self._prepare_features_fallback(data)
     
     def _prepare_features_with_saved_components(self, df):
         """Prepare features using the saved label encoders and vectorizer"""
         try:
             feature_arrays = []
-            
-            # Map column names (handle different naming conventions)
-            column_mapping = {
-                'num_equipement': 'Num_equipement',
-                'systeme': 'Systeme',
-                'description': "Description de l'équipement",
-                'section_proprietaire': 'Section propriétaire'
-            }
+            column_mapping = self.COMPONENT_COLUMN_MAPPING
             
             # Process categorical columns with label encoders
             for col_key, encoder in self.label_encoders.items():
@@ -197,7 +293,7 @@ class TAMSPredictor:
                         break
                 
                 if df_col and df_col in df.columns:
-                    print(f"DEBUG: Processing column {df_col} with encoder for {col_key}")
+                    logger.debug("Processing column %s with encoder for %s", df_col, col_key)
                     
                     # Handle unseen categories
                     values = df[df_col].fillna("unknown").astype(str)
@@ -210,13 +306,13 @@ class TAMSPredictor:
                             encoded_values.append(encoded)
                         except ValueError:
                             # Handle unseen categories by assigning a default value
-                            print(f"DEBUG: Unseen category '{value}' for column {col_key}, using default")
+                            logger.debug("Unseen category '%s' for column %s, using default", value, col_key)
                             encoded_values.append(0)  # or use len(encoder.classes_) for a new category
                     
                     feature_arrays.append(np.array(encoded_values).reshape(-1, 1))
-                    print(f"DEBUG: Encoded {col_key} shape: {np.array(encoded_values).reshape(-1, 1).shape}")
+                    logger.debug("Encoded %s shape: %s", col_key, feature_arrays[-1].shape)
                 else:
-                    print(f"DEBUG: Column {col_key} not found in dataframe, using zeros")
+                    logger.debug("Column %s not found in dataframe, using zeros", col_key)
                     feature_arrays.append(np.zeros((len(df), 1)))
             
             # Process text features with the saved vectorizer
@@ -229,7 +325,7 @@ class TAMSPredictor:
                         break
                 
                 if desc_col:
-                    print(f"DEBUG: Processing text column {desc_col} with saved vectorizer")
+                    logger.debug("Processing text column %s with saved vectorizer", desc_col)
                     descriptions = df[desc_col].fillna("").astype(str)
                     
                     # Transform using the saved vectorizer
@@ -240,22 +336,22 @@ class TAMSPredictor:
                         text_features = text_features.toarray()
                     
                     feature_arrays.append(text_features)
-                    print(f"DEBUG: Text features shape: {text_features.shape}")
+                    logger.debug("Text features shape: %s", text_features.shape)
                 else:
-                    print("DEBUG: No description column found, using zeros for text features")
+                    logger.debug("No description column found, using zeros for text features")
                     feature_arrays.append(np.zeros((len(df), 100)))  # Default size
             
             # Combine all features
             if feature_arrays:
                 X = np.concatenate(feature_arrays, axis=1)
-                print(f"DEBUG: Combined features shape: {X.shape}")
+                logger.debug("Combined features shape: %s", X.shape)
                 return X
             else:
-                print("DEBUG: No features prepared, using fallback")
+                logger.debug("No features prepared, using fallback")
                 return self._prepare_features_fallback(df)
                 
         except Exception as e:
-            print(f"DEBUG: Error in saved components feature preparation: {e}")
+            logger.debug("Error in saved components feature preparation: %s", e)
             return self._prepare_features_fallback(df)
     
     def _prepare_features_fallback(self, data):
@@ -265,7 +361,7 @@ class TAMSPredictor:
                 data = [data]
             
             df = pd.DataFrame(data)
-            print(f"DEBUG: Fallback preparation for shape: {df.shape}")
+            logger.debug("Fallback preparation for shape: %s", df.shape)
             
             # Fill missing values
             df = df.fillna("unknown")
@@ -274,15 +370,15 @@ class TAMSPredictor:
             numeric_features = []
             for col in ["systeme", "num_equipement"]:
                 if col in df.columns:
-                    print(f"DEBUG: Processing column {col}")
+                    logger.debug("Processing column %s", col)
                     # Simple hash-based encoding for unseen categories
                     encoded = df[col].apply(lambda x: hash(str(x)) % 1000)
                     numeric_features.append(encoded.values.reshape(-1, 1))
-                    print(f"DEBUG: Encoded {col} shape: {encoded.values.reshape(-1, 1).shape}")
+                    logger.debug("Encoded %s shape: %s", col, numeric_features[-1].shape)
             
             # Text vectorization for description
             if "description" in df.columns:
-                print("DEBUG: Processing description column")
+                logger.debug("Processing description column")
                 # For demo, use simple bag of words
                 descriptions = df["description"].fillna("").astype(str)
                 
@@ -296,18 +392,18 @@ class TAMSPredictor:
                         if j < vocab_size:
                             text_features[i, j] = hash(word) % 100
                             
-                print(f"DEBUG: Text features shape: {text_features.shape}")
+                logger.debug("Text features shape: %s", text_features.shape)
             else:
-                print("DEBUG: No description column, using zero features")
+                logger.debug("No description column, using zero features")
                 text_features = np.zeros((len(df), 100))
             
             # Combine features
             if numeric_features:
                 X = np.concatenate([np.hstack(numeric_features), text_features], axis=1)
-                print(f"DEBUG: Combined features shape: {X.shape}")
+                logger.debug("Combined features shape: %s", X.shape)
             else:
                 X = text_features
-                print(f"DEBUG: Using only text features shape: {X.shape}")
+                logger.debug("Using only text features shape: %s", X.shape)
             
             return X
         except Exception as e:
@@ -359,164 +455,288 @@ class TAMSPredictor:
         }
     
     def predict_single(self, anomaly_data: Dict[str, Any]) -> Dict[str, int]:
-        """Predict scores for a single anomaly"""
-        print(f"DEBUG: Starting prediction for anomaly: {anomaly_data.get('num_equipement', 'unknown')}")
-        print(f"DEBUG: DEPENDENCIES_AVAILABLE: {DEPENDENCIES_AVAILABLE}")
-        print(f"DEBUG: model_loaded: {self.model_loaded}")
-        print(f"DEBUG: model is not None: {self.model is not None}")
+        """Predict scores for a single anomaly
+        
+        Goes straight from the validated dict to a preallocated feature vector, without
+        building a DataFrame, and uses the same features as the batch path.
+        """
+        if not (DEPENDENCIES_AVAILABLE and self.model_loaded and self.model is not None):
+            return self._single_fallback(anomaly_data, "no_model")
+        
+        def score():
+            with span("predict.inference", rows=1, model=type(self.model).__name__):
+                prediction = np.asarray(self.model.predict(self._prepare_single_features(anomaly_data)))
+            if prediction.ndim == 1:
+                # Single row output: [fiabilite, disponibilite, process_safety, ...]
+                prediction = prediction.reshape(1, -1)
+            if prediction.ndim != 2 or prediction.shape[1] < 3:
+                raise ValueError(f"Unexpected prediction shape {prediction.shape}")
+            scores = self._score_columns_from_matrix(prediction[:1])
+            return {name: int(values[0]) for name, values in scores.items()}
+        
+        # Single anomalies are the interactive path, held to the latency budget
+        result, reason = self._score_with_deadline(score, 1, deadline=True)
+        if result is None:
+            return self._single_fallback(anomaly_data, reason)
+        self._count_rows(1, SCORER_MODEL)
+        return dict(result, ai_scorer=SCORER_MODEL)
+    
+    def _single_fallback(self, anomaly_data: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        self._count_rows(1, SCORER_RULES, reason)
+        return dict(self._fallback_prediction(anomaly_data), ai_scorer=SCORER_RULES)
+    
+    def _start_scoring(self, score: Callable[[], Any]) -> Future:
+        """Run ``score`` in the scoring thread pool, in the caller's context
         
+        Callers hold a scoring scheduler slot, and the pool has a thread per slot plus
+        PREDICT_WORKERS - SCHED_SCORING_SLOTS for late calls, so the call normally starts
+        straight away. When late calls fill the pool it queues, and its deadline runs
+        meanwhile. The context copy keeps the scoring spans in the caller's trace and
+        profiles them with its request.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(PREDICT_WORKERS, thread_name_prefix="tams-predict")
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, profiled(score))
+    
+    def shutdown(self) -> None:
+        """Stop the scoring threads, without waiting for late calls"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+    
+    def _finish_late(self, future: Future) -> None:
+        with self._stats_lock:
+            self._late_calls -= 1
+    
+    @staticmethod
+    def _deadline_seconds(rows: int) -> Optional[float]:
+        if PREDICT_DEADLINE_MS <= 0:
+            return None
+        return (PREDICT_DEADLINE_MS + PREDICT_DEADLINE_PER_ROW_MS * rows) / 1000
+    
+    def _score_with_deadline(self, score: Callable[[], Any], rows: int, deadline: bool) -> Tuple[Any, Optional[str]]:
+        """Run model scoring, within the latency budget for this many rows when ``deadline``
+        
+        Returns the result, or None and the reason to use the rule-based scorer instead:
+        the breaker is open, the deadline passed or the model raised. A call that missed
+        its deadline is not interrupted, it finishes in its pool thread and is discarded.
+        Blocks until then, so async callers run it in a worker thread.
+        """
+        if not self.breaker.allow():
+            return None, "circuit_open"
+        timeout = self._deadline_seconds(rows) if deadline else None
         try:
-            if DEPENDENCIES_AVAILABLE and self.model_loaded and self.model is not None and self._validate_model(self.model):
-                print("DEBUG: Using ML model for prediction")
-                X = self._prepare_features(anomaly_data)
-                print(f"DEBUG: Features prepared, shape: {X.shape if hasattr(X, 'shape') else 'unknown'}")
-                
-                # Make prediction
-                prediction = self.model.predict(X)
-                print(f"DEBUG: Raw model prediction: {prediction}")
-                print(f"DEBUG: Prediction shape: {prediction.shape if hasattr(prediction, 'shape') else 'unknown'}")
-                
-                # Handle different model output formats
-                if len(prediction.shape) == 2 and prediction.shape[1] >= 3:
-                    # Multi-output model: [[fiabilite, disponibilite, process_safety, ...]]
-                    fiabilite_score = max(1, min(5, int(round(prediction[0][0]))))
-                    disponibilite_score = max(1, min(5, int(round(prediction[0][1]))))
-                    process_safety_score = max(1, min(5, int(round(prediction[0][2]))))
-                    
-                    # Check if criticality is predicted directly or calculate it
-                    if prediction.shape[1] >= 4:
-                        # Model predicts criticality directly
-                        criticality_predicted = max(3, min(15, int(round(prediction[0][3]))))
-                        print(f"DEBUG: Model predicted criticality: {criticality_predicted}")
-                        # Use calculated sum for consistency unless the predicted one is very different
-                        calculated_criticality = fiabilite_score + disponibilite_score + process_safety_score
-                        # Use the calculated sum (more logical)
-                        criticality_level = calculated_criticality
-                    else:
-                        # Calculate criticality as sum of the three scores
-                        criticality_level = fiabilite_score + disponibilite_score + process_safety_score
-                        
-                elif len(prediction.shape) == 1 and len(prediction) >= 3:
-                    # Single row output: [fiabilite, disponibilite, process_safety]
-                    fiabilite_score = max(1, min(5, int(round(prediction[0]))))
-                    disponibilite_score = max(1, min(5, int(round(prediction[1]))))
-                    process_safety_score = max(1, min(5, int(round(prediction[2]))))
-                    
-                    # Check if criticality is provided directly
-                    if len(prediction) >= 4:
-                        criticality_predicted = max(3, min(15, int(round(prediction[3]))))
-                        print(f"DEBUG: Model predicted criticality: {criticality_predicted}")
-                        calculated_criticality = fiabilite_score + disponibilite_score + process_safety_score
-                        criticality_level = calculated_criticality
-                    else:
-                        criticality_level = fiabilite_score + disponibilite_score + process_safety_score
-                else:
-                    print(f"DEBUG: Unexpected prediction format, falling back to rule-based")
-                    return self._fallback_prediction(anomaly_data)
-                
-                result = {
-                    "ai_fiabilite_integrite_score": fiabilite_score,
-                    "ai_disponibilite_score": disponibilite_score,
-                    "ai_process_safety_score": process_safety_score,
-                    "ai_criticality_level": criticality_level
-                }
-                print(f"DEBUG: ML prediction result: {result}")
-                return result
+            if timeout is None:
+                result = score()
             else:
-                print("DEBUG: Using fallback prediction")
-                print(f"DEBUG: Conditions - DEPENDENCIES_AVAILABLE: {DEPENDENCIES_AVAILABLE}, model_loaded: {self.model_loaded}, model is not None: {self.model is not None}, model valid: {self._validate_model(self.model) if self.model else False}")
-                # Use fallback prediction
-                return self._fallback_prediction(anomaly_data)
+                future = self._start_scoring(score)
+                result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self._late_calls += 1
+            future.add_done_callback(self._finish_late)
+            self.breaker.record_failure()
+            logger.warning("Model scoring of %s rows missed its %.0f ms deadline, using rule-based scores", rows, timeout * 1000)
+            return None, "deadline"
         except Exception as e:
-            print(f"Prediction error: {e}")
-            print(f"DEBUG: Exception in prediction, using fallback")
-            # Return fallback prediction on error
-            return self._fallback_prediction(anomaly_data)
+            self.breaker.record_failure()
+            logger.warning("Prediction error: %s", e)
+            return None, "error"
+        self.breaker.record_success()
+        return result, None
+    
+    def _count_rows(self, rows: int, scorer: str, reason: Optional[str] = None) -> None:
+        with self._stats_lock:
+            self._rows_by_scorer[scorer] += rows
+            if reason is not None:
+                self._fallback_reasons[reason] = self._fallback_reasons.get(reason, 0) + rows
     
-    def predict_batch(self, anomalies_data: List[Dict[str, Any]]) -> List[Dict[str, int]]:
-        """Predict scores for multiple anomalies"""
-        print(f"DEBUG: Starting batch prediction for {len(anomalies_data)} anomalies")
+    def stats(self) -> Dict[str, Any]:
+        """Rows scored by the model and by the rules (with why), deadline and breaker state
         
-        try:
-            if DEPENDENCIES_AVAILABLE and self.model_loaded and self.model is not None and self._validate_model(self.model):
-                print("DEBUG: Using ML model for batch prediction")
-                X = self._prepare_features(anomalies_data)
-                print(f"DEBUG: Features prepared for batch, shape: {X.shape if hasattr(X, 'shape') else 'unknown'}")
-                
-                # Make predictions
-                predictions = self.model.predict(X)
-                print(f"DEBUG: Raw batch predictions shape: {predictions.shape if hasattr(predictions, 'shape') else 'unknown'}")
-                
-                results = []
-                for i, prediction in enumerate(predictions):
-                    print(f"DEBUG: Processing prediction {i}: {prediction}")
-                    
-                    # Handle different prediction formats
-                    if len(prediction.shape) == 1 and len(prediction) >= 3:
-                        # Single prediction: [fiabilite, disponibilite, process_safety, ...]
-                        fiabilite_score = max(1, min(5, int(round(prediction[0]))))
-                        disponibilite_score = max(1, min(5, int(round(prediction[1]))))
-                        process_safety_score = max(1, min(5, int(round(prediction[2]))))
-                        
-                        # Check if criticality is provided directly
-                        if len(prediction) >= 4:
-                            criticality_predicted = max(3, min(15, int(round(prediction[3]))))
-                            print(f"DEBUG: Model predicted criticality for item {i}: {criticality_predicted}")
-                            calculated_criticality = fiabilite_score + disponibilite_score + process_safety_score
-                            criticality_level = calculated_criticality
-                        else:
-                            criticality_level = fiabilite_score + disponibilite_score + process_safety_score
-                            
-                    elif hasattr(prediction, '__len__') and len(prediction) >= 3:
-                        # Array-like with at least 3 elements
-                        fiabilite_score = max(1, min(5, int(round(prediction[0]))))
-                        disponibilite_score = max(1, min(5, int(round(prediction[1]))))
-                        process_safety_score = max(1, min(5, int(round(prediction[2]))))
-                        
-                        # Check if criticality is provided directly
-                        if len(prediction) >= 4:
-                            criticality_predicted = max(3, min(15, int(round(prediction[3]))))
-                            print(f"DEBUG: Model predicted criticality for item {i}: {criticality_predicted}")
-                            calculated_criticality = fiabilite_score + disponibilite_score + process_safety_score
-                            criticality_level = calculated_criticality
-                        else:
-                            criticality_level = fiabilite_score + disponibilite_score + process_safety_score
-                    else:
-                        print(f"DEBUG: Unexpected prediction format for item {i}, using fallback")
-                        results.append(self._fallback_prediction(anomalies_data[i]))
-                        continue
-                    
-                    result = {
-                        "ai_fiabilite_integrite_score": fiabilite_score,
-                        "ai_disponibilite_score": disponibilite_score,
-                        "ai_process_safety_score": process_safety_score,
-                        "ai_criticality_level": criticality_level
-                    }
-                    print(f"DEBUG: ML prediction result {i}: {result}")
-                    results.append(result)
-                
-                return results
+        ``late_calls`` counts calls that missed their deadline and are still running.
+        """
+        with self._stats_lock:
+            rows_by_scorer = dict(self._rows_by_scorer)
+            fallback_reasons = dict(self._fallback_reasons)
+            late_calls = self._late_calls
+        return {
+            "model_loaded": self.model_loaded,
+            "deadline_ms": PREDICT_DEADLINE_MS,
+            "deadline_per_row_ms": PREDICT_DEADLINE_PER_ROW_MS,
+            "late_calls": late_calls,
+            "rows_by_scorer": rows_by_scorer,
+            "fallback_reasons": fallback_reasons,
+            "breaker": self.breaker.stats(),
+        }
+    
+    def _build_single_row_lookups(self) -> None:
+        """Precompute what the single-row path needs from the saved encoders and vectorizer"""
+        # Class -> code dictionaries instead of one encoder.transform call per value
+        self._encoder_lookups = [
+            (col_key, {str(label): code for code, label in enumerate(encoder.classes_)})
+            for col_key, encoder in self.label_encoders.items()
+        ]
+        # Plain term counts can be filled in from the vocabulary directly; other
+        # vectorizers (TF-IDF, binary, ...) still go through transform()
+        self._analyzer = None
+        self._vocabulary = None
+        if (self.vectorizer is not None and type(self.vectorizer).__name__ == 'CountVectorizer'
+                and not getattr(self.vectorizer, 'binary', False) and hasattr(self.vectorizer, 'vocabulary_')):
+            self._analyzer = self.vectorizer.build_analyzer()
+            self._vocabulary = self.vectorizer.vocabulary_
+        self._column_positions = {}
+    
+    def _resolve_single_row_columns(self, keys: tuple) -> tuple:
+        """Match encoder and description columns to input keys, like the DataFrame path does"""
+        if keys not in self._column_positions:
+            encoder_columns = []
+            for col_key, _ in self._encoder_lookups:
+                match = None
+                for key in keys:
+                    if (key.lower() == col_key.lower() or key == col_key or
+                            self.COMPONENT_COLUMN_MAPPING.get(key, key) == col_key):
+                        match = key
+                        break
+                encoder_columns.append(match)
+            description_column = next(
+                (key for key in keys if 'description' in key.lower() or 'desc' in key.lower()), None
+            )
+            self._column_positions[keys] = (encoder_columns, description_column)
+        return self._column_positions[keys]
+    
+    def _prepare_single_features(self, anomaly_data: Dict[str, Any]):
+        """Build the (1, n_features) matrix for one anomaly without pandas"""
+        # Missing values are "unknown", as after fillna in the DataFrame path
+        def text(key):
+            value = anomaly_data.get(key)
+            return "unknown" if value is None or value != value else str(value)
+        
+        if not (self.label_encoders and self.vectorizer):
+            return self._prepare_single_features_fallback(anomaly_data, text)
+        
+        encoder_columns, description_column = self._resolve_single_row_columns(tuple(anomaly_data))
+        n_encoded = len(self._encoder_lookups)
+        n_text = len(self._vocabulary) if self._vocabulary is not None else None
+        
+        if description_column is not None and n_text is None:
+            text_features = self.vectorizer.transform([text(description_column)])
+            text_features = text_features.toarray() if hasattr(text_features, 'toarray') else np.asarray(text_features)
+            n_text = text_features.shape[1]
+        elif description_column is None:
+            text_features, n_text = None, 100  # Default size, as in the DataFrame path
+        
+        X = np.zeros((1, n_encoded + n_text))
+        for position, ((_, lookup), column) in enumerate(zip(self._encoder_lookups, encoder_columns)):
+            if column is not None:
+                # Unseen categories get code 0
+                X[0, position] = lookup.get(text(column), 0)
+        
+        if description_column is not None:
+            if self._vocabulary is not None:
+                row = X[0, n_encoded:]
+                for token in self._analyzer(text(description_column)):
+                    index = self._vocabulary.get(token)
+                    if index is not None:
+                        row[index] += 1
             else:
-                print("DEBUG: Using fallback predictions for batch")
-                # Use fallback predictions
-                return [self._fallback_prediction(anomaly) for anomaly in anomalies_data]
-        except Exception as e:
-            print(f"Batch prediction error: {e}")
-            print(f"DEBUG: Exception in batch prediction, using fallback")
-            # Return fallback predictions for all items if prediction fails
-            return [self._fallback_prediction(anomaly) for anomaly in anomalies_data]
+                X[0, n_encoded:] = text_features[0]
+        return X
+    
+    def _prepare_single_features_fallback(self, anomaly_data: Dict[str, Any], text):
+        """Single-row version of _prepare_features_fallback"""
+        encoded = [hash(text(col)) % 1000 for col in ("systeme", "num_equipement") if col in anomaly_data]
+        vocab_size = 100
+        X = np.zeros((1, len(encoded) + vocab_size))
+        X[0, :len(encoded)] = encoded
+        if "description" in anomaly_data:
+            words = text("description").lower().split()[:vocab_size]
+            for j, word in enumerate(words):
+                X[0, len(encoded) + j] = hash(word) % 100
+        return X
     
+    def predict_frame(self, df, deadline: bool = False) -> Dict[str, Any]:
+        """Predict scores for a columnar batch, returning one score array per column
+        
+        The ``ai_scorer`` column tells which scorer was used. Model scoring is bounded by
+        the latency budget only when ``deadline`` is True: batches are bulk work, which
+        waits for the model rather than storing rule-based scores.
+        """
+        if len(df) == 0:
+            return dict(self._empty_score_columns(), ai_scorer=np.zeros(0, dtype=object))
+
+        reason = "no_model"
+        if DEPENDENCIES_AVAILABLE and self.model_loaded and self.model is not None and self._validate_model(self.model):
+            def score():
+                with span("predict.features", rows=len(df)) as features_span:
+                    X = self._prepare_features(df)
+                    features_span.set(features=int(X.shape[1]) if getattr(X, 'ndim', 0) == 2 else None)
+                with span("predict.inference", rows=len(df), model=type(self.model).__name__) as inference_span:
+                    predictions = np.asarray(self.model.predict(X))
+                    inference_span.set(output_shape=list(predictions.shape))
+                if predictions.ndim != 2 or predictions.shape[1] < 3:
+                    raise ValueError(f"Unexpected prediction shape {predictions.shape}")
+                return self._score_columns_from_matrix(predictions)
+
+            scores, reason = self._score_with_deadline(score, len(df), deadline)
+            if scores is not None:
+                self._count_rows(len(df), SCORER_MODEL)
+                return dict(scores, ai_scorer=np.full(len(df), SCORER_MODEL, dtype=object))
+        else:
+            logger.debug("Using fallback predictions for columnar batch")
+
+        with span("predict.fallback", rows=len(df), reason=reason):
+            scores = self._fallback_score_columns(df)
+        self._count_rows(len(df), SCORER_RULES, reason)
+        return dict(scores, ai_scorer=np.full(len(df), SCORER_RULES, dtype=object))
+
+    def _score_columns_from_matrix(self, predictions) -> Dict[str, Any]:
+        """Clip and round a raw (n, >=3) prediction matrix into score columns"""
+        # np.rint rounds half to even, like the built-in round()
+        scores = np.clip(np.rint(predictions[:, :3]), 1, 5).astype(np.int64)
+        return {
+            "ai_fiabilite_integrite_score": scores[:, 0],
+            "ai_disponibilite_score": scores[:, 1],
+            "ai_process_safety_score": scores[:, 2],
+            # Use the calculated sum for consistency with the single and batch paths
+            "ai_criticality_level": scores.sum(axis=1)
+        }
+
+    def _fallback_score_columns(self, df) -> Dict[str, Any]:
+        """Rule-based scores for a columnar batch"""
+        descriptions = df['description'].tolist() if 'description' in df.columns else [''] * len(df)
+        systems = df['systeme'].tolist() if 'systeme' in df.columns else [''] * len(df)
+        results = [
+            self._fallback_prediction({'description': description, 'systeme': system})
+            for description, system in zip(descriptions, systems)
+        ]
+        return {
+            key: np.array([result[key] for result in results], dtype=np.int64)
+            for key in self._empty_score_columns()
+        }
+
+    def _empty_score_columns(self) -> Dict[str, Any]:
+        return {
+            "ai_fiabilite_integrite_score": np.zeros(0, dtype=np.int64),
+            "ai_disponibilite_score": np.zeros(0, dtype=np.int64),
+            "ai_process_safety_score": np.zeros(0, dtype=np.int64),
+            "ai_criticality_level": np.zeros(0, dtype=np.int64)
+        }
+
     def _extract_model_from_loaded_object(self, loaded_object):
         """Extract the actual model from different storage formats"""
         try:
             # If it's already a model object
             if self._validate_model(loaded_object):
-                print("DEBUG: Loaded object is directly a model")
+                logger.debug("Loaded object is directly a model")
                 return loaded_object
             
             # If it's a dictionary (common format for saving model + metadata)
             if isinstance(loaded_object, dict):
-                print("DEBUG: Loaded object is a dictionary, looking for model")
+                logger.debug("Loaded object is a dictionary, looking for model")
                 
                 # Common keys where the model might be stored
                 model_keys = ['model', 'estimator', 'classifier', 'regressor', 'predictor']
@@ -524,38 +744,38 @@ class TAMSPredictor:
                 for key in model_keys:
                     if key in loaded_object:
                         potential_model = loaded_object[key]
-                        print(f"DEBUG: Found potential model under key '{key}': {type(potential_model)}")
+                        logger.debug("Found potential model under key '%s': %s", key, type(potential_model))
                         
                         if self._validate_model(potential_model):
-                            print(f"DEBUG: Valid model found under key '{key}'")
+                            logger.debug("Valid model found under key '%s'", key)
                             return potential_model
                 
                 # If no standard key found, check all values
-                print("DEBUG: No standard model key found, checking all dictionary values")
+                logger.debug("No standard model key found, checking all dictionary values")
                 for key, value in loaded_object.items():
                     if self._validate_model(value):
-                        print(f"DEBUG: Valid model found under key '{key}'")
+                        logger.debug("Valid model found under key '%s'", key)
                         return value
                 
-                print("DEBUG: No valid model found in dictionary")
+                logger.debug("No valid model found in dictionary")
                 return None
             
             # If it's a list or tuple, check elements
             if isinstance(loaded_object, (list, tuple)):
-                print("DEBUG: Loaded object is a list/tuple, checking elements")
+                logger.debug("Loaded object is a list/tuple, checking elements")
                 for i, item in enumerate(loaded_object):
                     if self._validate_model(item):
-                        print(f"DEBUG: Valid model found at index {i}")
+                        logger.debug("Valid model found at index %s", i)
                         return item
                 
-                print("DEBUG: No valid model found in list/tuple")
+                logger.debug("No valid model found in list/tuple")
                 return None
             
-            print(f"DEBUG: Unknown object type: {type(loaded_object)}")
+            logger.debug("Unknown object type: %s", type(loaded_object))
             return None
             
         except Exception as e:
-            print(f"DEBUG: Error extracting model: {e}")
+            logger.debug("Error extracting model: %s", e)
             return None
 
 # Global predictor instance
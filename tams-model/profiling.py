@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable, List, Optional
+from urllib.parse import parse_qs
+
+# pyinstrument is a sampling profiler that follows awaits, cProfile is the fallback
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer
+    from pyinstrument.session import Session
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+PROFILER_NAME = "pyinstrument" if PYINSTRUMENT_AVAILABLE else "cProfile"
+
+# Profiling is off unless an admin token is configured
+PROFILE_TOKEN = os.environ.get("TAMS_PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get(
+    "TAMS_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "data", "profiles")
+)
+PROFILE_TOP_N = int(os.environ.get("TAMS_PROFILE_TOP_N", "15"))
+PROFILE_INTERVAL = float(os.environ.get("TAMS_PROFILE_INTERVAL", "0.001"))
+PROFILE_HEADER = "x-tams-profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ROUTE = "/debug/profiles"
+
+# The request being profiled, seen by the worker threads its work runs in
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "tams_active_profile", default=None
+)
+_profiling_thread = threading.local()
+
+def profile_requested(scope) -> bool:
+    """Whether the request carries the admin token in the profile header or query flag"""
+    if not PROFILE_TOKEN:
+        return False
+    supplied = ""
+    for name, value in scope.get("headers", []):
+        if name.decode("latin-1").lower() == PROFILE_HEADER:
+            supplied = value.decode("latin-1")
+            break
+    if not supplied:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        supplied = query.get(PROFILE_QUERY_PARAM, [""])[0]
+    return bool(supplied) and hmac.compare_digest(supplied, PROFILE_TOKEN)
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Return the saved profile with this ID, if any"""
+    for extension in (".html", ".prof"):
+        path = os.path.join(PROFILE_DIR, profile_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def profiled(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``func`` so that, run in a worker thread for a profiled request, it is profiled too
+
+    The request profiler only samples the event loop thread. Work the request hands to
+    ``asyncio.to_thread`` (or to a thread started with a copy of its context) runs under
+    a profiler of its own, merged into the request's profile when it is saved. Outside a
+    profiled request, or on a thread that is already profiled, ``func`` just runs.
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        profile = _active_profile.get()
+        if profile is None or profile.thread_id == threading.get_ident() or getattr(_profiling_thread, "active", False):
+            return func(*args, **kwargs)
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled") if PYINSTRUMENT_AVAILABLE else cProfile.Profile()
+        _profiling_thread.active = True
+        if PYINSTRUMENT_AVAILABLE:
+            profiler.start()
+        else:
+            profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if PYINSTRUMENT_AVAILABLE:
+                profiler.stop()
+            else:
+                profiler.disable()
+            _profiling_thread.active = False
+            profile.add_thread(profiler.last_session if PYINSTRUMENT_AVAILABLE else profiler)
+    return run
+
+class RequestProfile:
+    """CPU profile and allocation trace of a single request"""
+
+    def __init__(self, label: str):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.thread_id: Optional[int] = None
+        self._profiler = None
+        self._threads: List[Any] = []
+        self._threads_lock = threading.Lock()
+        self._saved = False
+        self._tracing_started = False
+        self._snapshot = None
+        self._started = 0.0
+        self._elapsed = 0.0
+        self._peak = 0
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing_started = True
+        tracemalloc.reset_peak()
+        self._snapshot = tracemalloc.take_snapshot()
+        if PYINSTRUMENT_AVAILABLE:
+            self._profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+        self.thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        if PYINSTRUMENT_AVAILABLE:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def add_thread(self, thread_profile: Any) -> None:
+        """Add the profile of a worker thread; threads finishing after the save are left out"""
+        with self._threads_lock:
+            if not self._saved:
+                self._threads.append(thread_profile)
+
+    def stop(self) -> None:
+        """Stop the profiler of the event loop thread, which is cheap enough to do on the loop"""
+        if PYINSTRUMENT_AVAILABLE:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        self._elapsed = time.perf_counter() - self._started
+        _, self._peak = tracemalloc.get_traced_memory()
+
+    def save(self) -> str:
+        """Merge the thread profiles, compare allocations, write the files and return the logged summary
+
+        Slow on a busy process, so run it in a worker thread after ``stop``.
+        """
+        with self._threads_lock:
+            self._saved = True
+            threads = list(self._threads)
+        allocations = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+        if self._tracing_started:
+            tracemalloc.stop()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if PYINSTRUMENT_AVAILABLE:
+            session = self._profiler.last_session
+            for thread_session in threads:
+                session = Session.combine(session, thread_session)
+            path = os.path.join(PROFILE_DIR, self.profile_id + ".html")
+            with open(path, "w") as handle:
+                handle.write(HTMLRenderer().render(session))
+            cpu_summary = ConsoleRenderer(unicode=False, color=False, show_all=False).render(session)
+        else:
+            stats = pstats.Stats(self._profiler, *threads, stream=io.StringIO())
+            path = os.path.join(PROFILE_DIR, self.profile_id + ".prof")
+            stats.dump_stats(path)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+            cpu_summary = stats.stream.getvalue()
+
+        peak = self._peak
+        memory_lines = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB",
+                        f"Top {PROFILE_TOP_N} allocation sites (net growth):"]
+        memory_lines += [f"  {stat}" for stat in allocations[:PROFILE_TOP_N]]
+        memory_summary = "\n".join(memory_lines)
+        with open(os.path.join(PROFILE_DIR, self.profile_id + ".memory.txt"), "w") as handle:
+            handle.write(memory_summary + "\n")
+
+        return (
+            f"Profile {self.profile_id} of {self.label} ({self._elapsed * 1000:.0f} ms, {PROFILER_NAME}, "
+            f"{len(threads)} worker thread profiles), saved to {path}\n"
+            f"{cpu_summary}\n{memory_summary}"
+        )
+
+class ProfilingMiddleware:
+    """Run admin-flagged requests under the CPU profiler and allocation tracing
+
+    Only one request is profiled at a time: a flagged request arriving while another is
+    being profiled runs normally. The profile ID, link and profiler are added to the
+    response headers before the body is sent, and the files are written once the request
+    has finished, in a worker thread.
+    Work the request runs in worker threads through ``profiled`` is profiled in those
+    threads and merged in; the Excel sheet worker processes are not profiled.
+    Without pyinstrument, cProfile sees the whole event loop thread, so concurrent requests
+    show up in the profile too; allocation tracing is process-wide either way.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"].startswith(PROFILE_ROUTE)
+                or not profile_requested(scope) or self._lock.locked()):
+            await self.app(scope, receive, send)
+            return
+
+        async with self._lock:
+            profile = RequestProfile(f"{scope['method']} {scope['path']}")
+
+            async def send_with_link(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", profile.profile_id.encode()))
+                    headers.append((b"x-profile-url", f"{PROFILE_ROUTE}/{profile.profile_id}".encode()))
+                    headers.append((b"x-profiler", PROFILER_NAME.encode()))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            token = _active_profile.set(profile)
+            profile.start()
+            try:
+                await self.app(scope, receive, send_with_link)
+            finally:
+                profile.stop()
+                _active_profile.reset(token)
+                print(await asyncio.to_thread(profile.save))
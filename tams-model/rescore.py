@@ -0,0 +1,229 @@
+"""Rescore stored anomalies after a model change
+
+Pages through the anomalies table in ID order (keyset pagination), scores each page with
+the current model, without the scoring deadline, and writes back only the rows whose
+scores or scorer changed. Rows that get the same new scores are updated together, with
+one PATCH per group. Several pages are in flight at once. After each page completes, in
+ID order, the position is saved to a checkpoint file, so an interrupted run resumes
+after the last page it finished. The criticality aggregates are rebuilt at the end when
+anything changed. With --rules-only, only the rows scored by the rule-based fallback are
+read (through the partial index of migration 003).
+
+    python rescore.py
+    python rescore.py --dry-run
+    python rescore.py --rules-only
+    python rescore.py --restart --concurrency 8 --page-size 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+import pandas as pd
+
+RESCORE_CHECKPOINT_PATH = os.environ.get(
+    "TAMS_RESCORE_CHECKPOINT_PATH", os.path.join(os.path.dirname(__file__), "data", "rescore_checkpoint.json")
+)
+RESCORE_PAGE_SIZE = int(os.environ.get("TAMS_RESCORE_PAGE_SIZE", "1000"))
+# Pages being scored or written at once
+RESCORE_CONCURRENCY = int(os.environ.get("TAMS_RESCORE_CONCURRENCY", "4"))
+# IDs per PATCH request; they travel in the query string
+RESCORE_UPDATE_IDS = int(os.environ.get("TAMS_RESCORE_UPDATE_IDS", "200"))
+RESCORE_PROGRESS_INTERVAL = float(os.environ.get("TAMS_RESCORE_PROGRESS_INTERVAL", "5"))
+
+# Progress goes to stdout; main() sends everything else printed (the predictor logs every
+# call) to stderr
+_progress = sys.stdout
+
+SCORED_FIELDS = (
+    "ai_fiabilite_integrite_score", "ai_disponibilite_score", "ai_process_safety_score",
+    "ai_criticality_level", "ai_scorer"
+)
+# Stored columns, and the input columns the predictor knows them by
+INPUT_COLUMNS = {
+    "equipement_id": "num_equipement",
+    "description": "description",
+    "service": "section_proprietaire",
+    "system_id": "systeme",
+}
+COLUMNS = ["id", *INPUT_COLUMNS, *SCORED_FIELDS]
+
+def say(message: str) -> None:
+    print(message, file=_progress, flush=True)
+
+def model_version(predictor) -> str:
+    """What the scores come from: the model file's size and modification time, or the rules"""
+    if not predictor.model_loaded:
+        return "rules"
+    stat = os.stat(predictor.model_path)
+    return f"{os.path.basename(predictor.model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def changed_groups(page: List[Dict[str, Any]]) -> Dict[Tuple, List[str]]:
+    """Score a page and group the IDs of the rows whose scores changed by their new scores"""
+    from predictor import predictor
+    frame = pd.DataFrame({
+        name: [row.get(column) or '' for row in page] for column, name in INPUT_COLUMNS.items()
+    })
+    scores = predictor.predict_frame(frame)
+    new_scores = zip(*(scores[field].tolist() for field in SCORED_FIELDS))
+    groups: Dict[Tuple, List[str]] = {}
+    for row, values in zip(page, new_scores):
+        if tuple(row.get(field) for field in SCORED_FIELDS) != values:
+            groups.setdefault(values, []).append(row['id'])
+    return groups
+
+class RescoreCheckpoint:
+    """Position and counters of a rescoring run, saved to a JSON file after every page"""
+
+    def __init__(self, path: str, model: str, rules_only: bool = False):
+        self.path = path
+        self.state = {
+            "model": model, "rules_only": rules_only, "status": "running", "after_id": None,
+            "scanned": 0, "changed": 0, "started_at": time.time(), "updated_at": time.time(),
+        }
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as handle:
+            return json.load(handle)
+
+    def save(self, **changes) -> None:
+        self.state.update(changes, updated_at=time.time())
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Written aside and renamed, so a crash never leaves half a checkpoint
+        with open(self.path + ".tmp", "w") as handle:
+            json.dump(self.state, handle)
+        os.replace(self.path + ".tmp", self.path)
+
+class Rescorer:
+    def __init__(self, checkpoint: Optional[RescoreCheckpoint], page_size: int, concurrency: int, dry_run: bool,
+                 rules_only: bool = False):
+        self.checkpoint = checkpoint
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.filters = {"ai_scorer": "eq.rules"} if rules_only else None
+        self.after_id = checkpoint.state["after_id"] if checkpoint else None
+        self.scanned = checkpoint.state["scanned"] if checkpoint else 0
+        self.changed = checkpoint.state["changed"] if checkpoint else 0
+        self._scanned_now = 0
+        self._started = time.perf_counter()
+        self._reported = self._started
+
+    async def _rescore_page(self, page: List[Dict[str, Any]]) -> Tuple[int, int, str]:
+        from database import supabase_client
+        groups = await asyncio.to_thread(changed_groups, page)
+        if not self.dry_run:
+            await asyncio.gather(*(
+                supabase_client.update_anomalies(ids[start:start + RESCORE_UPDATE_IDS], dict(zip(SCORED_FIELDS, values)))
+                for values, ids in groups.items()
+                for start in range(0, len(ids), RESCORE_UPDATE_IDS)
+            ))
+        return len(page), sum(len(ids) for ids in groups.values()), page[-1]['id']
+
+    async def _complete(self, task: asyncio.Task) -> None:
+        scanned, changed, last_id = await task
+        self.after_id = last_id
+        self.scanned += scanned
+        self.changed += changed
+        self._scanned_now += scanned
+        if self.checkpoint:
+            await asyncio.to_thread(self.checkpoint.save, after_id=last_id, scanned=self.scanned, changed=self.changed)
+        if time.perf_counter() - self._reported >= RESCORE_PROGRESS_INTERVAL:
+            self._reported = time.perf_counter()
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = time.perf_counter() - self._started
+        rate = self._scanned_now / elapsed if elapsed > 0 else 0.0
+        verb = "would change" if self.dry_run else "changed"
+        say(f"{'done: ' if final else ''}{self.scanned} scanned, {self.changed} {verb} "
+            f"({rate:,.0f} rows/s, {elapsed:.1f} s), last id {self.after_id}")
+
+    async def run(self) -> None:
+        from database import supabase_client
+        in_flight: deque = deque()
+        after_id = self.after_id
+        try:
+            while True:
+                page = await supabase_client.select_page('anomalies', COLUMNS, after_id, self.page_size, self.filters)
+                if not page:
+                    break
+                after_id = page[-1]['id']
+                in_flight.append(asyncio.create_task(self._rescore_page(page)))
+                # Pages complete in ID order, so the checkpoint never skips an unfinished page
+                if len(in_flight) >= self.concurrency:
+                    await self._complete(in_flight.popleft())
+                if len(page) < self.page_size:
+                    break
+            while in_flight:
+                await self._complete(in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+async def rescore(args) -> int:
+    from predictor import predictor
+    from database import supabase_client
+    from aggregates import criticality_aggregates
+
+    model = model_version(predictor)
+    checkpoint = None
+    if not args.dry_run:
+        checkpoint = RescoreCheckpoint(args.checkpoint, model, args.rules_only)
+        previous = None if args.restart else checkpoint.load()
+        if previous is not None:
+            if previous["model"] != model:
+                say(f"The checkpoint is for {previous['model']}, not {model}; use --restart to start over")
+                return 1
+            if previous.get("rules_only", False) != args.rules_only:
+                scope = "rule-scored rows only" if previous.get("rules_only") else "all rows"
+                say(f"The checkpoint is for a run over {scope}; use --restart to start over")
+                return 1
+            if previous["status"] == "completed":
+                say(f"Already rescored with {model}; use --restart to run again")
+                return 0
+            checkpoint.state.update(previous)
+            say(f"Resuming after {previous['after_id']} ({previous['scanned']} already scanned)")
+        checkpoint.save()
+    say(f"Rescoring with {model}")
+
+    rescorer = Rescorer(checkpoint, args.page_size, args.concurrency, args.dry_run, args.rules_only)
+    try:
+        await rescorer.run()
+        rescorer.report(final=True)
+        if checkpoint:
+            checkpoint.save(status="completed")
+        if rescorer.changed and not args.dry_run and not args.keep_aggregates:
+            await criticality_aggregates.rebuild()
+            say("Criticality aggregates rebuilt")
+    except Exception as e:
+        rescorer.report()
+        say(f"Rescoring stopped: {e}; run again to resume after {rescorer.after_id}")
+        return 1
+    finally:
+        await supabase_client.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=RESCORE_PAGE_SIZE, help="Anomalies read per page")
+    parser.add_argument("--concurrency", type=int, default=RESCORE_CONCURRENCY, help="Pages in flight at once")
+    parser.add_argument("--checkpoint", default=RESCORE_CHECKPOINT_PATH, help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first anomaly")
+    parser.add_argument("--dry-run", action="store_true", help="Count the rows that would change, write nothing")
+    parser.add_argument("--rules-only", action="store_true", help="Only rescore rows scored by the rule-based fallback")
+    parser.add_argument("--keep-aggregates", action="store_true",
+                        help="Do not rebuild the criticality aggregates afterwards")
+    args = parser.parse_args()
+    sys.stdout = sys.stderr
+    sys.exit(asyncio.run(rescore(args)))
+
+if __name__ == "__main__":
+    main()
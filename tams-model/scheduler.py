@@ -0,0 +1,211 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Callable
+
+# Lanes in priority order: a free slot goes to the first lane with work waiting
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+# Server processes sharing the cores; gunicorn.conf.py sets it for the workers it forks
+SERVER_WORKERS = max(1, int(os.environ.get("TAMS_WORKERS") or 1))
+# Scoring calls running at once in each process: the cores shared among the worker
+# processes unless set
+SCHED_SCORING_SLOTS = int(os.environ.get("TAMS_SCHED_SCORING_SLOTS") or max(1, (os.cpu_count() or 1) // SERVER_WORKERS))
+# Bulk batches are scored in slices, each slice taking its own slot, so an interactive
+# request waits for at most one slice. Slices start at this many rows and are then sized
+# by autotune.predict_tuner; indexing after the store keeps this size.
+SCHED_BULK_SLICE_ROWS = int(os.environ.get("TAMS_SCHED_BULK_SLICE_ROWS", "1000"))
+
+class _Waiter:
+    __slots__ = ("lane", "enqueued", "granted", "event", "loop", "future")
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self) -> None:
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class PriorityScheduler:
+    """A pool of slots shared by an interactive and a bulk lane, interactive first
+
+    A slot freed up goes to the oldest waiter of the interactive lane, and to bulk work
+    only when no interactive work is waiting, so bulk work delays interactive work by at
+    most the unit it is already running. ``lane_limits`` caps the slots a lane may hold
+    at once. Slots are taken from worker threads with ``slot`` and from coroutines with
+    ``aslot``; the event loop thread must never block in ``slot``. Coroutines with blocking
+    work to do in a slot use ``run``, which has threads of its own for it.
+    """
+
+    def __init__(self, name: str, slots: int, lane_limits: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.slots = max(1, slots)
+        self.lane_limits = dict(lane_limits or {})
+        self._lock = threading.Lock()
+        self._queues = {lane: deque() for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Per-lane statistics
+        self._admitted = {lane: 0 for lane in LANES}
+        self._waited = {lane: 0 for lane in LANES}
+        self._wait_seconds = {lane: 0.0 for lane in LANES}
+        self._max_wait_seconds = {lane: 0.0 for lane in LANES}
+
+    def _has_room(self, lane: str) -> bool:
+        if sum(self._running.values()) >= self.slots:
+            return False
+        limit = self.lane_limits.get(lane)
+        return limit is None or self._running[lane] < limit
+
+    def _try_acquire(self, lane: str) -> bool:
+        """Take a slot straight away if nobody with priority over this lane is waiting"""
+        for other in LANES:
+            if self._queues[other]:
+                return False
+            if other == lane:
+                break
+        if not self._has_room(lane):
+            return False
+        self._running[lane] += 1
+        self._admitted[lane] += 1
+        return True
+
+    def _grant(self, waiter: _Waiter) -> None:
+        waiter.granted = True
+        waited = time.perf_counter() - waiter.enqueued
+        self._running[waiter.lane] += 1
+        self._admitted[waiter.lane] += 1
+        self._waited[waiter.lane] += 1
+        self._wait_seconds[waiter.lane] += waited
+        self._max_wait_seconds[waiter.lane] = max(self._max_wait_seconds[waiter.lane], waited)
+        waiter.wake()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, lane by lane; a lane with waiters left blocks the lanes after it"""
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and self._has_room(lane):
+                self._grant(queue.popleft())
+            if queue:
+                return
+
+    def _release(self, lane: str) -> None:
+        with self._lock:
+            self._running[lane] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: str):
+        """Hold a slot of this lane, waiting for it in the calling thread"""
+        with self._lock:
+            waiter = None
+            if not self._try_acquire(lane):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    raise RuntimeError(f"{self.name} slots cannot be waited for on the event loop, use aslot")
+                waiter = _Waiter(lane)
+                waiter.event = threading.Event()
+                self._queues[lane].append(waiter)
+        if waiter is not None:
+            waiter.event.wait()
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    @asynccontextmanager
+    async def aslot(self, lane: str):
+        """Hold a slot of this lane, waiting for it without blocking the event loop"""
+        with self._lock:
+            waiter = None
+            if not self._try_acquire(lane):
+                waiter = _Waiter(lane)
+                waiter.loop = asyncio.get_running_loop()
+                waiter.future = waiter.loop.create_future()
+                self._queues[lane].append(waiter)
+        if waiter is not None:
+            try:
+                await waiter.future
+            except BaseException:
+                # Cancelled while waiting: leave the queue, or give back a slot granted meanwhile
+                with self._lock:
+                    if not waiter.granted:
+                        self._queues[lane].remove(waiter)
+                        self._dispatch()
+                        raise
+                self._release(lane)
+                raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    async def run(self, lane: str, func: Callable, *args) -> Any:
+        """Run blocking ``func(*args)`` in a slot of this lane, in the scheduler's own threads
+
+        There is a thread per slot, so work granted a slot starts straight away, even when
+        the default executor's threads are all busy, for instance waiting in ``slot`` for
+        the one this call holds. Runs in a copy of the caller's context, like ``to_thread``.
+        """
+        async with self.aslot(lane):
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.slots, thread_name_prefix=f"tams-{self.name}")
+                executor = self._executor
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(context.run, func, *args)
+            )
+
+    def shutdown(self) -> None:
+        """Stop the scheduler's threads once the work they run has finished"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Slots, and per lane the work running and waiting and how long it waited"""
+        with self._lock:
+            lanes = {
+                lane: {
+                    "running": self._running[lane],
+                    "waiting": len(self._queues[lane]),
+                    "oldest_wait_ms": round((time.perf_counter() - self._queues[lane][0].enqueued) * 1000, 2)
+                    if self._queues[lane] else 0.0,
+                    "limit": self.lane_limits.get(lane, self.slots),
+                    "admitted": self._admitted[lane],
+                    "waited": self._waited[lane],
+                    "avg_wait_ms": round(self._wait_seconds[lane] / self._admitted[lane] * 1000, 2)
+                    if self._admitted[lane] else 0.0,
+                    "max_wait_ms": round(self._max_wait_seconds[lane] * 1000, 2),
+                }
+                for lane in LANES
+            }
+        return {"slots": self.slots, "lanes": lanes}
+
+# Global instance
+scoring_scheduler = PriorityScheduler("scoring", SCHED_SCORING_SLOTS)
@@ -1,5 +1,10 @@
 #!/bin/bash
 
 source .env
-echo "Starting TAMS Anomaly Prediction API..."
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+if [ "$1" == "--dev" ]; then
+    echo "Starting TAMS Anomaly Prediction API (development, auto-reload)..."
+    uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+else
+    echo "Starting TAMS Anomaly Prediction API..."
+    gunicorn main:app -c gunicorn.conf.py
+fi
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+import pandas as pd
+from fastapi import Request
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from database import supabase_client
+from ingestion import score_frame, record_stored
+from profiling import profiled
+from tracing import span
+
+# Records per micro-batch, and how many parsed micro-batches may wait for scoring
+# before we stop reading the request body
+STREAM_CHUNK_SIZE = int(os.environ.get("TAMS_STREAM_CHUNK_SIZE", "500"))
+STREAM_MAX_PENDING_CHUNKS = int(os.environ.get("TAMS_STREAM_MAX_PENDING_CHUNKS", "2"))
+STREAM_MAX_LINE_BYTES = int(os.environ.get("TAMS_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+# Recorded as the filename of a stream's import batch
+STREAM_IMPORT_FILENAME = "stream.ndjson"
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streaming response that leaves the request body to the body iterator
+
+    Starlette's StreamingResponse drains ``receive`` to watch for disconnects while it
+    streams, which would swallow the request body we are still reading. A client
+    disconnect surfaces as ClientDisconnect from ``request.stream()`` instead.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+class _Chunk:
+    """A micro-batch of parsed records plus the lines that could not be parsed"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.positions: List[int] = []
+        self.records: List[Dict[str, Any]] = []
+        self.rejected_rows: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.positions) + len(self.rejected_rows)
+
+    def add_line(self, position: int, line: bytes) -> None:
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            self.rejected_rows.append({'row': position, 'reasons': [f"Invalid JSON: {str(e)}"]})
+            return
+        if not isinstance(record, dict):
+            self.rejected_rows.append({'row': position, 'reasons': ["Expected a JSON object"]})
+            return
+        self.positions.append(position)
+        self.records.append(record)
+
+async def _read_chunks(request: Request, queue: asyncio.Queue) -> None:
+    """Split the request body into NDJSON micro-batches and queue them
+
+    ``queue.put`` blocks once STREAM_MAX_PENDING_CHUNKS are waiting, so we stop pulling
+    from the socket and TCP flow control slows the producer down.
+    """
+    buffer = b""
+    position = 0
+    chunk = _Chunk(0)
+    try:
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            if len(buffer) > STREAM_MAX_LINE_BYTES:
+                raise ValueError(f"NDJSON line exceeds {STREAM_MAX_LINE_BYTES} bytes")
+            for line in lines:
+                if not line.strip():
+                    continue
+                chunk.add_line(position, line)
+                position += 1
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    await queue.put(chunk)
+                    chunk = _Chunk(chunk.index + 1)
+        if buffer.strip():
+            chunk.add_line(position, buffer)
+        if len(chunk):
+            await queue.put(chunk)
+        await queue.put(None)
+    except ClientDisconnect:
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+async def _store_chunk(chunk: _Chunk, batch_id: str) -> Dict[str, Any]:
+    """Score and store one micro-batch and build its acknowledgement"""
+    ack = {
+        'chunk': chunk.index,
+        'received': len(chunk),
+        'stored_ids': [],
+        'skipped': 0,
+        'rejected_rows': list(chunk.rejected_rows),
+        'near_duplicates': [],
+        'error': None
+    }
+    with span("stream.chunk", chunk=chunk.index, received=len(chunk)) as chunk_span:
+        try:
+            if chunk.records:
+                scored = await asyncio.to_thread(profiled(score_frame), pd.DataFrame(chunk.records))
+                # Report rejections by their position in the stream, not in the micro-batch
+                for rejected in scored.rejected_rows:
+                    rejected['row'] = chunk.positions[rejected['row']]
+                ack['rejected_rows'].extend(scored.rejected_rows)
+                ack['rejected_rows'].sort(key=lambda rejected: rejected['row'])
+                ack['skipped'] = scored.skipped
+                
+                if scored.rows:
+                    stored_anomalies = await supabase_client.create_anomalies_batch(scored.rows, batch_id)
+                    ack['stored_ids'] = [anomaly['id'] for anomaly in stored_anomalies]
+                    await asyncio.to_thread(profiled(record_stored), scored, stored_anomalies)
+                    for near_duplicate in scored.near_duplicates:
+                        near_duplicate['row'] = chunk.positions[near_duplicate['row']]
+                    ack['near_duplicates'] = scored.near_duplicates
+        except Exception as e:
+            ack['error'] = str(e)
+        chunk_span.set(stored=len(ack['stored_ids']), error=ack['error'])
+    return ack
+
+async def stream_ingest(request: Request, batch_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Score and store an NDJSON request body in micro-batches, yielding one NDJSON ack per batch
+
+    Without a ``batch_id``, an import batch is created when the stream opens (its size is
+    not known yet, so it is recorded with 0 records) and every chunk is stored under it.
+    """
+    if batch_id is None:
+        batch_id = await supabase_client.create_import_batch(STREAM_IMPORT_FILENAME, 0)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_MAX_PENDING_CHUNKS)
+    reader = asyncio.create_task(_read_chunks(request, queue))
+    
+    summary = {'done': True, 'import_batch_id': batch_id, 'chunks': 0, 'total_received': 0,
+               'total_stored': 0, 'total_skipped': 0, 'total_rejected': 0, 'failed_chunks': 0, 'error': None}
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                summary['error'] = str(chunk)
+                break
+            
+            ack = await _store_chunk(chunk, batch_id)
+            summary['chunks'] += 1
+            summary['total_received'] += ack['received']
+            summary['total_stored'] += len(ack['stored_ids'])
+            summary['total_skipped'] += ack['skipped']
+            summary['total_rejected'] += len(ack['rejected_rows'])
+            summary['failed_chunks'] += ack['error'] is not None
+            yield (json.dumps(ack) + "\n").encode()
+        
+        yield (json.dumps(summary) + "\n").encode()
+    finally:
+        reader.cancel()
@@ -0,0 +1,158 @@
+"""Test setup: the service modules read their configuration when imported, so point them
+at throwaway local stores and a dummy Supabase before any test imports them.
+
+Shared fixtures: ``postgrest``, an in-memory stand-in for the PostgREST API that the
+Supabase client is pointed at, ``anomaly_rows``, a generator of valid anomalies, and
+``api``, a factory of HTTP clients calling the app in-process.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import uuid
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+# The benchmark harness is code under test too
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "benchmarks"))
+
+_data_dir = tempfile.mkdtemp(prefix="tams-tests-")
+os.environ.update({
+    "SUPABASE_URL": "http://supabase.invalid",
+    "SUPABASE_ROLE_KEY": "test",
+    "TAMS_DEDUP_ENABLED": "false",
+    "TAMS_OUTBOX_ENABLED": "false",
+    "TAMS_AUTOTUNE_ENABLED": "false",
+    "TAMS_IMPORT_CHUNK_ROWS": "100",
+    "TAMS_DB_INSERT_CHUNK_SIZE": "50",
+    "TAMS_DB_MAX_CONCURRENT_INSERTS": "1",
+    "TAMS_DEDUP_DB_PATH": os.path.join(_data_dir, "fingerprints.sqlite3"),
+    "TAMS_NEARDUP_DB_PATH": os.path.join(_data_dir, "near_duplicates.sqlite3"),
+    "TAMS_AGGREGATES_DB_PATH": os.path.join(_data_dir, "aggregates.sqlite3"),
+    "TAMS_OUTBOX_DB_PATH": os.path.join(_data_dir, "outbox.sqlite3"),
+    "TAMS_IMPORT_CHECKPOINT_DB_PATH": os.path.join(_data_dir, "import_checkpoints.sqlite3"),
+})
+
+import httpx
+import pytest
+
+SYSTEMS = ["Pompe", "Vanne", "Compresseur", "Turbine", "Echangeur", "Moteur"]
+WORDS = [
+    "fuite", "vibration", "corrosion", "bruit", "surchauffe", "pression", "joint",
+    "roulement", "alarme", "niveau", "huile", "defaut", "capteur", "arret", "usure"
+]
+
+class FakePostgREST(httpx.AsyncBaseTransport):
+    """In-memory PostgREST API: the requests the Supabase client sends, answered like PostgREST does
+
+    Inserts assign IDs to rows that have none; upserts ignoring duplicates leave out the
+    IDs already stored and return only the inserted rows. Reads support ``select``, ID
+    order, the ``id=gt.`` cursor, ``limit`` and ``column=eq.value`` filters; updates the
+    ``id=in.(...)`` filter. Anomaly inserts numbered in ``fail`` (from 1) time out, inserts
+    of a row whose ID is in ``reject`` are refused with a 400, and every request takes
+    ``latency`` seconds.
+    """
+
+    def __init__(self, fail=(), latency: float = 0.0):
+        self.tables = {}
+        self.fail = set(fail)
+        self.reject = set()
+        self.latency = latency
+        self.inserts = 0
+
+    def rows(self, table: str = "anomalies") -> dict:
+        return self.tables.setdefault(table, {})
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        table = self.rows(request.url.path.rstrip("/").rsplit("/", 1)[-1])
+        query = dict(request.url.params)
+        if request.method == "POST" and request.url.path.endswith("/anomalies"):
+            self.inserts += 1
+            if self.inserts in self.fail:
+                await asyncio.sleep(self.latency)
+                raise httpx.ReadTimeout("simulated timeout", request=request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = json.loads(request.content or b"null")
+
+        if request.method == "GET":
+            return httpx.Response(200, json=self._select(table, query))
+        if request.method == "PATCH":
+            for row_id in query.get("id", "in.()")[4:-1].split(","):
+                if row_id in table:
+                    table[row_id].update(body)
+            return httpx.Response(204)
+
+        rows = body if isinstance(body, list) else [body]
+        if any(row.get("id") in self.reject for row in rows):
+            return httpx.Response(400, json={"message": "new row violates check constraint"})
+        stored = [dict(row, id=row.get("id") or str(uuid.uuid4())) for row in rows]
+        prefer = request.headers.get("prefer", "")
+        if "resolution=ignore-duplicates" in prefer:
+            # Like ON CONFLICT DO NOTHING ... RETURNING: rows already stored are left out
+            stored = [row for row in stored if row["id"] not in table]
+        for row in stored:
+            table.setdefault(row["id"], row)
+        if "return=minimal" in prefer:
+            return httpx.Response(201)
+        if "select" in query:
+            columns = query["select"].split(",")
+            stored = [{column: row.get(column) for column in columns} for row in stored]
+        return httpx.Response(201, json=stored)
+
+    @staticmethod
+    def _select(table: dict, query: dict) -> list:
+        after = query.get("id", "gt.")[3:]
+        filters = {
+            column: value[3:] for column, value in query.items()
+            if column not in ("id", "select", "order", "limit") and value.startswith("eq.")
+        }
+        page = [
+            row_id for row_id in sorted(table)
+            if row_id > after and all(str(table[row_id].get(column)) == value for column, value in filters.items())
+        ][:int(query.get("limit", len(table) or 1))]
+        columns = query["select"].split(",") if "select" in query else None
+        return [
+            {column: table[row_id].get(column) for column in columns} if columns else dict(table[row_id])
+            for row_id in page
+        ]
+
+@pytest.fixture
+def postgrest():
+    """Point the Supabase client at a fresh FakePostgREST for the duration of a test"""
+    from database import supabase_client
+
+    fake = FakePostgREST()
+    supabase_client._client = httpx.AsyncClient(
+        base_url=supabase_client.rest_url, headers=supabase_client.headers, transport=fake
+    )
+    yield fake
+    supabase_client._client = None
+
+@pytest.fixture
+def anomaly_rows():
+    """Factory of ``count`` valid anomalies in API field names, the same ones for the same seed"""
+    def make(count: int, seed: int = 0) -> list:
+        rng = random.Random(seed)
+        return [
+            {
+                "num_equipement": f"EQ{rng.randrange(5000):04d}",
+                "systeme": rng.choice(SYSTEMS),
+                "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))),
+                "date_detection": "2025-01-15",
+                "section_proprietaire": f"S{rng.randrange(20)}"
+            }
+            for _ in range(count)
+        ]
+    return make
+
+@pytest.fixture
+def api():
+    """Factory of HTTP clients that call the FastAPI app in-process, to use inside the test's event loop"""
+    from main import app
+
+    def client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://tams")
+    return client
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+import admission
+from admission import ImportGate
+
+@pytest.fixture
+def gate(monkeypatch):
+    """A fresh gate of one slot and one waiting place, installed in front of the app"""
+    monkeypatch.setattr(admission, "MAX_CONCURRENT_IMPORTS", 1)
+    monkeypatch.setattr(admission, "IMPORT_QUEUE_SIZE", 1)
+    monkeypatch.setattr(admission, "IMPORT_QUEUE_TIMEOUT", 5.0)
+    fresh = ImportGate()
+    monkeypatch.setattr(admission, "import_gate", fresh)
+    return fresh
+
+def test_gate_queues_one_import_and_refuses_the_next(gate):
+    async def scenario():
+        assert await gate.acquire() is None
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0.01)
+        assert gate.stats()["waiting"] == 1
+        assert await gate.acquire() == (429, "Too many imports in progress")
+        gate.release()
+        assert await waiter is None
+        gate.release()
+
+    asyncio.run(scenario())
+    stats = gate.stats()
+    assert stats["admitted"] == 2
+    assert stats["queued"] == 1
+    assert stats["rejected_busy"] == 1
+    assert stats["active"] == 0 and stats["waiting"] == 0
+
+def test_import_that_waits_too_long_is_refused(gate, monkeypatch):
+    monkeypatch.setattr(admission, "IMPORT_QUEUE_TIMEOUT", 0.05)
+
+    async def scenario():
+        assert await gate.acquire() is None
+        assert await gate.acquire() == (503, "Timed out waiting for an import slot")
+        gate.release()
+
+    asyncio.run(scenario())
+    stats = gate.stats()
+    assert stats["rejected_timeout"] == 1
+    assert stats["waiting"] == 0
+
+def test_busy_import_endpoint_answers_429_with_retry_after(gate, api, monkeypatch):
+    monkeypatch.setattr(admission, "IMPORT_QUEUE_SIZE", 0)
+
+    async def scenario():
+        await gate.acquire()
+        try:
+            async with api() as client:
+                refused = await client.post("/store/batch", json={"anomalies": []})
+                # Endpoints outside the import paths are not gated
+                health = await client.get("/stats/admission")
+        finally:
+            gate.release()
+        return refused, health
+
+    refused, health = asyncio.run(scenario())
+    assert refused.status_code == 429
+    assert refused.headers["retry-after"] == str(admission.IMPORT_RETRY_AFTER)
+    assert health.status_code == 200
+    assert health.json()["rejected_busy"] == 1
+
+def test_oversized_body_is_refused_with_413(gate, api, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_UPLOAD_BYTES", 100)
+    body = json.dumps({"anomalies": [{"description": "x" * 200}]}).encode()
+
+    async def chunks():
+        for start in range(0, len(body), 50):
+            yield body[start:start + 50]
+
+    async def scenario():
+        async with api() as client:
+            declared = await client.post("/store/batch", content=body, headers={"content-type": "application/json"})
+            # Without Content-Length the limit is enforced while the body is received
+            streamed = await client.post("/store/batch", content=chunks(), headers={"content-type": "application/json"})
+        return declared, streamed
+
+    declared, streamed = asyncio.run(scenario())
+    assert declared.status_code == 413
+    assert streamed.status_code == 413
+    assert "100 bytes" in streamed.json()["detail"]
+    stats = gate.stats()
+    assert stats["rejected_too_large"] == 2
+    # The streamed request was admitted before its size was known, and released after
+    assert stats["admitted"] == 1 and stats["active"] == 0
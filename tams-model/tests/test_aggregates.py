@@ -0,0 +1,85 @@
+import asyncio
+
+import aggregates
+from aggregates import CriticalityAggregates
+
+def stored(anomaly_id: str, system: str, scores: tuple, equipment: str = "EQ-1", service: str = "S1") -> dict:
+    """A stored anomaly row with its three scores and their sum as criticality"""
+    return {
+        "id": anomaly_id, "system_id": system, "equipement_id": equipment, "service": service,
+        "ai_fiabilite_integrite_score": scores[0], "ai_disponibilite_score": scores[1],
+        "ai_process_safety_score": scores[2], "ai_criticality_level": sum(scores),
+    }
+
+ROWS = [
+    stored("a1", "Pompe", (5, 4, 3)),
+    stored("a2", "Pompe", (1, 1, 1), equipment="EQ-2"),
+    stored("a3", "Pompe", (2, 2, 2)),
+    stored("a4", "Vanne", (5, 5, 5), service="S2"),
+]
+
+def test_recorded_anomalies_are_counted_per_group(tmp_path):
+    counts = CriticalityAggregates(str(tmp_path / "aggregates.sqlite3"))
+    broken = {**stored("a5", " Vanne ", (1, 1, 1)), "ai_fiabilite_integrite_score": None, "ai_disponibilite_score": "x",
+              "ai_process_safety_score": 9, "ai_criticality_level": 10}
+    counts.record(ROWS + [broken])
+
+    stats = counts.stats()
+    assert stats["pending"] == 5
+    assert stats["overall"]["count"] == 5
+    assert stats["overall"]["high_criticality"] == 3
+    # Groups are sorted by count, keys stripped
+    assert list(stats["system_id"]) == ["Pompe", "Vanne"]
+    assert stats["system_id"]["Pompe"]["ai_criticality_level"] == {"3": 1, "6": 1, "12": 1}
+    assert stats["system_id"]["Pompe"]["ai_fiabilite_integrite_score"] == {"1": 1, "2": 1, "5": 1}
+    # Missing and out-of-range scores are counted but left out of the histograms
+    assert stats["system_id"]["Vanne"]["ai_disponibilite_score"] == {"5": 1}
+    assert stats["equipement_id"]["EQ-1"]["count"] == 4
+
+    only_systems = counts.stats("system_id", limit=1)
+    assert list(only_systems["system_id"]) == ["Pompe"]
+    assert "service" not in only_systems
+
+def test_workers_converge_through_the_shared_store(tmp_path):
+    path = str(tmp_path / "aggregates.sqlite3")
+    here, other = CriticalityAggregates(path), CriticalityAggregates(path)
+    here.record(ROWS[:2])
+    other.record(ROWS[2:])
+
+    assert here.persist() == 2
+    assert other.persist() == 2
+    assert here.persist() == 0
+    for counts in (here, other):
+        stats = counts.stats()
+        assert stats["pending"] == 0
+        assert stats["overall"]["count"] == 4
+        assert stats["system_id"]["Pompe"]["count"] == 3
+
+    restarted = CriticalityAggregates(path)
+    restarted.load()
+    assert restarted.stats()["loaded"]
+    assert restarted.stats()["service"]["S2"]["count"] == 1
+
+def test_rebuild_recounts_the_table_without_the_pending_anomalies(tmp_path, postgrest, monkeypatch):
+    monkeypatch.setattr(aggregates, "AGGREGATES_REBUILD_PAGE_SIZE", 2)
+    postgrest.tables["anomalies"] = {row["id"]: dict(row) for row in ROWS}
+    counts = CriticalityAggregates(str(tmp_path / "aggregates.sqlite3"))
+    # Stored through this process and not persisted yet: the scan must not count it again
+    counts.record([ROWS[3]])
+
+    assert asyncio.run(counts.rebuild()) == 4
+    stats = counts.stats()
+    assert stats["overall"]["count"] == 4
+    assert stats["pending"] == 1
+    assert stats["rebuilt_at"] is not None
+    # The store is only rebuilt when asked to, or when it was never filled
+    assert asyncio.run(counts.rebuild(force=False)) is None
+
+def test_unknown_dimension_is_refused(api):
+    async def scenario():
+        async with api() as client:
+            return await client.get("/stats/criticality", params={"dimension": "unit"})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Unknown dimension: unit")
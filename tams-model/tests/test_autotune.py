@@ -0,0 +1,74 @@
+from autotune import BatchSizeTuner
+
+def run_units(tuner: BatchSizeTuner, seconds_for, units: int, row_bytes: float = None) -> list:
+    """Feed the tuner ``units`` full-size units timed by ``seconds_for(rows)``, returning each unit's latency"""
+    latencies = []
+    for _ in range(units):
+        size = tuner.size(row_bytes)
+        seconds = seconds_for(size)
+        tuner.record(size, seconds, size)
+        latencies.append(seconds)
+    return latencies
+
+def tuner(initial: int = 100, max_latency_ms: float = 1000, max_mb: float = 1024, enabled: bool = True) -> BatchSizeTuner:
+    return BatchSizeTuner("test", initial, 10, 100_000, max_latency_ms, max_mb, enabled)
+
+def test_climbs_while_larger_units_are_faster():
+    # A fixed cost per unit makes larger units faster per row
+    climbing = tuner()
+    run_units(climbing, lambda rows: 0.01 + rows * 1e-5, 60)
+    stats = climbing.stats()
+    assert stats["size"] > 1000
+    assert stats["adjustments"]["grow"] > 0
+    assert stats["adjustments"]["latency"] == 0
+
+def test_backs_off_when_larger_units_are_slower():
+    # A cost per row that grows with the unit makes smaller units faster per row
+    backing_off = tuner(initial=1000)
+    run_units(backing_off, lambda rows: rows * 1e-5 * (1 + rows / 1000), 60)
+    stats = backing_off.stats()
+    assert stats["size"] < 1000
+    assert stats["adjustments"]["grow"] >= 1
+    assert stats["adjustments"]["shrink"] > stats["adjustments"]["grow"]
+
+def test_does_not_grow_past_the_latency_bound():
+    bounded = tuner(max_latency_ms=50)
+    latencies = run_units(bounded, lambda rows: 0.01 + rows * 1e-4, 60)
+    assert max(latencies) <= 0.05
+    assert bounded.stats()["adjustments"]["latency"] == 0
+    assert bounded.size() * 1e-4 + 0.01 <= 0.05
+
+def test_unit_slower_than_the_bound_shrinks_the_size_at_once():
+    slowed = tuner(initial=1000)
+    slowed.record(1000, 2.0, 1000)
+    stats = slowed.stats()
+    # What would have fitted in the 1 s bound, with a fifth of margin
+    assert stats["size"] == 400
+    assert stats["adjustments"]["latency"] == 1
+    assert stats["last_change"]["reason"] == "latency"
+
+def test_memory_bound_caps_the_size_for_the_row_width():
+    capped = tuner(initial=5000, max_mb=1)
+    assert capped.size(row_bytes=1024) == 1024
+    assert capped.stats()["adjustments"]["memory"] == 1
+    # Climbing stays under the cap
+    run_units(capped, lambda rows: 0.01 + rows * 1e-5, 60, row_bytes=1024)
+    assert capped.size(row_bytes=1024) <= 1024
+
+def test_short_and_stale_units_do_not_move_the_size():
+    steady = tuner(initial=1000)
+    for _ in range(10):
+        # The last unit of a batch, and a unit sized before the last change
+        steady.record(300, 0.001, 1000)
+        steady.record(500, 0.001, 500)
+    stats = steady.stats()
+    assert stats["size"] == 1000
+    assert stats["units"] == 20
+
+def test_disabled_tuner_keeps_the_initial_size():
+    fixed = tuner(initial=5000, max_latency_ms=1, max_mb=1, enabled=False)
+    run_units(fixed, lambda rows: 1.0, 10, row_bytes=1024)
+    stats = fixed.stats()
+    assert stats["size"] == 5000
+    assert stats["units"] == 10
+    assert not any(stats["adjustments"].values())
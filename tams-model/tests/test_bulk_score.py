@@ -0,0 +1,56 @@
+import json
+import sys
+
+import pandas as pd
+
+import bulk_score
+from ingestion import ScoredBatch
+
+def export(path, rows: list) -> str:
+    """A CSV export of ``rows`` with the source column names"""
+    pd.DataFrame(rows).rename(columns={
+        "num_equipement": "Num_equipement", "systeme": "Systeme", "description": "Description"
+    }).to_csv(path, index=False)
+    return str(path)
+
+def run_cli(monkeypatch, *args: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["bulk_score.py", "--workers", "1", *args])
+    bulk_score.main()
+
+def test_merge_offsets_positions_and_skips_repeats_across_chunks():
+    first = ScoredBatch([{"id": "a"}, {"id": "b"}], [{"row": 1, "reasons": ["x"]}], fingerprints=["fa", "fb"])
+    second = ScoredBatch([{"id": "c"}, {"id": "b2"}], [{"row": 0, "reasons": ["y"]}], fingerprints=["fc", "fb"])
+
+    merged = bulk_score._merge([first, second], [0, 3])
+    assert [row["id"] for row in merged.rows] == ["a", "b", "c"]
+    assert merged.fingerprints == ["fa", "fb", "fc"]
+    assert merged.skipped == 1
+    assert [entry["row"] for entry in merged.rejected_rows] == [1, 3]
+
+def test_inputs_are_scored_to_a_file_with_their_rejected_rows(tmp_path, anomaly_rows, monkeypatch, capsys):
+    rows = anomaly_rows(25, 20)
+    rows[17]["description"] = ""
+    first = export(tmp_path / "first.csv", rows)
+    second = export(tmp_path / "second.csv", anomaly_rows(5, 21))
+    output, rejected = tmp_path / "scored.parquet", tmp_path / "rejected.jsonl"
+
+    run_cli(monkeypatch, first, second, "--output", str(output), "--rejected", str(rejected), "--chunk-rows", "10")
+    scored = pd.read_parquet(output)
+    assert scored["source"].value_counts().to_dict() == {"first.csv": 24, "second.csv": 5}
+    assert scored["ai_criticality_level"].between(3, 15).all()
+    # Positions count from the start of the input, across the chunks sent to the workers
+    assert [json.loads(line) for line in rejected.read_text().splitlines()] == [
+        {"row": 17, "reasons": ["Missing required field: description"], "source": "first.csv"}
+    ]
+    assert "total: 30 rows, 29 scored" in capsys.readouterr().out
+
+def test_stored_input_becomes_a_checkpointed_import(tmp_path, anomaly_rows, postgrest, monkeypatch, capsys):
+    source = export(tmp_path / "history.csv", anomaly_rows(230, 22))
+
+    run_cli(monkeypatch, source, "--store", "--chunk-rows", "100")
+    out = capsys.readouterr().out
+    assert "history.csv: 230 rows, 230 scored" in out
+    assert ": 230 stored" in out
+    stored = postgrest.rows()
+    assert len(stored) == 230
+    assert len({row["import_batch_id"] for row in stored.values()}) == 1
@@ -0,0 +1,74 @@
+import asyncio
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as pa_ipc
+import pytest
+from fastapi import UploadFile
+
+from file_processor import FileProcessor
+
+def source_frame(rows: list) -> pd.DataFrame:
+    """Rows with the source column names of an export, plus a column nobody needs"""
+    source_names = {canonical: source for source, canonical in FileProcessor.COLUMN_MAPPING.items()}
+    df = pd.DataFrame(rows).rename(columns=source_names)
+    df["Commentaire interne"] = "ignored"
+    return df
+
+def upload(data: bytes, filename: str) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename, size=len(data))
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def arrow_bytes(df: pd.DataFrame, stream: bool) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    writer = pa_ipc.new_stream if stream else pa_ipc.new_file
+    with writer(sink, table.schema) as ipc:
+        ipc.write_table(table)
+    return sink.getvalue()
+
+def test_parquet_upload_reads_only_the_mapped_columns(anomaly_rows):
+    rows = anomaly_rows(20)
+    df = asyncio.run(FileProcessor.process_parquet_file(upload(parquet_bytes(source_frame(rows)), "a.parquet")))
+    assert list(df.columns) == FileProcessor.REQUIRED_COLUMNS + ["date_detection", "section_proprietaire"]
+    assert df["num_equipement"].tolist() == [row["num_equipement"] for row in rows]
+
+@pytest.mark.parametrize("stream", [False, True], ids=["file", "stream"])
+def test_arrow_upload_reads_both_ipc_formats(anomaly_rows, stream):
+    rows = anomaly_rows(20)
+    data = arrow_bytes(source_frame(rows), stream)
+    df = asyncio.run(FileProcessor.process_arrow_file(upload(data, "a.arrow")))
+    assert len(df) == 20
+    assert "Commentaire interne" not in df.columns
+    assert df["description"].tolist() == [row["description"] for row in rows]
+
+def test_columnar_upload_without_a_required_column_is_refused(anomaly_rows):
+    df = source_frame(anomaly_rows(5)).drop(columns=["Systeme"])
+    with pytest.raises(Exception, match="Missing required columns"):
+        asyncio.run(FileProcessor.process_parquet_file(upload(parquet_bytes(df), "a.parquet")))
+
+def test_parquet_file_endpoint_stores_every_row(postgrest, anomaly_rows, api):
+    async def scenario():
+        data = parquet_bytes(source_frame(anomaly_rows(120, 3)))
+        async with api() as client:
+            response = await client.post("/store/file/parquet", files={"file": ("anomalies.parquet", data)})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        assert body["total_stored"] == 120
+        assert body["import_batch_id"]
+        assert len(postgrest.rows()) == 120
+
+    asyncio.run(scenario())
+
+def test_arrow_file_endpoint_refuses_other_extensions(api):
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/store/file/arrow", files={"file": ("anomalies.csv", b"a,b\n")})
+        assert response.status_code == 400
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+import codecs
+import csv
+import io
+
+import pytest
+
+import file_processor
+from file_processor import FileProcessor
+
+ROWS = [
+    ["EQ-101", "Pompe", "Fuite détectée au presse-étoupe, coût estimé 1200 €"],
+    ["EQ-102", "Vanne", "Corrosion sur la bride;\nà reprendre lors de l'arrêt"],
+    ["EQ-103", "Échangeur", "Encrassement côté calandre"],
+]
+
+def csv_bytes(delimiter: str, encoding: str, rows: list = ROWS) -> bytes:
+    """A CSV export with the source column names, plus a column nobody needs"""
+    text = io.StringIO()
+    writer = csv.writer(text, delimiter=delimiter, lineterminator="\r\n")
+    writer.writerow(["Num_equipement", "Systeme", "Description", "Commentaire interne"])
+    writer.writerows(row + ["ignored"] for row in rows)
+    return text.getvalue().encode(encoding)
+
+@pytest.mark.parametrize("encoding, expected", [
+    ("utf-8", "utf-8"),
+    ("utf-8-sig", "utf-8-sig"),
+    ("cp1252", "cp1252"),
+])
+@pytest.mark.parametrize("delimiter", [",", ";", "\t", "|"], ids=["comma", "semicolon", "tab", "pipe"])
+def test_encoding_and_delimiter_are_detected(encoding, expected, delimiter):
+    df, detected_encoding, detected_delimiter = FileProcessor.read_csv_stream(
+        io.BytesIO(csv_bytes(delimiter, encoding))
+    )
+    assert (detected_encoding, detected_delimiter) == (expected, delimiter)
+    # Only the mapped columns are read, with the header's BOM stripped
+    assert list(df.columns) == ["Num_equipement", "Systeme", "Description"]
+    assert df.values.tolist() == ROWS
+
+def test_quoted_values_may_span_lines():
+    df, _, _ = FileProcessor.read_csv_stream(io.BytesIO(csv_bytes(";", "utf-8")))
+    assert len(df) == 3
+    assert df["Description"][1] == "Corrosion sur la bride;\nà reprendre lors de l'arrêt"
+
+def test_sample_ending_inside_a_character_is_still_utf8(monkeypatch):
+    data = csv_bytes(",", "utf-8")
+    # Cut the sample in the middle of the two bytes of "é"
+    monkeypatch.setattr(file_processor, "CSV_SNIFF_BYTES", data.index("é".encode()) + 1)
+    encoding, delimiter = FileProcessor._sniff_csv(data[:file_processor.CSV_SNIFF_BYTES])
+    assert (encoding, delimiter) == ("utf-8", ",")
+    df, _, _ = FileProcessor.read_csv_stream(io.BytesIO(data))
+    assert df["Description"][0] == ROWS[0][2]
+
+def test_single_column_header_falls_back_to_a_comma():
+    assert FileProcessor._sniff_csv(codecs.BOM_UTF8 + b"Description\r\n") == ("utf-8-sig", ",")
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import database
+from database import PartialInsertError, supabase_client
+from scheduler import LANE_BULK, PriorityScheduler
+
+def with_ids(rows: list) -> list:
+    return [dict(row, id=f"00000000-0000-0000-0000-{position:012d}") for position, row in enumerate(rows)]
+
+@pytest.fixture
+def concurrent_inserts(monkeypatch):
+    """Send up to three insert requests at once"""
+    monkeypatch.setattr(database, "DB_MAX_CONCURRENT_INSERTS", 3)
+    monkeypatch.setattr(supabase_client, "scheduler", PriorityScheduler("storage", 20, {LANE_BULK: 3}))
+
+def test_chunked_upsert_reports_each_request_as_it_completes(postgrest, anomaly_rows, concurrent_inserts):
+    async def scenario():
+        rows = with_ids(anomaly_rows(500))
+        reported = []
+
+        async def on_inserted(inserted):
+            reported.extend(row["id"] for row in inserted)
+
+        inserted = await supabase_client.upsert_anomalies_chunk(rows, 0, on_inserted)
+        assert sorted(row["id"] for row in inserted) == sorted(reported) == sorted(postgrest.rows())
+        assert len(reported) == 500
+        # Sized by the insert tuner: 50 rows per request
+        assert postgrest.inserts == 10
+
+        # Sent again, nothing is inserted twice
+        reported.clear()
+        assert await supabase_client.upsert_anomalies_chunk(rows, 0, on_inserted) == []
+        assert reported == []
+
+    asyncio.run(scenario())
+
+def test_failed_request_cancels_the_other_senders(postgrest, anomaly_rows, concurrent_inserts):
+    async def scenario():
+        postgrest.latency = 0.01
+        postgrest.fail = {2}
+        reported = []
+
+        async def on_inserted(inserted):
+            reported.extend(row["id"] for row in inserted)
+
+        with pytest.raises(PartialInsertError, match="simulated timeout") as failure:
+            await supabase_client.upsert_anomalies_chunk(with_ids(anomaly_rows(500)), 0, on_inserted)
+        sent, reported_at_failure = postgrest.inserts, list(reported)
+        await asyncio.sleep(0.05)
+        # Nothing is sent or reported once the insert has failed
+        assert postgrest.inserts == sent < 10
+        assert reported == reported_at_failure
+        # What the error reports is exactly what was stored
+        assert sorted(row["id"] for row in failure.value.inserted) == sorted(reported) == sorted(postgrest.rows())
+
+    asyncio.run(scenario())
+
+def test_batch_is_stored_in_one_request(postgrest, anomaly_rows):
+    async def scenario():
+        stored = await supabase_client.create_anomalies_batch(anomaly_rows(120), "batch-1")
+        assert len(stored) == 120 == len(postgrest.rows())
+        assert postgrest.inserts == 1
+        assert {row["import_batch_id"] for row in postgrest.rows().values()} == {"batch-1"}
+
+    asyncio.run(scenario())
+
+def test_failed_batch_stores_nothing(postgrest, anomaly_rows):
+    async def scenario():
+        postgrest.fail = {1}
+        failed_before = supabase_client.stats()["failed_requests"]
+        with pytest.raises(Exception, match="Error creating anomalies batch"):
+            await supabase_client.create_anomalies_batch(anomaly_rows(120), "batch-1")
+        assert postgrest.rows() == {}
+        assert supabase_client.stats()["failed_requests"] == failed_before + 1
+
+    asyncio.run(scenario())
+
+def test_pages_are_read_by_keyset(postgrest, anomaly_rows):
+    async def scenario():
+        rows = with_ids(anomaly_rows(25))
+        await supabase_client.upsert_anomalies(rows)
+        seen, after = [], None
+        while True:
+            page = await supabase_client.select_page("anomalies", ["id", "description"], after, limit=10)
+            if not page:
+                break
+            seen.extend(page)
+            after = page[-1]["id"]
+        assert [row["id"] for row in seen] == [row["id"] for row in rows]
+        assert set(seen[0]) == {"id", "description"}
+
+    asyncio.run(scenario())
+
+def test_pages_can_be_filtered(postgrest, anomaly_rows):
+    async def scenario():
+        rows = with_ids(anomaly_rows(25))
+        for position, row in enumerate(rows):
+            row["ai_scorer"] = "rules" if position % 3 == 0 else "model"
+        await supabase_client.upsert_anomalies(rows)
+        page = await supabase_client.select_page(
+            "anomalies", ["id"], rows[0]["id"], limit=100, filters={"ai_scorer": "eq.rules"}
+        )
+        assert [row["id"] for row in page] == [row["id"] for row in rows[3::3]]
+
+    asyncio.run(scenario())
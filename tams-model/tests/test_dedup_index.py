@@ -0,0 +1,51 @@
+import hashlib
+
+import pandas as pd
+
+import dedup_index
+from dedup_index import AnomalyDedupIndex, BloomFilter
+
+def fingerprints(count: int, prefix: str = "anomaly") -> list:
+    return [hashlib.blake2b(f"{prefix}-{i}".encode(), digest_size=16).hexdigest() for i in range(count)]
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    added = fingerprints(5000)
+    bloom.add(added)
+    assert bloom.might_contain(added).all()
+
+def test_stored_fingerprints_are_found_after_restart(tmp_path):
+    path = str(tmp_path / "fingerprints.sqlite3")
+    stored = fingerprints(2000)
+    AnomalyDedupIndex(path).add(stored)
+
+    restarted = AnomalyDedupIndex(path)
+    new = fingerprints(2000, "new")
+    found = restarted.find_stored(stored + new)
+    assert found[:len(stored)].all()
+    assert not found[len(stored):].any()
+
+def test_filter_rebuilt_past_capacity_keeps_every_fingerprint(tmp_path):
+    index = AnomalyDedupIndex(str(tmp_path / "fingerprints.sqlite3"), expected_items=100)
+    stored = fingerprints(1000)
+    for start in range(0, len(stored), 150):
+        index.add(stored[start:start + 150])
+    assert index.find_stored(stored).all()
+
+def test_fingerprints_stored_by_another_worker_are_caught_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup_index, "DEDUP_SYNC_INTERVAL", 0)
+    path = str(tmp_path / "fingerprints.sqlite3")
+    here, other = AnomalyDedupIndex(path), AnomalyDedupIndex(path)
+    here.load()
+    other.add(fingerprints(500))
+    assert here.find_stored(fingerprints(500)).all()
+    other.add(fingerprints(500, "later"))
+    assert here.find_stored(fingerprints(500, "later")).all()
+
+def test_fingerprint_frame_ignores_case_and_whitespace():
+    df = pd.DataFrame({
+        "num_equipement": ["EQ1", "eq1"],
+        "description": ["Fuite  vanne", "fuite vanne "],
+    })
+    first, second = dedup_index.fingerprint_frame(df)
+    assert first == second
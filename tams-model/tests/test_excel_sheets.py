@@ -0,0 +1,81 @@
+import asyncio
+import io
+
+import pandas as pd
+import pytest
+
+import file_processor
+
+@pytest.fixture(autouse=True)
+def sheets_in_threads(monkeypatch):
+    # Spawning the worker processes would dominate the test; the pool is not what is tested
+    monkeypatch.setattr(file_processor, "EXCEL_SHEET_WORKERS", 1)
+
+def workbook(sheets: dict) -> bytes:
+    """An .xlsx file with one sheet per entry of ``sheets``, each a list of anomaly rows"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=name, index=False)
+    return buffer.getvalue()
+
+async def post_workbook(api, data: bytes, sheets: str = None):
+    params = {"sheets": sheets} if sheets else {}
+    async with api() as client:
+        return await client.post(
+            "/store/file/excel", params=params, files={"file": ("units.xlsx", data)}
+        )
+
+def test_each_sheet_is_stored_under_its_own_batch(postgrest, anomaly_rows, api):
+    unit_a = anomaly_rows(12, seed=1)
+    unit_b = anomaly_rows(8, seed=2)
+    unit_b[3]["description"] = ""
+    data = workbook({"Unit A": unit_a, "Unit B": unit_b})
+
+    response = asyncio.run(post_workbook(api, data, "all"))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"]
+    assert body["total_stored"] == 19 == len(postgrest.rows())
+    assert body["total_rejected"] == 1
+    assert [sheet["sheet"] for sheet in body["sheets"]] == ["Unit A", "Unit B"]
+    unit_a_result, unit_b_result = body["sheets"]
+    assert (unit_a_result["total_rows"], unit_a_result["total_stored"]) == (12, 12)
+    assert (unit_b_result["total_rows"], unit_b_result["total_stored"]) == (8, 7)
+    assert unit_b_result["rejected_rows"][0]["reasons"] == ["Missing required field: description"]
+    assert unit_a_result["import_batch_id"] != unit_b_result["import_batch_id"]
+    batches = [row["import_batch_id"] for row in postgrest.rows().values()]
+    assert batches.count(unit_a_result["import_batch_id"]) == 12
+    assert batches.count(unit_b_result["import_batch_id"]) == 7
+
+def test_selected_sheets_only_are_stored(postgrest, anomaly_rows, api):
+    data = workbook({"Unit A": anomaly_rows(5, seed=1), "Unit B": anomaly_rows(6, seed=2)})
+
+    body = asyncio.run(post_workbook(api, data, " Unit B ,Unit B")).json()
+    assert [sheet["sheet"] for sheet in body["sheets"]] == ["Unit B"]
+    assert body["total_stored"] == 6 == len(postgrest.rows())
+
+def test_unknown_sheet_is_refused_with_the_available_ones(postgrest, anomaly_rows, api):
+    data = workbook({"Unit A": anomaly_rows(5)})
+
+    response = asyncio.run(post_workbook(api, data, "Unit A,Unit C"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == {"message": "Unknown sheets: ['Unit C']", "available_sheets": ["Unit A"]}
+    assert postgrest.rows() == {}
+
+def test_failed_sheet_does_not_stop_the_others(postgrest, anomaly_rows, api):
+    data = workbook({"Unit A": anomaly_rows(5, seed=1), "Empty": [{"Remarque": "nothing here"}]})
+
+    body = asyncio.run(post_workbook(api, data, "all")).json()
+    assert not body["success"]
+    assert body["total_stored"] == 5
+    assert body["message"].endswith("failed sheets: Empty")
+    assert body["sheets"][0]["error"] is None
+    assert body["sheets"][1]["error"]
+
+def test_without_sheets_only_the_first_sheet_is_stored(postgrest, anomaly_rows, api):
+    data = workbook({"Unit A": anomaly_rows(5, seed=1), "Unit B": anomaly_rows(6, seed=2)})
+
+    body = asyncio.run(post_workbook(api, data)).json()
+    assert body["total_stored"] == 5 == len(postgrest.rows())
+    assert body["sheets"] == []
@@ -0,0 +1,71 @@
+import gc
+import importlib.util
+import logging
+import multiprocessing
+import os
+
+import pytest
+from gunicorn.config import Config
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+def load_conf():
+    """gunicorn.conf.py as gunicorn reads it: a module executed with the current environment"""
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def gunicorn_config(module) -> Config:
+    """The settings of the module, validated by gunicorn"""
+    cfg = Config()
+    for name, value in vars(module).items():
+        if name in cfg.settings:
+            cfg.set(name, value)
+    return cfg
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    # Set first, so whatever the configuration writes to the environment is undone too
+    for name in ("TAMS_WORKERS", "TAMS_BIND", "PORT", "TAMS_KEEPALIVE", "TAMS_ACCESS_LOG", "TAMS_MAX_REQUESTS"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+
+def test_defaults_preload_one_uvicorn_worker_per_core(clean_env):
+    cfg = gunicorn_config(load_conf())
+    assert cfg.workers == multiprocessing.cpu_count()
+    assert cfg.worker_class.__name__ == "TamsUvicornWorker"
+    assert cfg.worker_class.CONFIG_KWARGS["loop"] == "uvloop"
+    assert cfg.preload_app
+    assert cfg.address == [("0.0.0.0", 8000)]
+    # Idle connections outlive a load balancer's 60 s idle timeout
+    assert cfg.keepalive > 60
+    assert cfg.accesslog is None
+    assert cfg.max_requests == 10000 and cfg.max_requests_jitter > 0
+
+def test_environment_overrides(clean_env, monkeypatch):
+    monkeypatch.setenv("TAMS_WORKERS", "3")
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("TAMS_KEEPALIVE", "120")
+    monkeypatch.setenv("TAMS_ACCESS_LOG", "-")
+    cfg = gunicorn_config(load_conf())
+    assert cfg.workers == 3
+    # Passed on to the app, which divides the scoring slots among the workers
+    assert os.environ["TAMS_WORKERS"] == "3"
+    assert cfg.address == [("0.0.0.0", 9000)]
+    assert cfg.keepalive == 120
+    assert cfg.accesslog == "-"
+
+def test_when_ready_freezes_the_preloaded_heap(clean_env, caplog):
+    conf = load_conf()
+
+    class Server:
+        log = logging.getLogger("gunicorn.test")
+
+    try:
+        with caplog.at_level(logging.INFO, logger="gunicorn.test"):
+            conf.when_ready(Server())
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert f"before forking {conf.workers} workers" in caplog.text
@@ -0,0 +1,139 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+import import_checkpoints as checkpoints
+from aggregates import criticality_aggregates
+from database import supabase_client
+from import_checkpoints import IMPORT_CHUNK_ROWS, import_checkpoints
+from ingestion import score_frame
+
+def aggregated() -> int:
+    return criticality_aggregates.stats()["overall"]["count"]
+
+def stored(postgrest, scored) -> int:
+    anomalies = postgrest.rows()
+    return sum(row["id"] in anomalies for row in scored.rows)
+
+async def checkpointed_import(rows: list):
+    scored = await asyncio.to_thread(score_frame, pd.DataFrame(rows))
+    import_batch_id = await supabase_client.create_import_batch("anomalies.csv", len(rows))
+    await asyncio.to_thread(import_checkpoints.create, import_batch_id, "anomalies.csv", len(rows), scored)
+    return import_batch_id, scored
+
+def test_resume_stores_the_missing_chunks_once(postgrest, anomaly_rows):
+    async def scenario():
+        postgrest.fail = {2, 5}
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(350, 1))
+        before = aggregated()
+
+        progress = await import_checkpoints.run(import_batch_id, scored)
+        assert progress["status"] == "failed"
+        assert progress["resumable"]
+        assert progress["committed_chunks"] < progress["total_chunks"] == 4
+
+        assert import_checkpoints.claim(import_batch_id) is None
+        progress = await import_checkpoints.run(import_batch_id)
+        assert progress["status"] == "completed"
+        assert progress["committed_chunks"] == 4
+        assert progress["stored_rows"] == 350
+        assert stored(postgrest, scored) == 350
+        # Rows committed by the failed attempt are counted once, by that attempt
+        assert aggregated() - before == 350
+        assert import_checkpoints.claim(import_batch_id) == (409, "Import already completed")
+
+    asyncio.run(scenario())
+
+def test_chunk_committed_before_a_crash_is_not_counted_again(postgrest, anomaly_rows):
+    async def scenario():
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(250, 2))
+        # The database committed the first chunk, then the process died before its checkpoint
+        await supabase_client.upsert_anomalies_chunk(scored.rows[:IMPORT_CHUNK_ROWS], 0)
+        before = aggregated()
+
+        progress = await import_checkpoints.run(import_batch_id)
+        assert progress["status"] == "completed"
+        assert progress["stored_rows"] == 250
+        assert stored(postgrest, scored) == 250
+        assert aggregated() - before == 250 - IMPORT_CHUNK_ROWS
+
+    asyncio.run(scenario())
+
+def test_resume_of_unknown_import_is_refused():
+    assert import_checkpoints.claim("00000000-0000-0000-0000-000000000000") == (404, "No checkpoint for this import")
+
+@pytest.fixture
+def tracked_chunks(monkeypatch):
+    """Chunks started by the global import store, in order, and the most in flight at once"""
+    tracked = {"started": [], "active": 0, "peak": 0}
+    store_chunk = import_checkpoints._store_chunk
+
+    async def tracking(import_batch_id, chunk, scored):
+        tracked["started"].append(chunk)
+        tracked["active"] += 1
+        tracked["peak"] = max(tracked["peak"], tracked["active"])
+        try:
+            await store_chunk(import_batch_id, chunk, scored)
+        finally:
+            tracked["active"] -= 1
+
+    monkeypatch.setattr(import_checkpoints, "_store_chunk", tracking)
+    return tracked
+
+def test_chunks_are_started_in_order_within_the_window(postgrest, anomaly_rows, tracked_chunks, monkeypatch):
+    monkeypatch.setattr(checkpoints, "IMPORT_WINDOW_CHUNKS", 2)
+    postgrest.latency = 0.01
+
+    async def scenario():
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(450, 3))
+        return await import_checkpoints.run(import_batch_id, scored), scored
+
+    progress, scored = asyncio.run(scenario())
+    assert progress["status"] == "completed"
+    assert tracked_chunks["started"] == [0, 1, 2, 3, 4]
+    assert tracked_chunks["peak"] == 2
+    assert stored(postgrest, scored) == 450
+
+def test_no_chunk_is_started_after_a_failure(postgrest, anomaly_rows, tracked_chunks, monkeypatch):
+    monkeypatch.setattr(checkpoints, "IMPORT_WINDOW_CHUNKS", 1)
+    # The first of the second chunk's two insert requests times out
+    postgrest.fail = {3}
+
+    async def scenario():
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(450, 4))
+        return await import_checkpoints.run(import_batch_id, scored)
+
+    progress = asyncio.run(scenario())
+    assert progress["status"] == "failed"
+    assert tracked_chunks["started"] == [0, 1]
+    assert progress["committed_chunks"] == 1
+    assert progress["stored_rows"] == IMPORT_CHUNK_ROWS
+
+def test_lease_is_renewed_while_a_slow_chunk_runs(postgrest, anomaly_rows, monkeypatch):
+    monkeypatch.setattr(checkpoints, "IMPORT_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(checkpoints, "IMPORT_WINDOW_CHUNKS", 1)
+    # Each chunk takes two requests of 0.25 s, longer than the lease
+    postgrest.latency = 0.25
+
+    async def scenario():
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(200, 5))
+        running = asyncio.create_task(import_checkpoints.run(import_batch_id, scored))
+        await asyncio.sleep(0.4)
+        assert not import_checkpoints.status(import_batch_id)["resumable"]
+        assert import_checkpoints.claim(import_batch_id) == (409, "Import is still running")
+        return await running
+
+    assert asyncio.run(scenario())["status"] == "completed"
+
+def test_chunk_committed_twice_is_counted_once(postgrest, anomaly_rows):
+    async def scenario():
+        import_batch_id, scored = await checkpointed_import(anomaly_rows(150, 6))
+        return import_batch_id
+
+    import_batch_id = asyncio.run(scenario())
+    for _ in range(2):
+        import_checkpoints._commit_chunk(import_batch_id, 0, IMPORT_CHUNK_ROWS)
+    progress = import_checkpoints.status(import_batch_id)
+    assert progress["committed_chunks"] == 1
+    assert progress["stored_rows"] == IMPORT_CHUNK_ROWS
@@ -0,0 +1,67 @@
+import asyncio
+import io
+import random
+
+import httpx
+import pandas as pd
+import pytest
+
+import loadtest
+from file_processor import FileProcessor
+
+def test_percentiles_are_reported_in_milliseconds():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert loadtest.percentile(samples, 0.50) == pytest.approx(51)
+    assert loadtest.percentile(samples, 0.99) == pytest.approx(100)
+    assert loadtest.percentile([], 0.5) != loadtest.percentile([], 0.5)
+
+def test_summary_has_a_row_per_endpoint_and_a_total():
+    rows = loadtest.summarize({"single": [0.01, 0.02], "batch": [0.1]}, {"single": 1, "batch": 0}, 2.0, 1, 8)
+    assert [row["endpoint"] for row in rows] == ["single", "batch", "all"]
+    assert rows[-1]["requests"] == 3
+    assert rows[-1]["errors"] == 1
+    assert rows[-1]["throughput_rps"] == 1.5
+
+def test_mix_weights_default_to_one_and_unknown_endpoints_are_refused():
+    assert loadtest.parse_mix("single=70,batch") == {"single": 70.0, "batch": 1.0}
+    with pytest.raises(SystemExit):
+        loadtest.parse_mix("single,upload")
+
+@pytest.mark.parametrize("file_type", ["csv", "parquet"])
+def test_generated_files_are_read_back_by_the_upload_readers(file_type):
+    rows = loadtest.make_rows(30, random.Random(1))
+    data = loadtest.make_file(rows, file_type)
+    if file_type == "csv":
+        df, _, _ = FileProcessor.read_csv_stream(io.BytesIO(data))
+        df = FileProcessor._process_dataframe(df)
+    else:
+        df = FileProcessor._process_dataframe(pd.read_parquet(io.BytesIO(data)))
+    assert df["description"].tolist() == [row["description"] for row in rows]
+
+def test_closed_loop_level_against_the_app(postgrest, api):
+    workload = loadtest.Workload({"single": 3, "batch": 1}, batch_size=10, file_rows=10, seed=1)
+
+    async def scenario():
+        async with api() as client:
+            return await loadtest.run_level(client, workload, concurrency=4, duration=0.3)
+
+    samples, errors, elapsed = asyncio.run(scenario())
+    assert errors == {"single": 0, "batch": 0}
+    assert samples["single"] and samples["batch"]
+    assert elapsed >= 0.3
+    stored = len(samples["single"]) + 10 * len(samples["batch"])
+    assert len(postgrest.rows()) == stored
+
+def test_failed_requests_are_counted_as_errors():
+    workload = loadtest.Workload({"single": 1}, batch_size=1, file_rows=1, seed=1)
+
+    def refuse(request):
+        return httpx.Response(500)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse), base_url="http://tams") as client:
+            return await loadtest.run_level(client, workload, concurrency=2, duration=0.05)
+
+    samples, errors, _ = asyncio.run(scenario())
+    assert samples == {"single": []}
+    assert errors["single"] > 0
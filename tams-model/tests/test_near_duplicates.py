@@ -0,0 +1,71 @@
+import asyncio
+import uuid
+
+import near_duplicates
+from near_duplicates import NearDuplicateIndex, minhash_signatures
+
+LEAK = "fuite importante au niveau du joint de la pompe principale cote aspiration"
+REWORDED = "fuite importante au niveau du joint de la pompe principale cote refoulement"
+UNRELATED = "vibration anormale du moteur du ventilateur de refroidissement"
+
+def index_with(path: str, rows: dict) -> NearDuplicateIndex:
+    """An index over ``rows``, anomaly ID -> (equipment, description)"""
+    index = NearDuplicateIndex(path)
+    equipements = [equipement for equipement, _ in rows.values()]
+    index.add(equipements, minhash_signatures([description for _, description in rows.values()]), list(rows))
+    return index
+
+def test_similar_description_on_the_same_equipment_is_found(tmp_path):
+    index = index_with(str(tmp_path / "near.sqlite3"), {"a1": ("EQ-1", LEAK), "a2": ("EQ-1", UNRELATED)})
+
+    found = index.find_candidates(
+        [" eq-1", "EQ-2", "EQ-1", "EQ-1"], minhash_signatures([REWORDED, REWORDED, UNRELATED + " !", "..."])
+    )
+    reworded, other_equipment, unrelated, empty = found
+    assert [candidate["anomaly_id"] for candidate in reworded] == ["a1"]
+    assert reworded[0]["similarity"] >= near_duplicates.NEARDUP_THRESHOLD
+    assert other_equipment == []
+    assert unrelated == [{"anomaly_id": "a2", "similarity": 1.0}]
+    # A description without words matches nothing
+    assert empty == []
+
+def test_signatures_are_reloaded_and_shared_between_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(near_duplicates, "NEARDUP_SYNC_INTERVAL", 0)
+    path = str(tmp_path / "near.sqlite3")
+    here = index_with(path, {"a1": ("EQ-1", LEAK)})
+    # Another worker stores an anomaly after this one loaded the index
+    index_with(path, {"b1": ("EQ-2", LEAK)})
+
+    signature = minhash_signatures([LEAK])
+    assert here.find_candidates(["EQ-2"], signature)[0][0]["anomaly_id"] == "b1"
+    restarted = NearDuplicateIndex(path)
+    assert restarted.find_candidates(["EQ-1"], signature)[0][0]["anomaly_id"] == "a1"
+    assert restarted.stats()["items"] == 2
+
+def test_busy_equipment_keeps_its_most_recent_anomalies(tmp_path, monkeypatch):
+    monkeypatch.setattr(near_duplicates, "NEARDUP_MAX_PER_EQUIPMENT", 2)
+    path = str(tmp_path / "near.sqlite3")
+    index = index_with(path, {f"a{i}": ("EQ-1", f"{LEAK} releve {i}") for i in range(5)})
+
+    assert index.stats()["items"] == 2
+    assert index.stats()["evicted"] == 3
+    found = index.find_candidates(["EQ-1"], minhash_signatures([LEAK]))[0]
+    assert {candidate["anomaly_id"] for candidate in found} <= {"a3", "a4"}
+    # Rows evicted for the cap do not come back from the store
+    restarted = NearDuplicateIndex(path)
+    restarted.load()
+    assert restarted.stats()["items"] == 2
+
+def test_single_store_reports_the_earlier_anomaly(postgrest, api):
+    anomaly = {"num_equipement": f"EQ-{uuid.uuid4().hex[:8]}", "systeme": "Pompe", "description": LEAK}
+
+    async def scenario():
+        async with api() as client:
+            first = await client.post("/store/single", json=anomaly)
+            second = await client.post("/store/single", json={**anomaly, "description": REWORDED})
+        return first.json(), second.json()
+
+    first, second = asyncio.run(scenario())
+    assert first["near_duplicates"] == []
+    assert [candidate["anomaly_id"] for candidate in second["near_duplicates"]] == [first["anomaly_id"]]
+    assert len(postgrest.rows()) == 2
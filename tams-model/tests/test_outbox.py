@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import outbox
+from outbox import AnomalyOutbox
+
+def anomaly(position: int) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{position:012d}",
+        "equipement_id": f"EQ{position}",
+        "description": "fuite vanne",
+        "system_id": "Pompe",
+        "service": "S1",
+        "ai_fiabilite_integrite_score": 2,
+        "ai_disponibilite_score": 3,
+        "ai_process_safety_score": 2,
+        "ai_criticality_level": 7,
+    }
+
+@pytest.fixture
+def queue(tmp_path):
+    return AnomalyOutbox(str(tmp_path / "outbox.sqlite3"))
+
+def test_flush_stores_queued_anomalies_under_their_ids(postgrest, queue):
+    ids = [queue.enqueue(anomaly(position)) for position in range(3)]
+    assert queue.depth() == 3
+    assert asyncio.run(queue.flush()) == 3
+    assert sorted(postgrest.rows()) == sorted(ids)
+    assert queue.depth() == 0
+    assert queue.stats()["flushed"] == 3
+
+def test_outage_backs_off_and_keeps_the_rows(postgrest, queue):
+    async def scenario():
+        postgrest.fail = {1}
+        queue.enqueue(anomaly(0))
+        assert await queue.flush() == 0
+        # Not due again until the backoff has passed
+        assert await queue.flush() == 0
+        stats = queue.stats()
+        assert stats["depth"] == 1
+        assert stats["failed_flushes"] == 1
+        assert "simulated timeout" in stats["last_error"]
+        assert postgrest.rows() == {}
+
+    asyncio.run(scenario())
+
+def test_rejected_rows_are_isolated_and_parked(postgrest, queue, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 1)
+    postgrest.reject = {anomaly(1)["id"]}
+    for position in range(3):
+        queue.enqueue(anomaly(position))
+    assert asyncio.run(queue.flush()) == 2
+    assert sorted(postgrest.rows()) == [anomaly(0)["id"], anomaly(2)["id"]]
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["dead_letters"] == 1
+
+def test_depth_counts_what_every_worker_enqueued(postgrest, queue):
+    other_worker = AnomalyOutbox(queue.db_path)
+    other_worker.enqueue(anomaly(0))
+    queue.enqueue(anomaly(1))
+    assert queue.depth() == other_worker.depth() == 2
+    assert queue.stats()["depth"] == 2
+
+def test_full_batch_across_workers_wakes_the_drainer(postgrest, queue, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_FLUSH_BATCH_SIZE", 5)
+    # Only a wakeup can flush within the test
+    monkeypatch.setattr(outbox, "OUTBOX_FLUSH_INTERVAL", 30)
+
+    async def scenario():
+        queue.start()
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(AnomalyOutbox(queue.db_path).enqueue, anomaly(0))
+        for position in range(1, 5):
+            await asyncio.to_thread(queue.enqueue, anomaly(position))
+        for _ in range(100):
+            if len(postgrest.rows()) == 5:
+                break
+            await asyncio.sleep(0.01)
+        assert len(postgrest.rows()) == 5
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_stop_flushes_what_is_left(postgrest, queue, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_FLUSH_INTERVAL", 30)
+
+    async def scenario():
+        queue.start()
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(queue.enqueue, anomaly(0))
+        assert postgrest.rows() == {}
+        await queue.stop()
+        assert list(postgrest.rows()) == [anomaly(0)["id"]]
+
+    asyncio.run(scenario())
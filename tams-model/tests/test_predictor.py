@@ -0,0 +1,133 @@
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import LabelEncoder
+
+import predictor
+from predictor import SCORER_MODEL, SCORER_RULES, CircuitBreaker, TAMSPredictor
+
+SCORES = ["ai_fiabilite_integrite_score", "ai_disponibilite_score", "ai_process_safety_score", "ai_criticality_level"]
+
+@pytest.fixture
+def trained_predictor(tmp_path, anomaly_rows):
+    """A predictor loading a small model saved like the production one, with its encoders and vectorizer"""
+    df = pd.DataFrame(anomaly_rows(300, 7))
+    encoders = {
+        "Num_equipement": LabelEncoder().fit(df["num_equipement"]),
+        "Systeme": LabelEncoder().fit(df["systeme"]),
+    }
+    vectorizer = CountVectorizer().fit(df["description"])
+    X = np.hstack([
+        encoders["Num_equipement"].transform(df["num_equipement"]).reshape(-1, 1),
+        encoders["Systeme"].transform(df["systeme"]).reshape(-1, 1),
+        vectorizer.transform(df["description"]).toarray(),
+    ])
+    y = np.random.default_rng(7).uniform(1, 5, size=(len(df), 3))
+    path = tmp_path / "multi_output_model.pkl"
+    joblib.dump({
+        "model": RandomForestRegressor(n_estimators=5, random_state=7).fit(X, y),
+        "label_encoders": encoders,
+        "vectorizer": vectorizer,
+    }, path)
+    loaded = TAMSPredictor(str(path))
+    assert loaded.model_loaded
+    return loaded
+
+def test_single_row_features_match_the_dataframe_path(trained_predictor, anomaly_rows):
+    rows = anomaly_rows(20, 8)
+    rows[0]["systeme"] = "Inconnu"
+    rows[1]["num_equipement"] = None
+    rows[2]["description"] = "mots jamais vus"
+    for row in rows:
+        single = trained_predictor._prepare_single_features(row)
+        framed = trained_predictor._prepare_features(pd.DataFrame([row]))
+        np.testing.assert_array_equal(single, framed)
+
+def test_predict_single_scores_like_a_one_row_batch(trained_predictor, anomaly_rows):
+    for row in anomaly_rows(20, 9):
+        single = trained_predictor.predict_single(row)
+        batch = trained_predictor.predict_frame(pd.DataFrame([row]))
+        assert single == {name: int(batch[name][0]) for name in SCORES} | {"ai_scorer": SCORER_MODEL}
+        assert single["ai_criticality_level"] == sum(single[name] for name in SCORES[:3])
+
+def test_predict_single_without_a_model_uses_the_rules(tmp_path):
+    rules_only = TAMSPredictor(str(tmp_path / "missing.pkl"))
+    scores = rules_only.predict_single({"num_equipement": "EQ1", "systeme": "Electrical", "description": "fire in cabinet"})
+    assert scores == {
+        "ai_fiabilite_integrite_score": 4,
+        "ai_disponibilite_score": 4,
+        "ai_process_safety_score": 5,
+        "ai_criticality_level": 13,
+        "ai_scorer": SCORER_RULES,
+    }
+    stats = rules_only.stats()
+    assert stats["rows_by_scorer"] == {SCORER_MODEL: 0, SCORER_RULES: 1}
+    assert stats["fallback_reasons"] == {"no_model": 1}
+
+class SlowModel:
+    """Wraps a model, taking ``delay`` seconds per predict call and noting the threads it ran in"""
+
+    def __init__(self, model, delay: float):
+        self.model = model
+        self.delay = delay
+        self.threads = set()
+
+    def predict(self, X):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return self.model.predict(X)
+
+@pytest.fixture
+def short_deadline(monkeypatch):
+    monkeypatch.setattr(predictor, "PREDICT_DEADLINE_MS", 50)
+    monkeypatch.setattr(predictor, "PREDICT_DEADLINE_PER_ROW_MS", 0)
+
+def test_single_anomaly_past_its_deadline_gets_the_rules(trained_predictor, anomaly_rows, short_deadline):
+    slow = trained_predictor.model = SlowModel(trained_predictor.model, 0.3)
+    row = anomaly_rows(1, 10)[0]
+
+    scores = trained_predictor.predict_single(row)
+    assert scores["ai_scorer"] == SCORER_RULES
+    stats = trained_predictor.stats()
+    assert stats["fallback_reasons"] == {"deadline": 1}
+    assert stats["late_calls"] == 1
+    # The late call finishes in its pool thread and is discarded
+    time.sleep(0.5)
+    assert trained_predictor.stats()["late_calls"] == 0
+    assert all(name.startswith("tams-predict") for name in slow.threads)
+    trained_predictor.shutdown()
+
+def test_batches_wait_for_the_model(trained_predictor, anomaly_rows, short_deadline):
+    trained_predictor.model = SlowModel(trained_predictor.model, 0.1)
+
+    scores = trained_predictor.predict_frame(pd.DataFrame(anomaly_rows(50, 11)))
+    assert set(scores["ai_scorer"]) == {SCORER_MODEL}
+    assert trained_predictor.stats()["fallback_reasons"] == {}
+
+def test_repeated_misses_open_the_breaker(trained_predictor, anomaly_rows, short_deadline):
+    trained_predictor.breaker = CircuitBreaker(failures=2, cooldown=60)
+    slow = trained_predictor.model = SlowModel(trained_predictor.model, 0.1)
+
+    scorers = [trained_predictor.predict_single(row)["ai_scorer"] for row in anomaly_rows(4, 12)]
+    assert scorers == [SCORER_RULES] * 4
+    stats = trained_predictor.stats()
+    assert stats["fallback_reasons"] == {"deadline": 2, "circuit_open": 2}
+    assert stats["breaker"]["state"] == "open"
+    # Once open, the model is not called at all
+    time.sleep(0.2)
+    assert len(slow.threads) <= 2
+    trained_predictor.shutdown()
+
+def test_scoring_threads_are_reused(trained_predictor, anomaly_rows):
+    counted = trained_predictor.model = SlowModel(trained_predictor.model, 0)
+
+    for row in anomaly_rows(20, 13):
+        assert trained_predictor.predict_single(row)["ai_scorer"] == SCORER_MODEL
+    assert 1 <= len(counted.threads) <= predictor.PREDICT_WORKERS
+    trained_predictor.shutdown()
@@ -0,0 +1,56 @@
+import asyncio
+import io
+
+import pandas as pd
+
+from file_processor import FileProcessor
+
+SCORES = ["ai_fiabilite_integrite_score", "ai_disponibilite_score", "ai_process_safety_score"]
+
+def test_batch_preview_returns_parallel_arrays_and_stores_nothing(postgrest, anomaly_rows, api):
+    async def scenario():
+        rows = anomaly_rows(8)
+        rows[5]["systeme"] = ""
+        async with api() as client:
+            response = await client.post("/predict/batch", json=rows)
+        assert response.status_code == 200, response.text
+        preview = response.json()
+        assert preview["total_processed"] == 8
+        assert preview["rows"] == [0, 1, 2, 3, 4, 6, 7]
+        for name in SCORES + ["ai_criticality_level", "ai_scorer", "already_stored"]:
+            assert len(preview[name]) == 7
+        assert all(1 <= score <= 5 for name in SCORES for score in preview[name])
+        assert preview["ai_criticality_level"] == [
+            sum(scores) for scores in zip(*(preview[name] for name in SCORES))
+        ]
+        assert preview["rejected_rows"] == [{"row": 5, "reasons": ["Missing required field: systeme"]}]
+        assert postgrest.rows() == {}
+
+    asyncio.run(scenario())
+
+def test_file_preview_reads_the_format_from_the_extension(postgrest, anomaly_rows, api):
+    async def scenario():
+        source_names = {canonical: source for source, canonical in FileProcessor.COLUMN_MAPPING.items()}
+        df = pd.DataFrame(anomaly_rows(12)).rename(columns=source_names)
+        csv_data = df.to_csv(index=False).encode()
+        parquet = io.BytesIO()
+        df.to_parquet(parquet, index=False)
+        async with api() as client:
+            from_csv = await client.post("/predict/file", files={"file": ("a.csv", csv_data)})
+            from_parquet = await client.post("/predict/file", files={"file": ("a.parquet", parquet.getvalue())})
+            unknown = await client.post("/predict/file", files={"file": ("a.txt", csv_data)})
+        assert from_csv.status_code == from_parquet.status_code == 200
+        assert from_csv.json() == from_parquet.json()
+        assert from_csv.json()["rows"] == list(range(12))
+        assert unknown.status_code == 400
+        assert postgrest.rows() == {}
+
+    asyncio.run(scenario())
+
+def test_empty_batch_preview_is_refused(api):
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/predict/batch", json=[])
+        assert response.status_code == 400
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import pstats
+
+import pytest
+
+import profiling
+from profiling import RequestProfile, profile_requested, profiled
+
+TOKEN = "secret-token"
+
+def scope(headers=(), query=b""):
+    return {"headers": [(name.encode(), value.encode()) for name, value in headers], "query_string": query}
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", TOKEN)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+def worker_only_function(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+def profiled_functions(path: str) -> set:
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+def test_only_the_admin_token_requests_a_profile(profiles, monkeypatch):
+    assert profile_requested(scope([("X-TAMS-Profile", TOKEN)]))
+    assert profile_requested(scope(query=f"profile={TOKEN}".encode()))
+    assert not profile_requested(scope([("X-TAMS-Profile", "wrong")]))
+    assert not profile_requested(scope())
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    assert not profile_requested(scope([("X-TAMS-Profile", "")]))
+
+def test_profiled_outside_a_profiled_request_just_runs():
+    assert profiled(worker_only_function)(10) == 285
+
+@pytest.mark.skipif(profiling.PYINSTRUMENT_AVAILABLE, reason="checks the cProfile output")
+def test_worker_thread_work_is_merged_into_the_request_profile(profiles):
+    async def scenario():
+        profile = RequestProfile("test")
+        token = profiling._active_profile.set(profile)
+        profile.start()
+        try:
+            await asyncio.to_thread(profiled(worker_only_function), 20000)
+        finally:
+            profile.stop()
+            profiling._active_profile.reset(token)
+        summary = await asyncio.to_thread(profile.save)
+        return profile, summary
+
+    profile, summary = asyncio.run(scenario())
+    path = os.path.join(profiles, profile.profile_id + ".prof")
+    assert "1 worker thread profiles" in summary
+    assert "worker_only_function" in profiled_functions(path)
+    assert os.path.exists(os.path.join(profiles, profile.profile_id + ".memory.txt"))
+
+@pytest.mark.skipif(profiling.PYINSTRUMENT_AVAILABLE, reason="checks the cProfile output")
+def test_nested_profiled_calls_use_one_thread_profiler(profiles):
+    async def scenario():
+        profile = RequestProfile("test")
+        token = profiling._active_profile.set(profile)
+        profile.start()
+        try:
+            await asyncio.to_thread(profiled(lambda: profiled(worker_only_function)(10)))
+            # On the event loop thread, the request profiler already sees it
+            profiled(worker_only_function)(10)
+        finally:
+            profile.stop()
+            profiling._active_profile.reset(token)
+        await asyncio.to_thread(profile.save)
+        return profile
+
+    assert len(asyncio.run(scenario())._threads) == 1
+
+def test_thread_finishing_after_the_save_is_left_out(profiles):
+    profile = RequestProfile("test")
+    profile.start()
+    profile.stop()
+    profile.save()
+    profile.add_thread(object())
+    assert profile._threads == []
+
+@pytest.mark.skipif(profiling.PYINSTRUMENT_AVAILABLE, reason="checks the cProfile output")
+def test_profiled_request_includes_its_scoring_thread(profiles, api, anomaly_rows):
+    async def scenario():
+        async with api() as client:
+            return await client.post("/predict/batch", json=anomaly_rows(50), headers={"X-TAMS-Profile": TOKEN})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.headers["x-profiler"] == "cProfile"
+    path = os.path.join(profiles, response.headers["x-profile-id"] + ".prof")
+    assert "preview_frame" in profiled_functions(path)
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import io
+import json
+
+import httpx
+import pandas as pd
+import pytest
+
+import rescore
+from database import supabase_client
+from predictor import predictor
+
+def stored_rows(anomaly_rows, count: int) -> dict:
+    """Stored anomalies with the scores the current scorer gives them, in ID order"""
+    rows = anomaly_rows(count, 30)
+    table = {
+        f"00000000-0000-0000-0000-{position:012d}": {
+            "equipement_id": row["num_equipement"], "description": row["description"],
+            "service": row["section_proprietaire"], "system_id": row["systeme"],
+        }
+        for position, row in enumerate(rows)
+    }
+    return rescored(table)
+
+def rescored(table: dict) -> dict:
+    """The table with the current scorer's scores on every row"""
+    frame = pd.DataFrame({
+        name: [row[column] for row in table.values()] for column, name in rescore.INPUT_COLUMNS.items()
+    })
+    scores = {field: values.tolist() for field, values in predictor.predict_frame(frame).items()}
+    return {
+        anomaly_id: dict(row, id=anomaly_id, **{field: scores[field][position] for field in rescore.SCORED_FIELDS})
+        for position, (anomaly_id, row) in enumerate(table.items())
+    }
+
+def outdate(table: dict, ids: list, scorer: str = "model") -> None:
+    """Give these rows scores from an older model"""
+    for anomaly_id in ids:
+        table[anomaly_id].update(ai_fiabilite_integrite_score=1, ai_criticality_level=0, ai_scorer=scorer)
+
+def connect(postgrest) -> None:
+    # Every run closes the client at the end
+    supabase_client._client = httpx.AsyncClient(
+        base_url=supabase_client.rest_url, headers=supabase_client.headers, transport=postgrest
+    )
+
+def run(postgrest, tmp_path, **options) -> tuple:
+    """Run a rescore against the fake database, returning its exit code and what it said"""
+    connect(postgrest)
+    args = argparse.Namespace(**{
+        "page_size": 10, "concurrency": 2, "checkpoint": str(tmp_path / "checkpoint.json"), "restart": False,
+        "dry_run": False, "rules_only": False, "keep_aggregates": True, **options
+    })
+    said, progress = io.StringIO(), rescore._progress
+    rescore._progress = said
+    try:
+        code = asyncio.run(rescore.rescore(args))
+    finally:
+        rescore._progress = progress
+    return code, said.getvalue()
+
+@pytest.fixture
+def table(postgrest, anomaly_rows):
+    postgrest.tables["anomalies"] = stored_rows(anomaly_rows, 45)
+    return postgrest.tables["anomalies"]
+
+def test_only_changed_rows_are_written(postgrest, table, tmp_path):
+    changed = sorted(table)[::4]
+    outdate(table, changed)
+    before = json.dumps(table, sort_keys=True)
+
+    code, said = run(postgrest, tmp_path, dry_run=True)
+    assert code == 0
+    assert f"45 scanned, {len(changed)} would change" in said
+    assert json.dumps(table, sort_keys=True) == before
+
+    code, said = run(postgrest, tmp_path)
+    assert code == 0
+    assert f"done: 45 scanned, {len(changed)} changed" in said
+    assert json.dumps(table, sort_keys=True) == json.dumps(rescored(table), sort_keys=True)
+    assert json.loads((tmp_path / "checkpoint.json").read_text())["status"] == "completed"
+    # A finished rescore is not run again without --restart
+    assert run(postgrest, tmp_path) == (0, "Already rescored with rules; use --restart to run again\n")
+
+def test_interrupted_rescore_resumes_after_the_last_finished_page(postgrest, table, tmp_path, monkeypatch):
+    ids = sorted(table)
+    outdate(table, ids)
+    update = supabase_client.update_anomalies
+
+    async def failing_update(anomaly_ids, values):
+        # The third page's update fails
+        if anomaly_ids[0] == ids[20]:
+            raise httpx.ReadTimeout("simulated timeout")
+        await update(anomaly_ids, values)
+
+    monkeypatch.setattr(supabase_client, "update_anomalies", failing_update)
+    code, said = run(postgrest, tmp_path, concurrency=1)
+    assert code == 1
+    assert f"run again to resume after {ids[19]}" in said
+    assert table[ids[19]]["ai_scorer"] == "rules"
+    assert table[ids[20]]["ai_scorer"] == "model"
+
+    monkeypatch.setattr(supabase_client, "update_anomalies", update)
+    code, said = run(postgrest, tmp_path)
+    assert code == 0
+    assert f"Resuming after {ids[19]} (20 already scanned)" in said
+    assert "done: 45 scanned, 45 changed" in said
+    assert all(row["ai_scorer"] == "rules" for row in table.values())
+
+def test_rules_only_reads_the_rule_scored_rows(postgrest, table, tmp_path):
+    ids = sorted(table)
+    # Both look outdated, but only the first group was scored by the rules, like the rest
+    # of the table (there is no model here)
+    outdate(table, ids[:5], scorer="rules")
+    outdate(table, ids[5:10], scorer="model")
+
+    code, said = run(postgrest, tmp_path, rules_only=True)
+    assert code == 0
+    assert "done: 40 scanned, 5 changed" in said
+    assert all(table[anomaly_id]["ai_criticality_level"] > 0 for anomaly_id in ids[:5])
+    assert all(table[anomaly_id]["ai_criticality_level"] == 0 for anomaly_id in ids[5:10])
+
+    # The checkpoint belongs to a rules-only run
+    code, said = run(postgrest, tmp_path)
+    assert code == 1
+    assert "run over rule-scored rows only; use --restart" in said
+    code, said = run(postgrest, tmp_path, restart=True)
+    assert code == 0
+    assert "done: 45 scanned, 5 changed" in said
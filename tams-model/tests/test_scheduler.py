@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import LANE_BULK, LANE_INTERACTIVE, PriorityScheduler
+
+def start_waiting(scheduler: PriorityScheduler, lane: str, order: list,
+                  hold: threading.Event = None) -> threading.Thread:
+    """Start a thread that takes a slot of ``lane``, records when it got it and keeps it until ``hold`` is set"""
+    def run():
+        with scheduler.slot(lane):
+            order.append(lane)
+            if hold is not None:
+                hold.wait(5)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def wait_for_waiters(scheduler: PriorityScheduler, lane: str, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while scheduler.stats()["lanes"][lane]["waiting"] < count:
+        assert time.monotonic() < deadline, f"{count} {lane} waiters never queued"
+        time.sleep(0.001)
+
+def test_interactive_waiters_go_before_bulk_waiters_queued_earlier():
+    scheduler = PriorityScheduler("test", 1)
+    order = []
+    with scheduler.slot(LANE_BULK):
+        threads = [start_waiting(scheduler, LANE_BULK, order) for _ in range(2)]
+        wait_for_waiters(scheduler, LANE_BULK, 2)
+        threads += [start_waiting(scheduler, LANE_INTERACTIVE, order) for _ in range(2)]
+        wait_for_waiters(scheduler, LANE_INTERACTIVE, 2)
+    for thread in threads:
+        thread.join(5)
+    assert order == [LANE_INTERACTIVE, LANE_INTERACTIVE, LANE_BULK, LANE_BULK]
+
+def test_new_bulk_work_does_not_overtake_waiting_interactive_work():
+    scheduler = PriorityScheduler("test", 2)
+    order = []
+    first, second = scheduler.slot(LANE_BULK), scheduler.slot(LANE_BULK)
+    first.__enter__()
+    second.__enter__()
+    release_interactive = threading.Event()
+    interactive = start_waiting(scheduler, LANE_INTERACTIVE, order, release_interactive)
+    wait_for_waiters(scheduler, LANE_INTERACTIVE, 1)
+    bulk = start_waiting(scheduler, LANE_BULK, order)
+    wait_for_waiters(scheduler, LANE_BULK, 1)
+    # The first slot freed goes to the interactive waiter, the bulk one keeps waiting
+    first.__exit__(None, None, None)
+    lanes = scheduler.stats()["lanes"]
+    assert lanes[LANE_INTERACTIVE]["running"] == 1
+    assert lanes[LANE_BULK]["waiting"] == 1
+    second.__exit__(None, None, None)
+    bulk.join(5)
+    release_interactive.set()
+    interactive.join(5)
+    assert sorted(order) == [LANE_BULK, LANE_INTERACTIVE]
+
+def test_lane_limit_keeps_slots_free_for_the_other_lane():
+    scheduler = PriorityScheduler("test", 2, lane_limits={LANE_BULK: 1})
+    order = []
+    with scheduler.slot(LANE_BULK):
+        bulk = start_waiting(scheduler, LANE_BULK, order)
+        wait_for_waiters(scheduler, LANE_BULK, 1)
+        assert scheduler.stats()["lanes"][LANE_BULK]["running"] == 1
+        # The second slot is free, but only for interactive work
+        with scheduler.slot(LANE_INTERACTIVE):
+            assert scheduler.stats()["lanes"][LANE_BULK]["waiting"] == 1
+    bulk.join(5)
+    assert order == [LANE_BULK]
+    stats = scheduler.stats()["lanes"]
+    assert stats[LANE_BULK]["limit"] == 1
+    assert stats[LANE_INTERACTIVE]["limit"] == 2
+    assert stats[LANE_BULK]["running"] == stats[LANE_INTERACTIVE]["running"] == 0
+
+def test_async_waiters_are_ordered_by_lane():
+    async def scenario():
+        scheduler = PriorityScheduler("test", 1)
+        order = []
+
+        async def take(lane):
+            async with scheduler.aslot(lane):
+                order.append(lane)
+
+        async with scheduler.aslot(LANE_BULK):
+            tasks = [asyncio.create_task(take(LANE_BULK))]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(take(LANE_INTERACTIVE)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == [LANE_INTERACTIVE, LANE_BULK]
+
+    asyncio.run(scenario())
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = PriorityScheduler("test", 1)
+        async with scheduler.aslot(LANE_BULK):
+            waiter = asyncio.create_task(scheduler.aslot(LANE_INTERACTIVE).__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.stats()["lanes"][LANE_INTERACTIVE]["waiting"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.stats()["lanes"][LANE_INTERACTIVE]["waiting"] == 0
+        async with scheduler.aslot(LANE_BULK):
+            assert scheduler.stats()["lanes"][LANE_BULK]["running"] == 1
+
+    asyncio.run(scenario())
+
+def test_slot_refuses_to_block_the_event_loop():
+    async def scenario():
+        scheduler = PriorityScheduler("test", 1)
+        async with scheduler.aslot(LANE_BULK):
+            with pytest.raises(RuntimeError):
+                with scheduler.slot(LANE_INTERACTIVE):
+                    pass
+
+    asyncio.run(scenario())
+
+def test_run_does_not_wait_for_threads_held_by_bulk_work():
+    request_id = contextvars.ContextVar("request_id")
+
+    def where() -> tuple:
+        return threading.current_thread().name, request_id.get()
+
+    def bulk(scheduler: PriorityScheduler) -> None:
+        with scheduler.slot(LANE_BULK):
+            pass
+
+    async def scenario():
+        scheduler = PriorityScheduler("test", 1)
+        # Both default threads end up waiting in slot() for the slot the interactive call gets
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(2))
+        request_id.set("r1")
+        async with scheduler.aslot(LANE_BULK):
+            bulk_calls = [asyncio.ensure_future(asyncio.to_thread(bulk, scheduler)) for _ in range(2)]
+            interactive = asyncio.ensure_future(scheduler.run(LANE_INTERACTIVE, where))
+            while scheduler.stats()["lanes"][LANE_BULK]["waiting"] < 2 or not scheduler.stats()["lanes"][LANE_INTERACTIVE]["waiting"]:
+                await asyncio.sleep(0.001)
+        thread, seen = await asyncio.wait_for(interactive, 5)
+        await asyncio.wait_for(asyncio.gather(*bulk_calls), 5)
+        scheduler.shutdown()
+        return thread, seen
+
+    thread, seen = asyncio.run(scenario())
+    assert thread.startswith("tams-test")
+    # The caller's context goes along, like with to_thread
+    assert seen == "r1"
+
+def test_default_slots_share_the_cores_among_the_workers(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    for workers, slots in (("", 8), ("4", 2), ("16", 1)):
+        monkeypatch.setenv("TAMS_WORKERS", workers)
+        monkeypatch.delenv("TAMS_SCHED_SCORING_SLOTS", raising=False)
+        # A fresh copy of the module, which reads its configuration when imported
+        spec = importlib.util.spec_from_file_location("scheduler_copy", scheduler_module.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        assert module.SCHED_SCORING_SLOTS == slots
+        assert module.scoring_scheduler.slots == slots
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import streaming
+
+def ndjson(rows: list) -> bytes:
+    return b"".join(json.dumps(row).encode() + b"\n" for row in rows)
+
+async def post_stream(api, body: bytes) -> list:
+    async with api() as client:
+        response = await client.post(
+            "/store/stream", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_stream_is_acknowledged_per_micro_batch(postgrest, anomaly_rows, api, monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_SIZE", 10)
+    rows = anomaly_rows(25)
+    rows[12]["description"] = " "
+    body = ndjson(rows[:3]) + b"{not json\n\n" + ndjson(rows[3:])
+
+    acks = asyncio.run(post_stream(api, body))
+    summary = acks.pop()
+    assert [ack["chunk"] for ack in acks] == [0, 1, 2]
+    assert [ack["received"] for ack in acks] == [10, 10, 6]
+    # Positions count the lines of the stream, blank lines aside
+    assert acks[0]["rejected_rows"][0]["row"] == 3
+    assert acks[0]["rejected_rows"][0]["reasons"][0].startswith("Invalid JSON")
+    assert acks[1]["rejected_rows"] == [{"row": 13, "reasons": ["Missing required field: description"]}]
+    assert summary["done"]
+    assert summary["total_received"] == 26
+    assert summary["total_stored"] == 24 == len(postgrest.rows())
+    assert summary["total_rejected"] == 2
+    stored_ids = [anomaly_id for ack in acks for anomaly_id in ack["stored_ids"]]
+    assert sorted(stored_ids) == sorted(postgrest.rows())
+    assert {row["import_batch_id"] for row in postgrest.rows().values()} == {summary["import_batch_id"]}
+
+def test_failed_micro_batch_does_not_end_the_stream(postgrest, anomaly_rows, api, monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_SIZE", 10)
+    # The second micro-batch's insert times out
+    postgrest.fail = {2}
+
+    acks = asyncio.run(post_stream(api, ndjson(anomaly_rows(30))))
+    summary = acks.pop()
+    assert [ack["error"] is not None for ack in acks] == [False, True, False]
+    assert acks[1]["stored_ids"] == []
+    assert summary["failed_chunks"] == 1
+    assert summary["total_stored"] == 20 == len(postgrest.rows())
+
+class SlowConsumerRequest:
+    """Request whose body is ``lines`` NDJSON lines, counting how many were pulled"""
+
+    def __init__(self, lines: int):
+        self.lines = lines
+        self.pulled = 0
+
+    async def stream(self):
+        for _ in range(self.lines):
+            self.pulled += 1
+            yield b'{"num_equipement": "EQ1"}\n'
+
+def test_reader_stops_pulling_the_body_while_micro_batches_wait(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_SIZE", 1)
+
+    async def scenario():
+        request = SlowConsumerRequest(100)
+        queue = asyncio.Queue(maxsize=2)
+        reader = asyncio.create_task(streaming._read_chunks(request, queue))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # Two micro-batches queued and a third waiting for room
+        assert queue.full()
+        assert request.pulled == 3
+        while (await queue.get()) is not None:
+            pass
+        await reader
+        assert request.pulled == 100
+
+    asyncio.run(scenario())
+
+def test_overlong_line_ends_the_stream_with_an_error(api, postgrest, monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_MAX_LINE_BYTES", 100)
+    acks = asyncio.run(post_stream(api, b'{"description": "' + b"x" * 200))
+    assert acks[-1]["error"] == "NDJSON line exceeds 100 bytes"
+    assert acks[-1]["total_stored"] == 0
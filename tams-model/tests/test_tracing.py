@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+import tracing
+from tracing import current_trace_id, span
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """Spans exported to a file while the test runs, read back as dicts"""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORTERS", {"file"})
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(path))
+
+    def read() -> list:
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+    return read
+
+def test_nested_spans_share_the_trace_and_point_to_their_parent(exported):
+    with span("outer", rows=3) as outer:
+        with span("inner") as inner:
+            inner.set(stored=2)
+            assert current_trace_id() == outer.trace_id
+    assert current_trace_id() is None
+    inner_span, outer_span = exported()
+    assert inner_span["name"] == "inner"
+    assert inner_span["trace_id"] == outer_span["trace_id"]
+    assert inner_span["parent_id"] == outer_span["span_id"]
+    assert outer_span["parent_id"] is None
+    assert outer_span["attributes"] == {"rows": 3}
+    assert inner_span["attributes"] == {"stored": 2}
+
+def test_failed_block_is_recorded_on_its_span(exported):
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("bad row")
+    assert exported()[0]["error"] == "ValueError: bad row"
+
+def test_worker_threads_and_tasks_continue_the_trace(exported):
+    def in_thread():
+        with span("thread"):
+            pass
+
+    async def in_task():
+        with span("task"):
+            pass
+
+    async def scenario():
+        with span("root"):
+            await asyncio.to_thread(in_thread)
+            await asyncio.gather(in_task(), in_task())
+
+    asyncio.run(scenario())
+    spans = {entry["name"]: entry for entry in exported()}
+    root = spans.pop("root")
+    for child in spans.values():
+        assert child["trace_id"] == root["trace_id"]
+        assert child["parent_id"] == root["span_id"]
+
+def test_nothing_is_exported_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    with span("quiet"):
+        pass
+    assert not (tmp_path / "traces.jsonl").exists()
+
+def test_request_spans_form_one_trace_under_the_request(exported, postgrest, anomaly_rows, api):
+    async def scenario():
+        async with api() as client:
+            stored = await client.post("/store/batch", json=anomaly_rows(10), headers={"X-Trace-Id": "client-trace-0001"})
+            invalid = await client.get("/", headers={"X-Trace-Id": "not a trace id!"})
+        return stored, invalid
+
+    stored, invalid = asyncio.run(scenario())
+    assert stored.headers["x-trace-id"] == "client-trace-0001"
+    assert invalid.headers["x-trace-id"] != "not a trace id!"
+
+    spans = [entry for entry in exported() if entry["trace_id"] == "client-trace-0001"]
+    by_id = {entry["span_id"]: entry for entry in spans}
+    root = next(entry for entry in spans if entry["name"] == "http.request")
+    assert root["attributes"]["status_code"] == 200
+    assert {"validate", "predict.fallback", "db.request"} <= {entry["name"] for entry in spans}
+    for entry in spans:
+        # Every span leads up to the request span
+        while entry["parent_id"] is not None:
+            entry = by_id[entry["parent_id"]]
+        assert entry is root
@@ -0,0 +1,100 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from file_processor import FileProcessor
+
+def test_blank_required_fields_are_rejected_with_their_position():
+    df = pd.DataFrame({
+        "num_equipement": ["EQ1", "  ", "EQ3", None],
+        "systeme": ["Pompe", "Pompe", "", "Vanne"],
+        "description": ["fuite", "fuite", "fuite", "bruit"],
+    })
+    valid, rejected = FileProcessor.validate_frame(df)
+    assert valid["num_equipement"].tolist() == ["EQ1"]
+    assert rejected == [
+        {"row": 1, "reasons": ["Missing required field: num_equipement"]},
+        {"row": 2, "reasons": ["Missing required field: systeme"]},
+        {"row": 3, "reasons": ["Missing required field: num_equipement"]},
+    ]
+
+def test_every_failing_field_of_a_row_is_reported():
+    df = pd.DataFrame({"num_equipement": [""], "systeme": [None], "description": [" "]})
+    _, rejected = FileProcessor.validate_frame(df)
+    assert rejected[0]["reasons"] == [
+        "Missing required field: num_equipement",
+        "Missing required field: systeme",
+        "Missing required field: description",
+    ]
+
+def test_text_is_trimmed_and_integral_codes_lose_their_decimals():
+    df = pd.DataFrame({
+        "num_equipement": [1042.0, 7.5, np.nan],
+        "systeme": [" Pompe ", "Vanne", "Moteur"],
+        "description": ["fuite\t", "bruit", "arret"],
+    })
+    valid, rejected = FileProcessor.validate_frame(df)
+    assert valid["num_equipement"].tolist() == ["1042", "7.5"]
+    assert valid["systeme"].tolist() == ["Pompe", "Vanne"]
+    assert valid["description"].tolist() == ["fuite", "bruit"]
+    assert valid["section_proprietaire"].tolist() == ["", ""]
+    assert [entry["row"] for entry in rejected] == [2]
+
+def test_dates_are_normalized_and_unparseable_dates_left_blank():
+    df = pd.DataFrame({
+        "num_equipement": ["EQ1"] * 5,
+        "systeme": ["Pompe"] * 5,
+        "description": ["fuite"] * 5,
+        "date_detection": ["2025-03-04", "04/03/2025", "2025-03-04T10:30:00", "last tuesday", None],
+    })
+    valid, rejected = FileProcessor.validate_frame(df)
+    assert rejected == []
+    assert valid["date_detection"].tolist() == ["2025-03-04", "2025-03-04", "2025-03-04", "", ""]
+
+def test_datetime_columns_are_formatted():
+    df = pd.DataFrame({
+        "num_equipement": ["EQ1"],
+        "systeme": ["Pompe"],
+        "description": ["fuite"],
+        "date_detection": pd.to_datetime(["2025-01-15 08:00"]),
+    })
+    valid, _ = FileProcessor.validate_frame(df)
+    assert valid["date_detection"].tolist() == ["2025-01-15"]
+
+def test_single_anomaly_is_cleaned_like_a_batch_row():
+    anomaly, rejected = FileProcessor.validate_single({
+        "num_equipement": " EQ1 ", "systeme": "Pompe", "description": "fuite", "date_detection": "15/01/2025"
+    })
+    assert rejected == []
+    assert anomaly["num_equipement"] == "EQ1"
+    assert anomaly["date_detection"] == "2025-01-15"
+
+    anomaly, rejected = FileProcessor.validate_single({"num_equipement": "EQ1", "systeme": "Pompe", "description": ""})
+    assert anomaly is None
+    assert rejected == [{"row": 0, "reasons": ["Missing required field: description"]}]
+
+def test_store_single_refusal_keeps_a_string_detail(postgrest, api):
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/store/single", json={
+                "num_equipement": "EQ1", "systeme": "Pompe", "description": "   "
+            })
+        assert response.status_code == 400
+        body = response.json()
+        assert body["detail"] == "Missing required field: description"
+        assert body["rejected_rows"] == [{"row": 0, "reasons": ["Missing required field: description"]}]
+        assert postgrest.rows() == {}
+
+    asyncio.run(scenario())
+
+def test_store_single_accepts_an_unparseable_date(postgrest, api):
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/store/single", json={
+                "num_equipement": "EQ1", "systeme": "Pompe", "description": "fuite vanne", "date_detection": "n/a"
+            })
+        assert response.status_code == 200, response.text
+        assert response.json()["anomaly_id"] in postgrest.rows()
+
+    asyncio.run(scenario())
@@ -0,0 +1,127 @@
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Any, Iterator, Optional
+
+# Where finished spans go: any of "console" and "file", comma separated; empty disables export
+TRACE_EXPORTERS = {
+    name.strip() for name in os.environ.get("TAMS_TRACE_EXPORTER", "").lower().split(",") if name.strip()
+}
+TRACE_FILE = os.environ.get(
+    "TAMS_TRACE_FILE", os.path.join(os.path.dirname(__file__), "data", "traces.jsonl")
+)
+TRACE_HEADER = "x-trace-id"
+# Incoming trace IDs are accepted if they look like an ID, so they are safe to log
+_TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("tams_span", default=None)
+_file_lock = threading.Lock()
+
+class Span:
+    """One timed step of a request, with the trace it belongs to and its parent step"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def set(self, **attributes) -> None:
+        """Attach attributes such as row counts once they are known"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+@contextlib.contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """Time a block as a child of the current span, or as the root of a new trace
+
+    Works in sync and async code alike: the current span lives in a context variable,
+    so tasks started inside a span (``asyncio.gather``, ``create_task``) are its children.
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+    current = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - current._started) * 1000
+        _current_span.reset(token)
+        _export(current)
+
+def _export(finished: Span) -> None:
+    if not TRACE_EXPORTERS:
+        return
+    if "console" in TRACE_EXPORTERS:
+        attributes = " ".join(f"{key}={value}" for key, value in finished.attributes.items())
+        error = f" error={finished.error}" if finished.error else ""
+        print(f"TRACE {finished.trace_id} {finished.name} {finished.duration_ms:.1f}ms {attributes}{error}")
+    if "file" in TRACE_EXPORTERS:
+        line = json.dumps(finished.to_dict(), default=str) + "\n"
+        with _file_lock:
+            os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+            with open(TRACE_FILE, "a") as handle:
+                handle.write(line)
+
+class TracingMiddleware:
+    """Open a root span per HTTP request and return its trace ID in ``X-Trace-Id``
+
+    A valid ``X-Trace-Id`` sent by the caller is reused, so client and server spans
+    can be joined.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1").lower() == TRACE_HEADER:
+                incoming = value.decode("latin-1")
+                break
+        if incoming is not None and not _TRACE_ID_PATTERN.match(incoming):
+            incoming = None
+
+        with span("http.request", trace_id=incoming, method=scope["method"], path=scope["path"]) as root:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    root.set(status_code=message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((TRACE_HEADER.encode(), root.trace_id.encode()))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
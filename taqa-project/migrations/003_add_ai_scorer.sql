@@ -0,0 +1,9 @@
+-- Record which scorer produced the AI scores of each anomaly.
+-- 'model' is the trained model; 'rules' is the rule-based fallback, used when the model is
+-- unavailable, errors, misses the scoring deadline or is tripped by the circuit breaker.
+-- Rows scored by 'rules' can be found and rescored later.
+ALTER TABLE anomalies ADD COLUMN IF NOT EXISTS ai_scorer text
+    CHECK (ai_scorer IN ('model', 'rules'));
+
+-- rescore.py --rules-only pages through the rule-scored rows in ID order
+CREATE INDEX IF NOT EXISTS idx_anomalies_ai_scorer_rules ON anomalies (id) WHERE ai_scorer = 'rules';